@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'timetracker.settings')
+# Serve the async views (tracker.async_urls) when running under ASGI.
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import copy
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,10 +44,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'tracker.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tracker.middleware.MetricsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +58,8 @@ ROOT_URLCONF = 'timetracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The stock Django backend, with render times added to the request metrics.
+        'BACKEND': 'tracker.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,6 +75,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'timetracker.wsgi.application'
 
+ASGI_APPLICATION = 'timetracker.asgi.application'
+
+# Route the hot views to their async versions (tracker.async_urls). timetracker/asgi.py
+# turns this on; WSGI servers keep the plain sync views.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -77,13 +88,95 @@ WSGI_APPLICATION = 'timetracker.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'gemini',
-        'USER': 'gemini',
-        'PASSWORD': 'gemini',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': os.environ.get('DB_NAME', 'gemini'),
+        'USER': os.environ.get('DB_USER', 'gemini'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'gemini'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        # Seconds a connection is reused across requests (0: one per request).
+        # Async views do not reuse connections, so ASGI defaults to 0.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '0' if ASYNC_VIEWS else '60')),
+        # Check a reused connection before its first query, so a dropped one
+        # is replaced instead of failing the request.
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+        },
+    }
+}
+
+# A connection pool per process instead of persistent connections. Needs
+# psycopg 3 with the pool extra (pip install "psycopg[binary,pool]").
+if os.environ.get('DB_POOL', 'False') == 'True':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+        # Seconds a request waits for a free connection before failing.
+        'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
     }
+
+# A read replica for the reporting views (tracker.routers.reads_from_replica).
+# Without DB_REPLICA_HOST every query goes to the primary. Tests run the
+# replica alias as a mirror of the test database.
+DATABASES['replica'] = {
+    **copy.deepcopy(DATABASES['default']),
+    'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+    'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+    'TEST': {'MIRROR': 'default'},
 }
+REPLICA_DATABASE = 'replica' if os.environ.get('DB_REPLICA_HOST') else None
+# Seconds a client reads from the primary after a request of theirs wrote,
+# to cover the replication lag.
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', '10'))
+DATABASE_ROUTERS = ['tracker.routers.ReplicaRouter']
+
+
+# Cache
+# A per-process cache that evicts the least recently used keys beyond
+# MAX_ENTRIES. Set REDIS_URL (e.g. redis://localhost:6379/0, needs the redis
+# package) to share one cache between all workers instead.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'timetracker',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+
+# Read sessions and the logged-in user (with its roles) from the cache instead
+# of the database on every request (tracker/sessions.py, tracker/auth.py). A
+# per-process cache would keep serving a logged-out session or a changed user
+# in the other workers, so this is on by default only with REDIS_URL.
+AUTH_CACHE = os.environ.get('AUTH_CACHE', 'True' if os.environ.get('REDIS_URL') else 'False') == 'True'
+if AUTH_CACHE:
+    SESSION_ENGINE = 'tracker.sessions'
+AUTHENTICATION_BACKENDS = ['tracker.auth.CachedModelBackend']
+
+# Seconds an unchanged session is only refreshed in the cache before its
+# database row is rewritten (with SESSION_SAVE_EVERY_REQUEST).
+SESSION_DB_WRITE_INTERVAL = 300
+
+# Seconds a user's cached dashboard totals and history pages are kept. A write
+# replaces them at once in the cache of the process that made it, so with a
+# shared cache (REDIS_URL) they are never stale. A per-process cache never sees
+# the writes of the other workers, which serve their copies until these expire:
+# so without REDIS_URL they are kept only briefly.
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', 60 * 60 if os.environ.get('REDIS_URL') else 10))
+
+# Seconds a version of the role graph (tracker/permissions.py) is kept. Each
+# process reloads its graph when the version changes; with a per-process
+# cache the other workers only see that once it expires.
+ROLE_GRAPH_TIMEOUT = int(os.environ.get('ROLE_GRAPH_TIMEOUT', 60 * 60 if os.environ.get('REDIS_URL') else 10))
 
 
 # Password validation
@@ -130,3 +223,87 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'tracker.CustomUser'
 
 LOGIN_URL = 'login'
+
+# Kiosk QR scanners
+# Scanners authenticate with one of these keys in the X-Kiosk-Key header.
+KIOSK_API_KEYS = [key for key in os.environ.get('KIOSK_API_KEYS', '').split(',') if key]
+
+KIOSK_QR_CACHE_SIZE = 10000
+
+# Seconds a scan's Idempotency-Key is remembered. The keys are kept in the
+# cache: with several workers, use a shared one (REDIS_URL) so a retry that
+# reaches another worker is still recognised.
+KIOSK_IDEMPOTENCY_TTL = 60 * 60 * 24
+
+# Buffered scans uploaded to /kiosk/sync/ are written in transactions of this many events.
+KIOSK_SYNC_CHUNK_SIZE = 1000
+
+# Most entries a manager can change in one /time_entry/bulk_edit/ request.
+BULK_EDIT_MAX_CHANGES = 1000
+
+# Live attendance stream (/team/live/)
+# Backend that fans check-in/check-out events out to open streams. The local
+# broker is in-process only; multi-process deployments need a shared backend.
+ATTENDANCE_BROKER = 'tracker.pubsub.LocalBroker'
+
+# Seconds between keep-alive comments on an idle stream.
+ATTENDANCE_STREAM_KEEPALIVE = 15
+
+# Streams end after this many seconds and the browser reconnects, which
+# releases the worker and resyncs the snapshot.
+ATTENDANCE_STREAM_MAX_AGE = 300
+
+# Request metrics (/metrics/)
+# Staff users can always read the metrics; scrapers send "Authorization: Bearer <token>".
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Allow staff to profile single requests with the X-Profile header.
+METRICS_PROFILING = os.environ.get('METRICS_PROFILING', 'False') == 'True'
+
+# Queries slower than this are logged to tracker.db.slow with their view.
+SLOW_QUERY_MS = 200
+
+# Report jobs (manage.py run_workers)
+# Finished report files are stored under MEDIA_ROOT/reports/.
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Jobs a worker runs at once, each in its own process.
+REPORT_WORKER_PROCESSES = 2
+
+# Seconds a job may run before it is killed and retried.
+REPORT_JOB_TIMEOUT = 60 * 30
+
+REPORT_JOB_MAX_ATTEMPTS = 3
+
+# Seconds before the first retry; doubled for every further attempt.
+REPORT_JOB_RETRY_DELAY = 30
+
+# Finished jobs and their files are deleted after this many days.
+REPORT_RETENTION_DAYS = 7
+
+# Payroll report (manage.py payroll_report, or a payroll report job)
+# Worker processes that compute the user shards in parallel.
+PAYROLL_PROCESSES = os.cpu_count() or 1
+
+# Hours a day beyond which time counts as overtime.
+PAYROLL_OVERTIME_DAILY_HOURS = 8
+
+# Attendance analytics (team/analytics/, manage.py attendance_stats)
+# Local time after which a day's first check-in counts as a late arrival.
+ANALYTICS_LATE_AFTER = '09:00'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'tracker': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
@@ -1,16 +1,75 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Role, Right, ManagedRole, CustomUser, CheckInCheckOut, QRCode
+from .models import Role, Right, ManagedRole, CustomUser, CheckInCheckOut, QRCode, TimeEntryLog
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables with millions of rows: an estimated total
+    instead of COUNT(*) on every page, and no second count of the unfiltered
+    table. Related users are picked by autocomplete or id, never listed in a
+    <select>.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
     list_display = ['username', 'email', 'is_staff']
-    fieldsets = UserAdmin.fieldsets + (('Roles', {'fields': ('roles',)}),)
-    add_fieldsets = UserAdmin.add_fieldsets + (('Roles', {'fields': ('roles',)}),)
+    fieldsets = UserAdmin.fieldsets + (('Roles', {'fields': ('roles',)}), ('Time zone', {'fields': ('time_zone',)}))
+    add_fieldsets = UserAdmin.add_fieldsets + (('Roles', {'fields': ('roles',)}), ('Time zone', {'fields': ('time_zone',)}))
+    filter_horizontal = UserAdmin.filter_horizontal + ('roles',)
+    # Also serves the user autocompletes: a username prefix, not UserAdmin's
+    # substring search over four columns. Case-sensitive, so PostgreSQL can
+    # use the username's _like index.
+    search_fields = ['username__startswith']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 admin.site.register(Role)
 admin.site.register(Right)
 admin.site.register(ManagedRole)
-admin.site.register(CheckInCheckOut)
-admin.site.register(QRCode)
\ No newline at end of file
+
+
+@admin.register(CheckInCheckOut)
+class CheckInCheckOutAdmin(LargeTableAdmin):
+    list_display = ['user', 'check_in_time', 'check_out_time', 'duration']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+    # Both filters are served by indexes (checkin_time_idx, checkin_one_open_entry).
+    list_filter = [('check_in_time', admin.DateFieldListFilter), ('check_out_time', admin.EmptyFieldListFilter)]
+    # An exact username is an index lookup; a substring search would scan every row.
+    search_fields = ['user__username__exact']
+    ordering = ['-check_in_time']
+    sortable_by = ['check_in_time']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(QRCode)
+class QRCodeAdmin(LargeTableAdmin):
+    list_display = ['user', 'qr_code', 'created_at']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+    search_fields = ['user__username__exact', 'qr_code__exact']
+
+
+@admin.register(TimeEntryLog)
+class TimeEntryLogAdmin(LargeTableAdmin):
+    list_display = ['entry', 'edited_by', 'edited_at', 'old_check_in', 'new_check_in', 'old_check_out', 'new_check_out']
+    list_select_related = ['entry__user', 'edited_by']
+    raw_id_fields = ['entry', 'edited_by']
+    list_filter = [('edited_at', admin.DateFieldListFilter)]
+    search_fields = ['entry__user__username__exact']
+    ordering = ['-edited_at']
+    sortable_by = ['edited_at']
+
+    # The log is the audit trail of edits; it is written by the app only.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,171 @@
+"""
+Attendance statistics (shift lengths, arrival times, overtime and late
+days, weekday heatmaps) computed with NumPy.
+
+Closed entries are loaded as columns: owner, check-in and check-out as
+epoch seconds computed by the database. Every statistic is then a group-by
+over those arrays (bincount, lexsort and reduceat), with no Python loop per
+entry. Days are the owner's local days of the check-in, as for DailyHours.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import FloatField, Func
+
+from .models import CheckInCheckOut, resolve_timezone
+from .rollups import day_range
+
+PERCENTILES = (10, 25, 50, 75, 90)
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+DAY = 86400
+
+
+class Epoch(Func):
+    """Seconds since 1970-01-01 UTC of a datetime column, as a float."""
+    output_field = FloatField()
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)::double precision'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # julianday() is only exact to about 0.1 ms at present-day dates.
+        template = 'ROUND((julianday(%(expressions)s) - 2440587.5) * 86400.0, 3)'
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+@dataclass
+class Intervals:
+    """Closed entries as parallel arrays, one element per entry."""
+    user_index: np.ndarray  # position of the owner in ``users``
+    local_check_in: np.ndarray  # local wall-clock time of the check-in, as epoch seconds
+    hours: np.ndarray
+    users: list  # (id, username), ordered by id
+
+
+def utc_offsets(timestamps, tz):
+    """
+    The UTC offset of ``tz`` in seconds at each timestamp. The zone is asked
+    once per distinct hour, which is exact as offsets change on the hour.
+    """
+    hours, inverse = np.unique(np.floor(timestamps / 3600).astype(np.int64), return_inverse=True)
+    offsets = np.array(
+        [datetime.fromtimestamp(hour * 3600, tz).utcoffset().total_seconds() for hour in hours.tolist()], dtype=np.float64,
+    )
+    return offsets[inverse.reshape(-1)]
+
+
+def load_intervals(queryset, start, end):
+    """The closed entries of the users in ``queryset`` whose check-in falls on a local day in [start, end]."""
+    users = list(queryset.order_by('pk').values_list('pk', 'username', 'time_zone'))
+    user_ids = np.array([user_id for user_id, _, _ in users], dtype=np.int64)
+
+    # Local days can be a day off the UTC ones; read a day more on each side.
+    lower, upper = day_range(start - timedelta(days=1), end + timedelta(days=1), timezone.utc)
+    rows = CheckInCheckOut.objects.filter(
+        user__in=queryset.values('pk'), check_out_time__isnull=False, check_in_time__gte=lower, check_in_time__lt=upper,
+    ).values_list('user_id', Epoch('check_in_time'), Epoch('check_out_time'))
+    columns = np.fromiter(
+        rows.iterator(chunk_size=10000), dtype=[('user_id', np.int64), ('check_in', np.float64), ('check_out', np.float64)],
+    )
+
+    user_index = np.searchsorted(user_ids, columns['user_id'])
+    local_check_in = columns['check_in'].copy()
+    zone_names, zone_of_user = np.unique(np.array([time_zone for _, _, time_zone in users], dtype=str), return_inverse=True)
+    entry_zones = zone_of_user.reshape(-1)[user_index]
+    for number, name in enumerate(zone_names.tolist()):
+        selected = entry_zones == number
+        local_check_in[selected] += utc_offsets(columns['check_in'][selected], resolve_timezone(name))
+
+    local_day = np.floor(local_check_in / DAY)
+    in_range = (local_day >= start.toordinal() - EPOCH_ORDINAL) & (local_day <= end.toordinal() - EPOCH_ORDINAL)
+    return Intervals(
+        user_index=user_index[in_range],
+        local_check_in=local_check_in[in_range],
+        hours=((columns['check_out'] - columns['check_in']) / 3600)[in_range],
+        users=[(user_id, username) for user_id, username, _ in users],
+    )
+
+
+def _rate(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.full(len(numerator), np.nan), where=denominator > 0)
+
+
+def _or_none(value, digits=2):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def compute_statistics(intervals, late_after=None, overtime_after=None):
+    """Per-user and overall statistics of the intervals, as JSON-ready data."""
+    late_after = time.fromisoformat(late_after or settings.ANALYTICS_LATE_AFTER)
+    late_after = late_after.hour * 3600 + late_after.minute * 60 + late_after.second
+    overtime_after = settings.PAYROLL_OVERTIME_DAILY_HOURS if overtime_after is None else overtime_after
+    user_count = len(intervals.users)
+    local_day = np.floor(intervals.local_check_in / DAY).astype(np.int64)
+    seconds_of_day = intervals.local_check_in - local_day * DAY
+
+    shifts = np.bincount(intervals.user_index, minlength=user_count)
+    shift_hours = np.bincount(intervals.user_index, weights=intervals.hours, minlength=user_count)
+
+    # Worked days: group entries by (user, local day), ordered by arrival within the day.
+    order = np.lexsort((seconds_of_day, local_day, intervals.user_index))
+    day_user, day_number = intervals.user_index[order], local_day[order]
+    starts = np.flatnonzero(np.r_[True, (day_user[1:] != day_user[:-1]) | (day_number[1:] != day_number[:-1])])[:len(order)]
+    days_user = day_user[starts]
+    arrivals = seconds_of_day[order][starts]
+    day_hours = np.add.reduceat(intervals.hours[order], starts) if len(starts) else np.array([])
+
+    days_worked = np.bincount(days_user, minlength=user_count)
+    overtime_days = np.bincount(days_user[day_hours > overtime_after], minlength=user_count)
+    late_days = np.bincount(days_user[arrivals > late_after], minlength=user_count)
+
+    # The days are grouped by user; order each user's days by arrival for the median.
+    by_arrival = np.lexsort((arrivals, days_user))
+    sorted_arrivals = arrivals[by_arrival] / 3600
+    first_day = np.cumsum(days_worked) - days_worked
+    has_days = days_worked > 0
+    median_arrival = np.full(user_count, np.nan)
+    low = first_day[has_days] + (days_worked[has_days] - 1) // 2
+    high = first_day[has_days] + days_worked[has_days] // 2
+    median_arrival[has_days] = (sorted_arrivals[low] + sorted_arrivals[high]) / 2
+
+    average_shift = _rate(shift_hours, shifts)
+    late_rate = _rate(late_days, days_worked)
+    weekday = (local_day + 3) % 7  # 1970-01-01 was a Thursday
+    hour = np.minimum((seconds_of_day // 3600).astype(np.int64), 23)
+    heatmap = np.bincount(weekday * 24 + hour, minlength=7 * 24).reshape(7, 24)
+
+    return {
+        'entries': int(len(intervals.hours)),
+        'days_worked': int(days_worked.sum()),
+        'average_shift_hours': _or_none(intervals.hours.mean() if len(intervals.hours) else np.nan),
+        'arrival_percentiles': {
+            str(p): _or_none(value) for p, value in zip(
+                PERCENTILES, np.percentile(arrivals / 3600, PERCENTILES) if len(arrivals) else [np.nan] * len(PERCENTILES),
+            )
+        },
+        'overtime_days': int(overtime_days.sum()),
+        'late_rate': _or_none(late_days.sum() / days_worked.sum() if days_worked.sum() else np.nan, 3),
+        'heatmap': {name: row.tolist() for name, row in zip(WEEKDAYS, heatmap)},
+        'users': [
+            {
+                'user_id': user_id,
+                'username': username,
+                'shifts': int(shifts[i]),
+                'average_shift_hours': _or_none(average_shift[i]),
+                'median_arrival': _or_none(median_arrival[i]),
+                'days_worked': int(days_worked[i]),
+                'overtime_days': int(overtime_days[i]),
+                'late_rate': _or_none(late_rate[i], 3),
+            }
+            for i, (user_id, username) in enumerate(intervals.users)
+        ],
+    }
+
+
+def attendance_statistics(users, start, end, **options):
+    """Statistics of the users' closed entries on local days in the inclusive range [start, end]."""
+    return compute_statistics(load_intervals(users, start, end), **options)
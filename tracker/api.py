@@ -0,0 +1,133 @@
+"""
+Versioned JSON read API (/api/v1/) for mobile clients and integrations.
+
+Every response carries a strong ETag computed by one aggregate over the
+entries it covers (count, last id and latest updated_at), so a conditional
+GET of unchanged data is answered with 304 Not Modified before the payload
+is built. There is no Last-Modified: deleting an entry leaves the latest
+updated_at as it was.
+"""
+import hashlib
+import json
+from datetime import timedelta, timezone
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .models import CheckInCheckOut, CustomUser, DailyHours
+from .rollups import day_range, with_period_hours
+from .routers import reads_from_replica
+from .views import _export_range
+
+API_VERSION = 'v1'
+
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required.'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def conditional(stamp):
+    """
+    Serve conditional GETs of a view from ``stamp(request)``, which returns
+    the parts that identify the response.
+    """
+    def etag(request, *args, **kwargs):
+        parts = stamp(request, *args, **kwargs)
+        return hashlib.sha256(json.dumps([API_VERSION, *parts], default=str).encode()).hexdigest()
+
+    return condition(etag_func=etag)
+
+
+def api_view(stamp, managers_only=False):
+    """Login, replica reads, private revalidated caching and conditional GETs for a read endpoint."""
+    def decorator(view):
+        view = cache_control(private=True, no_cache=True)(conditional(stamp)(view))
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if managers_only and not request.user.is_manager:
+                return JsonResponse({'error': 'Only managers can read this.'}, status=403)
+            return view(request, *args, **kwargs)
+        return api_login_required(require_GET(reads_from_replica(wrapper)))
+    return decorator
+
+
+def _entries_stamp(entries):
+    stamp = entries.aggregate(count=Count('pk'), last=Max('pk'), modified=Max('updated_at'))
+    return [stamp['count'], stamp['last'], stamp['modified']]
+
+
+def _range(request):
+    return _export_range(request.GET, request.user.tzinfo)
+
+
+def _user_entries(request):
+    """The user's entries that check in on a local day of the requested range."""
+    start, end = _range(request)
+    lower, upper = day_range(start, end, request.user.tzinfo)
+    return CheckInCheckOut.objects.filter(user=request.user, check_in_time__gte=lower, check_in_time__lt=upper)
+
+
+def _user_stamp(request):
+    return [request.user.pk, request.user.time_zone, *_range(request), *_entries_stamp(_user_entries(request))]
+
+
+def _hours(duration):
+    return round(duration.total_seconds() / 3600, 2)
+
+
+@api_view(_user_stamp)
+def entries(request):
+    start, end = _range(request)
+    rows = _user_entries(request).order_by('check_in_time').values_list('id', 'check_in_time', 'check_out_time')
+    return JsonResponse({
+        'from': start,
+        'to': end,
+        'entries': [
+            {
+                'id': entry_id,
+                'check_in': check_in,
+                'check_out': check_out,
+                'hours': _hours(check_out - check_in) if check_out else None,
+            }
+            for entry_id, check_in, check_out in rows
+        ],
+    })
+
+
+@api_view(_user_stamp)
+def totals(request):
+    start, end = _range(request)
+    days = DailyHours.objects.filter(user=request.user, day__gte=start, day__lte=end).order_by('day')
+    days = [{'day': day, 'hours': _hours(duration)} for day, duration in days.values_list('day', 'duration')]
+    return JsonResponse({'from': start, 'to': end, 'hours': round(sum(day['hours'] for day in days), 2), 'days': days})
+
+
+def _team_stamp(request):
+    start, end = _range(request)
+    members = sorted(CustomUser.objects.filter(pk__in=request.user.managed_user_ids).values_list('pk', 'username', 'time_zone'))
+    # Members bucket their hours by their own time zones; cover a day more on each side.
+    lower, upper = day_range(start - timedelta(days=1), end + timedelta(days=1), timezone.utc)
+    parts = _entries_stamp(CheckInCheckOut.objects.filter(
+        user_id__in=[pk for pk, _, _ in members], check_in_time__gte=lower, check_in_time__lt=upper,
+    ))
+    return [request.user.pk, start, end, members, *parts]
+
+
+@api_view(_team_stamp, managers_only=True)
+def team_totals(request):
+    start, end = _range(request)
+    team = with_period_hours(request.user.managed_users, start, end).order_by('username')
+    return JsonResponse({
+        'from': start,
+        'to': end,
+        'users': [{'id': user.pk, 'username': user.username, 'hours': _hours(user.total)} for user in team],
+    })
@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import async_views, urls
+
+# Same routes and names as tracker.urls, with the async twins swapped in.
+ASYNC_VIEWS = {
+    'index': async_views.index,
+    'summary': async_views.summary,
+    'kiosk_scan': async_views.kiosk_scan,
+    'attendance_stream': async_views.attendance_stream,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS.get(pattern.name, pattern.callback), name=pattern.name)
+    for pattern in urls.urlpatterns
+]
@@ -0,0 +1,76 @@
+"""
+Async twins of the hot read and scan views, served by tracker.async_urls when
+the app runs under ASGI (see README, "ASGI deployment").
+
+The user comes from request.auser(), which reads the session and the user row
+with the async session and ORM APIs, and is then pinned on request.user so that
+templates and context processors never trigger the lazy, sync-only loader.
+"""
+from functools import wraps
+
+from django.contrib.auth.views import redirect_to_login
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import attendance, kiosk, usercache
+from .models import CheckInCheckOut
+from .permissions import arole_graph
+from .rollups import adashboard_hours
+from .views import _kiosk_scan_response, _request_data
+
+
+async def _load_user(request):
+    user = await request.auser()
+    request.user = user
+    if user.is_authenticated:
+        # Prime the role graph so {{ user.is_manager }} stays in memory.
+        user._role_graph_cache = await arole_graph()
+    return user
+
+
+def alogin_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await _load_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def index(request):
+    context = {}
+    user = await _load_user(request)
+    if user.is_authenticated:
+        context.update(await adashboard_hours(user))
+    return render(request, 'tracker/index.html', context)
+
+
+@alogin_required
+async def summary(request):
+    open_entry = await usercache.aget_or_compute(
+        request.user.pk, 'checked-in', CheckInCheckOut.objects.filter(user=request.user, check_out_time__isnull=True).aexists,
+    )
+    return JsonResponse({'username': request.user.username, 'checked_in': open_entry, **await adashboard_hours(request.user)})
+
+
+@alogin_required
+async def attendance_stream(request):
+    # Waiting for deltas costs no thread here, unlike the WSGI stream.
+    if not request.user.is_manager:
+        return JsonResponse({'error': 'Only managers can watch attendance.'}, status=403)
+    return attendance.event_stream_response(attendance.astream(request.user.pk))
+
+
+@csrf_exempt
+@require_POST
+async def kiosk_scan(request):
+    if not kiosk.is_authenticated(request):
+        return JsonResponse({'error': 'Invalid kiosk key.'}, status=403)
+
+    try:
+        return _kiosk_scan_response(await kiosk.ascan(request, _request_data(request)))
+    except kiosk.ScanError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
@@ -0,0 +1,121 @@
+"""
+Live "who is on site" feed for managers.
+
+Writes publish check-in/check-out deltas to the in-process broker once their
+transaction commits. A stream sends one snapshot of the open entries of the
+manager's team, then only the deltas for that team, so watching managers cost
+no database queries until the role graph changes or a stream falls behind.
+"""
+import json
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+
+from .models import CheckInCheckOut, CustomUser
+from .permissions import arole_graph, role_graph
+from .pubsub import broker
+
+CHECK_IN = 'check_in'
+CHECK_OUT = 'check_out'
+
+
+def publish(kind, entry_id, user_id, when):
+    event = {'type': kind, 'entry_id': entry_id, 'user_id': user_id, 'time': when.isoformat() if when else None}
+    transaction.on_commit(lambda: broker.publish(event))
+
+
+def _team_queries(managed):
+    users = CustomUser.objects.filter(pk__in=managed).values_list('id', 'username')
+    # Answered from the partial index on open entries.
+    present = CheckInCheckOut.objects.filter(user_id__in=managed, check_out_time__isnull=True).values_list(
+        'id', 'user_id', 'check_in_time'
+    )
+    return users, present
+
+
+def _snapshot(users, present):
+    return {
+        'type': 'snapshot',
+        'users': {user_id: username for user_id, username in users},
+        'present': [
+            {'entry_id': entry_id, 'user_id': user_id, 'time': check_in_time.isoformat()}
+            for entry_id, user_id, check_in_time in present
+        ],
+    }
+
+
+def snapshot(managed):
+    return _snapshot(*_team_queries(managed))
+
+
+async def asnapshot(managed):
+    users, present = _team_queries(managed)
+    return _snapshot([row async for row in users], [row async for row in present])
+
+
+def frame(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+def _release_connection():
+    # A stream can stay open for minutes; don't pin a database connection to it.
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+def _deltas(events, managed):
+    return ''.join(frame(event) for event in events if event['user_id'] in managed)
+
+
+def stream(manager_id):
+    keepalive = settings.ATTENDANCE_STREAM_KEEPALIVE
+    deadline = time.monotonic() + settings.ATTENDANCE_STREAM_MAX_AGE
+    # Subscribe before reading the snapshot so no commit falls in between;
+    # deltas that the snapshot already contains are idempotent for the client.
+    with broker.subscribe() as subscription:
+        managed = role_graph().managed_user_ids(manager_id)
+        yield f'retry: {keepalive * 1000}\n\n' + frame(snapshot(managed))
+        _release_connection()
+
+        while time.monotonic() < deadline:
+            if not subscription.wait(keepalive):
+                yield ': keepalive\n\n'
+                continue
+            events, overflowed = subscription.drain()
+            current = role_graph().managed_user_ids(manager_id)
+            if overflowed or current != managed:
+                managed = current
+                yield frame(snapshot(managed))
+                _release_connection()
+            elif chunk := _deltas(events, managed):
+                yield chunk
+
+
+async def astream(manager_id):
+    keepalive = settings.ATTENDANCE_STREAM_KEEPALIVE
+    deadline = time.monotonic() + settings.ATTENDANCE_STREAM_MAX_AGE
+    with broker.subscribe() as subscription:
+        managed = (await arole_graph()).managed_user_ids(manager_id)
+        yield f'retry: {keepalive * 1000}\n\n' + frame(await asnapshot(managed))
+
+        while time.monotonic() < deadline:
+            if not await subscription.await_events(keepalive):
+                yield ': keepalive\n\n'
+                continue
+            events, overflowed = subscription.drain()
+            current = (await arole_graph()).managed_user_ids(manager_id)
+            if overflowed or current != managed:
+                managed = current
+                yield frame(await asnapshot(managed))
+            elif chunk := _deltas(events, managed):
+                yield chunk
+
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,31 @@
+"""
+Authentication backend that keeps the logged-in user in the cache.
+
+With AUTH_CACHE on, get_user() returns the user (with its roles prefetched)
+from the per-user cache of tracker.usercache instead of querying it on every
+request. The signals invalidate it when the user or its roles change and on
+logout, so a password change or deactivation takes effect immediately.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+
+from . import usercache
+from .models import CustomUser
+
+
+def _users(user_id):
+    return CustomUser._default_manager.prefetch_related('roles').filter(pk=user_id)
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not settings.AUTH_CACHE:
+            return super().get_user(user_id)
+        user = usercache.get_or_compute(user_id, 'auth-user', _users(user_id).first)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        if not settings.AUTH_CACHE:
+            return await super().aget_user(user_id)
+        user = await usercache.aget_or_compute(user_id, 'auth-user', _users(user_id).afirst)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,128 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import attendance, usercache
+from .models import CheckInCheckOut, TimeEntryLog
+from .rollups import entry_day, refresh_many_daily_hours
+
+FIELDS = ('check_in_time', 'check_out_time')
+
+
+class BulkEditError(ValueError):
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid change(s)')
+        self.errors = errors
+
+
+def _parse_time(value, tz):
+    if value is None:
+        return None
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        raise ValueError('not an ISO 8601 timestamp')
+    # Without an offset, the time is read in the entry owner's time zone.
+    return timezone.make_aware(parsed, tz) if timezone.is_naive(parsed) else parsed
+
+
+def _requested_changes(changes, max_changes):
+    if not isinstance(changes, list) or not changes:
+        raise BulkEditError([{'error': 'changes must be a non-empty list'}])
+    if len(changes) > max_changes:
+        raise BulkEditError([{'error': f'at most {max_changes} changes per request'}])
+
+    requested, errors = {}, []
+    for index, change in enumerate(changes):
+        try:
+            entry_id = int(change['entry_id'])
+        except (KeyError, TypeError, ValueError):
+            errors.append({'index': index, 'error': 'entry_id is required'})
+            continue
+        fields = {name: change[name] for name in FIELDS if name in change}
+        if entry_id in requested:
+            errors.append({'index': index, 'entry_id': entry_id, 'error': 'entry is listed more than once'})
+        elif not fields:
+            errors.append({'index': index, 'entry_id': entry_id, 'error': 'nothing to change'})
+        else:
+            requested[entry_id] = (index, fields)
+    if errors:
+        raise BulkEditError(errors)
+    return requested
+
+
+def bulk_edit_entries(editor, changes, max_changes=1000):
+    """
+    Apply [{'entry_id', 'check_in_time'?, 'check_out_time'?}, ...] as ``editor``.
+
+    All changes are applied in one transaction, or none when any of them is
+    invalid or touches an entry outside the editor's team.
+    """
+    requested = _requested_changes(changes, max_changes)
+
+    with transaction.atomic():
+        # One query loads the entries and checks they belong to the editor's team.
+        entries = {
+            entry.pk: entry
+            for entry in CheckInCheckOut.objects.select_for_update(of=('self',)).select_related('user').filter(
+                pk__in=requested, user__in=editor.managed_users,
+            )
+        }
+
+        errors, changed, logs = [], [], []
+        days, timezones = defaultdict(set), {}
+        for entry_id, (index, fields) in requested.items():
+            entry = entries.get(entry_id)
+            if entry is None:
+                errors.append({'index': index, 'entry_id': entry_id, 'error': 'unknown entry or not in your team'})
+                continue
+            tz = entry.user.tzinfo
+            old_check_in, old_check_out = entry.check_in_time, entry.check_out_time
+            try:
+                check_in = _parse_time(fields['check_in_time'], tz) if 'check_in_time' in fields else old_check_in
+                check_out = _parse_time(fields['check_out_time'], tz) if 'check_out_time' in fields else old_check_out
+                if check_in is None:
+                    raise ValueError('check_in_time cannot be empty')
+                if check_out is not None and check_out < check_in:
+                    raise ValueError('check_out_time is before check_in_time')
+            except ValueError as error:
+                errors.append({'index': index, 'entry_id': entry_id, 'error': str(error)})
+                continue
+            if (check_in, check_out) == (old_check_in, old_check_out):
+                continue
+
+            entry.check_in_time, entry.check_out_time = check_in, check_out
+            entry.updated_at = timezone.now()
+            changed.append((entry, old_check_out))
+            logs.append(TimeEntryLog(
+                entry=entry, edited_by=editor,
+                old_check_in=old_check_in, new_check_in=check_in,
+                old_check_out=old_check_out, new_check_out=check_out,
+            ))
+            days[entry.user_id] |= {entry_day(old_check_in, tz), entry_day(check_in, tz)}
+            timezones[entry.user_id] = tz
+        if errors:
+            raise BulkEditError(errors)
+
+        # Close entries before reopening others: a user can have only one open entry.
+        closing = [entry for entry, _ in changed if entry.check_out_time is not None]
+        reopening = [entry for entry, _ in changed if entry.check_out_time is None]
+        try:
+            with transaction.atomic():
+                CheckInCheckOut.objects.bulk_update(closing, [*FIELDS, 'updated_at'], batch_size=500)
+                CheckInCheckOut.objects.bulk_update(reopening, [*FIELDS, 'updated_at'], batch_size=500)
+        except IntegrityError:
+            raise BulkEditError([{'error': 'a user would have more than one open entry'}])
+        TimeEntryLog.objects.bulk_create(logs, batch_size=500)
+        refresh_many_daily_hours(days, timezones)
+        usercache.invalidate(timezones)
+
+        # bulk_update sends no post_save; publish the presence changes here.
+        for entry, old_check_out in changed:
+            if entry.check_out_time is None:
+                attendance.publish(attendance.CHECK_IN, entry.pk, entry.user_id, entry.check_in_time)
+            elif old_check_out is None:
+                attendance.publish(attendance.CHECK_OUT, entry.pk, entry.user_id, entry.check_out_time)
+
+    return {'updated': len(changed), 'unchanged': len(requested) - len(changed)}
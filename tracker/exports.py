@@ -0,0 +1,83 @@
+import csv
+import zlib
+from datetime import timedelta, timezone
+
+from django.db.models import Count, Max, Q
+
+from .models import CheckInCheckOut, CustomUser, TimeEntryLog
+from .rollups import WORKED, day_range, with_period_hours
+
+SUMMARY_HEADER = ['Username', 'Total Hours']
+DETAIL_HEADER = ['Username', 'Check-in Time', 'Check-out Time', 'Hours']
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _hours(duration):
+    return f"{duration.total_seconds() / 3600:.2f}" if duration is not None else ''
+
+
+def summary_rows(start, end, chunk_size=2000):
+    """Yield (username, hours) for every user over the inclusive date range."""
+    totals = with_period_hours(CustomUser.objects.all(), start, end).order_by('username').values_list('username', 'total')
+
+    for username, total in totals.iterator(chunk_size=chunk_size):
+        yield [username, _hours(total)]
+
+
+def detail_rows(start, end, tz, chunk_size=2000):
+    """Yield one row per check-in that started within the inclusive date range."""
+    lower, upper = day_range(start, end, tz)
+    entries = CheckInCheckOut.objects.filter(
+        check_in_time__gte=lower, check_in_time__lt=upper,
+    ).annotate(worked=WORKED).order_by('user__username', 'check_in_time', 'id').values_list(
+        'user__username', 'check_in_time', 'check_out_time', 'worked',
+    )
+
+    for username, check_in, check_out, worked in entries.iterator(chunk_size=chunk_size):
+        yield [username, check_in.isoformat(), check_out.isoformat() if check_out else '', _hours(worked)]
+
+
+def timesheet(start, end, tz, detail=False):
+    """The CSV lines and file name of the summary (or detail) export of a date range."""
+    if detail:
+        return csv_lines(DETAIL_HEADER, detail_rows(start, end, tz)), f"timesheet_detail_{start}_{end}.csv"
+    return csv_lines(SUMMARY_HEADER, summary_rows(start, end)), f"timesheet_{start}_{end}.csv"
+
+
+def data_version(start, end):
+    """
+    A stamp of the data the exports of a date range read. It changes when
+    entries around the range are added, removed or changed (every write sets
+    updated_at, logged or not), when the app logs an edit, and when users are
+    added, removed or changed (a rename changes the rows, a new time zone the
+    days). The range is widened by a day to cover users in other time zones.
+    """
+    lower, upper = day_range(start - timedelta(days=1), end + timedelta(days=1), timezone.utc)
+    entries = CheckInCheckOut.objects.filter(check_in_time__gte=lower, check_in_time__lt=upper).aggregate(
+        count=Count('id'), last=Max('id'), open=Count('id', filter=Q(check_out_time__isnull=True)),
+        modified=Max('updated_at'),
+    )
+    users = CustomUser.objects.aggregate(count=Count('id'), last=Max('id'), modified=Max('updated_at'))
+    return [*entries.values(), *users.values(), TimeEntryLog.objects.aggregate(last=Max('id'))['last']]
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def gzip_chunks(lines, encoding='utf-8', level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for line in lines:
+        chunk = compressor.compress(line.encode(encoding))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
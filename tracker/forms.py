@@ -1,4 +1,5 @@
 from django import forms
+from django.core.exceptions import ValidationError
 from .models import CheckInCheckOut
 
 class TimeEntryForm(forms.ModelForm):
@@ -10,6 +11,14 @@ class TimeEntryForm(forms.ModelForm):
             'check_out_time': forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'}),
         }
 
+    def validate_unique(self):
+        super().validate_unique()
+        # The user is not a form field, so full_clean() skipped the one-open-entry constraint.
+        try:
+            self.instance.validate_constraints()
+        except ValidationError as error:
+            self._update_errors(error)
+
 class NewTimeEntryForm(forms.ModelForm):
     class Meta:
         model = CheckInCheckOut
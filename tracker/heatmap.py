@@ -0,0 +1,106 @@
+"""
+Worked hours per local day, for calendar heatmaps of a user or a team.
+
+Days are the owner's local days, and an entry that spans midnight counts
+toward both days. The split is made in SQL, by one UNION ALL query over the
+entries: within a range of at most a year a time zone has only a few UTC
+offsets, so each offset is a CASE over the transitions (found in Python),
+and local days and midnights are plain arithmetic on epoch seconds. No row
+is converted between time zones one at a time.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Floor, Greatest
+from django.db.models.lookups import LessThan
+
+from .analytics import DAY, EPOCH_ORDINAL, Epoch
+from .models import CheckInCheckOut, resolve_timezone
+from .rollups import day_range
+
+MAX_DAYS = 366
+
+
+def _offset(tz, seconds):
+    return int(datetime.fromtimestamp(seconds, tz).utcoffset().total_seconds())
+
+
+def offset_changes(tz, lower, upper):
+    """
+    [(epoch second, offset)] of ``tz`` over [lower, upper): each offset, in
+    seconds, applies from its second on. Found by bisection within the days
+    on which the offset changes.
+    """
+    changes = [(lower, _offset(tz, lower))]
+    for start in range(lower, upper, DAY):
+        end = min(start + DAY, upper)
+        current = changes[-1][1]
+        if _offset(tz, end) != current:
+            low, high = start, end
+            while high - low > 1:
+                middle = (low + high) // 2
+                low, high = (middle, high) if _offset(tz, middle) == current else (low, middle)
+            changes.append((high, _offset(tz, high)))
+    return changes
+
+
+def _stepwise(value, steps):
+    """CASE over ascending (threshold, result) steps: the result of the last threshold <= value."""
+    (_, first), *later = steps
+    if not later:
+        return Value(first)
+    whens = [When(LessThan(value, Value(threshold)), then=Value(result)) for (threshold, _), (_, result) in zip(later, steps)]
+    return Case(*whens, default=Value(steps[-1][1]))
+
+
+def _day_parts(entries, changes, first, last):
+    """
+    (local day number, seconds) rows of the entries for the days [first, last],
+    split at the local midnight before the check-out.
+    """
+    # The offset at a day's local midnight, by day number: the new offset
+    # applies from the first midnight that falls on or after its transition.
+    midnights = [(-(-(instant + offset) // DAY), offset) for instant, offset in changes]
+    entries = entries.alias(
+        started=Epoch('check_in_time'),
+        ended=Epoch('check_out_time'),
+    ).alias(
+        day_in=Floor((F('started') + _stepwise(F('started'), changes)) / DAY),
+        day_out=Floor((F('ended') + _stepwise(F('ended'), changes)) / DAY),
+    ).alias(
+        # An entry longer than a day counts its earlier days toward its first one.
+        midnight=Greatest(F('started'), F('day_out') * DAY - _stepwise(F('day_out'), midnights)),
+    )
+    head = entries.filter(midnight__gt=F('started'), day_in__gte=first, day_in__lte=last).values(day=F('day_in')).annotate(
+        seconds=Sum(F('midnight') - F('started')),
+    )
+    tail = entries.filter(day_out__gte=first, day_out__lte=last).values(day=F('day_out')).annotate(
+        seconds=Sum(F('ended') - F('midnight')),
+    )
+    return [head.values_list('day', 'seconds'), tail.values_list('day', 'seconds')]
+
+
+def hours_by_day(users, start, end):
+    """{day: hours} for every day in [start, end]: the closed entries of ``users``, in their local days."""
+    zones = sorted(users.order_by().values_list('time_zone', flat=True).distinct())
+    first, last = start.toordinal() - EPOCH_ORDINAL, end.toordinal() - EPOCH_ORDINAL
+    # Entries shorter than a day can reach into the range from the day before it.
+    lower, upper = day_range(start - timedelta(days=2), end + timedelta(days=1), timezone.utc)
+    epoch_bounds = int(lower.timestamp()), int(upper.timestamp())
+
+    parts = []
+    for zone in zones:
+        entries = CheckInCheckOut.objects.filter(
+            user__in=users.filter(time_zone=zone), check_out_time__isnull=False,
+            check_in_time__gte=lower, check_in_time__lt=upper,
+        ).order_by()
+        parts += _day_parts(entries, offset_changes(resolve_timezone(zone), *epoch_bounds), first, last)
+
+    hours = {start + timedelta(days=offset): 0.0 for offset in range((end - start).days + 1)}
+    if parts:
+        seconds = defaultdict(float)
+        for day, worked in parts[0].union(*parts[1:], all=True):
+            seconds[date.fromordinal(EPOCH_ORDINAL + int(day))] += worked
+        hours.update((day, round(worked / 3600, 2)) for day, worked in seconds.items())
+    return hours
@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import usercache
+from .models import CheckInCheckOut, CustomUser, resolve_timezone
+from .rollups import entry_day, refresh_many_daily_hours
+
+COLUMNS = ('username', 'check_in_time', 'check_out_time')
+COPY_COLUMNS = ('user_id', 'check_in_time', 'check_out_time', 'updated_at')
+
+
+def read_rows(handle, path):
+    """Yield (line number, row dict) from a CSV file with a header, or a .jsonl file."""
+    if path.endswith('.jsonl'):
+        for number, line in enumerate(handle, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as error:
+                    row = {'error': str(error)}
+                yield number, row if isinstance(row, dict) else {'error': 'not a JSON object'}
+    else:
+        reader = csv.DictReader(handle)
+        missing = set(COLUMNS[:2]) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"CSV header lacks {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _parse_time(value, tz):
+    if value in (None, ''):
+        return None
+    value = str(value)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f'{value!r} is not an ISO 8601 timestamp')
+    return timezone.make_aware(parsed, tz) if timezone.is_naive(parsed) else parsed
+
+
+@dataclass
+class ImportResult:
+    read: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    rejected: list = field(default_factory=list)
+
+
+class EntryImporter:
+    """
+    Validate and load historical entries chunk by chunk.
+
+    Usernames are resolved from one query made up front. Each chunk is
+    checked against the entries already stored (so an import can be re-run)
+    and loaded in its own transaction: with COPY on PostgreSQL, with batched
+    INSERTs elsewhere. The daily rollup is refreshed per chunk.
+    """
+
+    def __init__(self, chunk_size=20000):
+        self.chunk_size = chunk_size
+        self.result = ImportResult()
+        self.users = {
+            username: (user_id, resolve_timezone(time_zone))
+            for username, user_id, time_zone in CustomUser.objects.values_list('username', 'id', 'time_zone')
+        }
+        self.timezones = dict(self.users.values())
+
+    def run(self, rows, progress=None):
+        chunk = []
+        for number, row in rows:
+            self.result.read += 1
+            chunk.append((number, row))
+            if len(chunk) >= self.chunk_size:
+                self.load_chunk(chunk)
+                chunk = []
+                if progress:
+                    progress(self.result)
+        if chunk:
+            self.load_chunk(chunk)
+            if progress:
+                progress(self.result)
+        return self.result
+
+    def validate(self, row):
+        if 'error' in row:
+            raise ValueError(row['error'])
+        try:
+            user_id, tz = self.users[row.get('username')]
+        except (KeyError, TypeError):
+            raise ValueError(f"unknown user {row.get('username')!r}")
+        check_in = _parse_time(row.get('check_in_time'), tz)
+        check_out = _parse_time(row.get('check_out_time'), tz)
+        if check_in is None:
+            raise ValueError('check_in_time is required')
+        if check_out is not None and check_out < check_in:
+            raise ValueError('check_out_time is before check_in_time')
+        return user_id, check_in, check_out
+
+    def load_chunk(self, chunk):
+        entries = {}
+        for number, row in chunk:
+            try:
+                user_id, check_in, check_out = self.validate(row)
+            except ValueError as error:
+                self.result.rejected.append({'line': number, 'reason': str(error)})
+                continue
+            if (user_id, check_in) in entries:
+                self.result.duplicates += 1
+                continue
+            entries[user_id, check_in] = (number, check_out)
+        if not entries:
+            return
+
+        with transaction.atomic():
+            existing = self.existing(entries)
+            self.result.duplicates += len(existing)
+            rows = self.without_second_open_entries(entries, existing)
+            if connection.vendor == 'postgresql':
+                self.copy(rows)
+            else:
+                CheckInCheckOut.objects.bulk_create(
+                    [CheckInCheckOut(user_id=user_id, check_in_time=check_in, check_out_time=check_out) for user_id, check_in, check_out in rows],
+                    batch_size=2000,
+                )
+
+            days = defaultdict(set)
+            for user_id, check_in, check_out in rows:
+                if check_out is not None:
+                    days[user_id].add(entry_day(check_in, self.timezones[user_id]))
+            refresh_many_daily_hours(days, {user_id: self.timezones[user_id] for user_id in days})
+            usercache.invalidate(user_id for user_id, _, _ in rows)
+        self.result.imported += len(rows)
+
+    def without_second_open_entries(self, entries, existing):
+        """The new rows of the chunk, rejecting open ones for users who already have an open entry."""
+        opening = {user_id for (user_id, _), (_, check_out) in entries.items() if check_out is None}
+        open_users = set()
+        if opening:
+            open_users = set(CheckInCheckOut.objects.filter(user_id__in=opening, check_out_time__isnull=True).values_list('user_id', flat=True))
+        rows = []
+        for (user_id, check_in), (number, check_out) in entries.items():
+            if (user_id, check_in) in existing:
+                continue
+            if check_out is None:
+                if user_id in open_users:
+                    self.result.rejected.append({'line': number, 'reason': 'the user already has an open entry'})
+                    continue
+                open_users.add(user_id)
+            rows.append((user_id, check_in, check_out))
+        return rows
+
+    def existing(self, entries):
+        """The (user_id, check_in_time) pairs of the chunk that are already stored."""
+        user_ids = {user_id for user_id, _ in entries}
+        times = [check_in for _, check_in in entries]
+        stored = CheckInCheckOut.objects.filter(
+            user_id__in=user_ids, check_in_time__gte=min(times), check_in_time__lte=max(times),
+        ).values_list('user_id', 'check_in_time')
+        return {pair for pair in stored.iterator(chunk_size=self.chunk_size) if pair in entries}
+
+    def copy(self, rows):
+        # COPY fills no Python-side defaults: every NOT NULL column is listed.
+        updated_at = timezone.now().isoformat()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for user_id, check_in, check_out in rows:
+            writer.writerow((user_id, check_in.isoformat(), check_out.isoformat() if check_out else '', updated_at))
+        buffer.seek(0)
+
+        table = connection.ops.quote_name(CheckInCheckOut._meta.db_table)
+        sql = f"COPY {table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy'):
+                # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+            else:
+                raw.copy_expert(sql, buffer)
@@ -0,0 +1,153 @@
+"""
+Report jobs, queued in the database and run by ``manage.py run_workers``.
+
+A worker claims a job by flipping it from queued to running with a
+conditional UPDATE, so any number of workers can poll the same table and
+no broker is needed. Failed jobs are retried with a growing delay until
+they run out of attempts.
+"""
+import hashlib
+import json
+import logging
+import tempfile
+import traceback
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F
+from django.utils import timezone
+
+from . import exports, payroll
+from .models import ReportJob, resolve_timezone
+
+logger = logging.getLogger('tracker.jobs')
+
+
+def _date_range(params):
+    return date.fromisoformat(params['from']), date.fromisoformat(params['to'])
+
+
+def range_version(params):
+    return exports.data_version(*_date_range(params))
+
+
+def run_timesheet(params, out):
+    """Write the export to the binary file ``out``; return its file name and content type."""
+    start, end = _date_range(params)
+    lines, filename = exports.timesheet(start, end, resolve_timezone(params['time_zone']), params['mode'] == 'detail')
+    if params['gzip']:
+        for chunk in exports.gzip_chunks(lines):
+            out.write(chunk)
+        return filename + '.gz', 'application/gzip'
+    for line in lines:
+        out.write(line.encode('utf-8'))
+    return filename, 'text/csv'
+
+
+def run_payroll(params, out):
+    start, end = _date_range(params)
+    payroll.write_report(out, start, end, processes=settings.PAYROLL_PROCESSES)
+    return f'payroll_{start}_{end}.csv', 'text/csv'
+
+
+# kind: (runner, data version of the parameters)
+KINDS = {
+    'timesheet': (run_timesheet, range_version),
+    'payroll': (run_payroll, range_version),
+}
+
+
+def enqueue(kind, params, user=None):
+    """
+    Queue a job, or return the job that already ran (or is about to run) with
+    the same parameters over the same data. Returns (job, created).
+    """
+    version = KINDS[kind][1](params)
+    cache_key = hashlib.sha256(json.dumps([kind, params, version], sort_keys=True, default=str).encode()).hexdigest()
+    job = ReportJob.objects.filter(cache_key=cache_key).exclude(status=ReportJob.FAILED).order_by('-pk').first()
+    if job is not None:
+        return job, False
+    job = ReportJob.objects.create(
+        kind=kind, params=params, cache_key=cache_key, requested_by=user,
+        max_attempts=settings.REPORT_JOB_MAX_ATTEMPTS,
+    )
+    return job, True
+
+
+def claim(worker, pk=None):
+    """Mark the next due job as running for ``worker`` and return it, or None."""
+    now = timezone.now()
+    due = ReportJob.objects.filter(status=ReportJob.QUEUED, run_after__lte=now)
+    if pk is not None:
+        due = due.filter(pk=pk)
+    for job_id in due.order_by('run_after', 'pk').values_list('pk', flat=True)[:10]:
+        # Another worker may have taken it since; only one UPDATE wins.
+        claimed = ReportJob.objects.filter(pk=job_id, status=ReportJob.QUEUED).update(
+            status=ReportJob.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return ReportJob.objects.get(pk=job_id)
+    return None
+
+
+def _running(job):
+    return ReportJob.objects.filter(pk=job.pk, status=ReportJob.RUNNING, locked_by=job.locked_by)
+
+
+def execute(job):
+    """Run a claimed job and store its artifact; a failure is recorded with fail()."""
+    try:
+        runner = KINDS[job.kind][0]
+        with tempfile.TemporaryFile() as out:
+            filename, content_type = runner(job.params, out)
+            out.seek(0)
+            job.artifact.save(f'{job.pk}-{filename}', File(out), save=False)
+    except Exception:
+        logger.exception('Report job %s failed', job.pk)
+        fail(job, traceback.format_exc())
+        return
+
+    finished = _running(job).update(
+        status=ReportJob.DONE, artifact=job.artifact.name, filename=filename, content_type=content_type,
+        error='', locked_by='', locked_at=None, finished_at=timezone.now(),
+    )
+    if not finished:
+        # Timed out and taken back while running; the retry writes its own file.
+        job.artifact.delete(save=False)
+
+
+def fail(job, error):
+    """Queue a running job again after a delay, or mark it failed when out of attempts."""
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        delay = timedelta(seconds=settings.REPORT_JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+        return _running(job).update(
+            status=ReportJob.QUEUED, run_after=now + delay, error=error, locked_by='', locked_at=None,
+        )
+    return _running(job).update(status=ReportJob.FAILED, error=error, locked_by='', locked_at=None, finished_at=now)
+
+
+def release(job):
+    """Put a running job back in the queue without using up an attempt."""
+    return _running(job).update(status=ReportJob.QUEUED, attempts=F('attempts') - 1, locked_by='', locked_at=None)
+
+
+def reclaim_stale():
+    """Fail the jobs of workers that died, so they are retried elsewhere."""
+    cutoff = timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT * 2)
+    stale = ReportJob.objects.filter(status=ReportJob.RUNNING, locked_at__lt=cutoff)
+    return sum(fail(job, f'worker {job.locked_by} stopped responding') for job in stale)
+
+
+def purge(days=None):
+    """Delete finished jobs and their files after REPORT_RETENTION_DAYS."""
+    cutoff = timezone.now() - timedelta(days=settings.REPORT_RETENTION_DAYS if days is None else days)
+    old = ReportJob.objects.filter(status__in=[ReportJob.DONE, ReportJob.FAILED], finished_at__lt=cutoff)
+    count = 0
+    for job in old:
+        if job.artifact:
+            job.artifact.delete(save=False)
+        job.delete()
+        count += 1
+    return count
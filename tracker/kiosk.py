@@ -0,0 +1,441 @@
+import hashlib
+import hmac
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field, replace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import attendance, usercache
+from .models import CheckInCheckOut, QRCode, ScanEvent, resolve_timezone
+from .rollups import entry_day, refresh_daily_hours, refresh_many_daily_hours
+
+CHECKED_IN = 'checked_in'
+CHECKED_OUT = 'checked_out'
+SCAN_PENDING = 'pending'
+
+# Times a sync chunk is replayed after conflicting with live scans.
+SYNC_CHUNK_ATTEMPTS = 3
+
+
+def is_authenticated(request):
+    # As bytes: compare_digest() rejects str with non-ASCII characters.
+    key = request.headers.get('X-Kiosk-Key', '').encode()
+    return bool(key) and any(hmac.compare_digest(key, valid.encode()) for valid in settings.KIOSK_API_KEYS)
+
+
+def _idempotency_cache_key(request):
+    """
+    The cache key of the scan's Idempotency-Key, or None without one. Keys are
+    only unique per kiosk, so they are namespaced by its API key, hashed.
+    """
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if not idempotency_key:
+        return None
+    digest = hashlib.sha256(f"{request.headers.get('X-Kiosk-Key', '')}\0{idempotency_key}".encode()).hexdigest()
+    return f'tracker:kiosk:idempotency:{digest}'
+
+
+class QRCodeCache:
+    """Thread-safe LRU mapping of QR code UUIDs to (user_id, time zone)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, qr_code):
+        with self._lock:
+            try:
+                self._entries.move_to_end(qr_code)
+                return self._entries[qr_code]
+            except KeyError:
+                return None
+
+    def _remember(self, qr_code, row):
+        # Unknown codes are not cached, so random scans cannot evict real ones.
+        if row is None:
+            return None
+        with self._lock:
+            self._entries[qr_code] = row
+            self._entries.move_to_end(qr_code)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return row
+
+    def _query(self, qr_code):
+        return QRCode.objects.filter(qr_code=qr_code).values_list('user_id', 'user__time_zone')
+
+    def resolve(self, qr_code):
+        return self._cached(qr_code) or self._remember(qr_code, self._query(qr_code).first())
+
+    async def aresolve(self, qr_code):
+        return self._cached(qr_code) or self._remember(qr_code, await self._query(qr_code).afirst())
+
+    def discard(self, qr_code):
+        with self._lock:
+            self._entries.pop(qr_code, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+qr_codes = QRCodeCache(getattr(settings, 'KIOSK_QR_CACHE_SIZE', 10000))
+
+
+def _close_open_entry(user_id, when):
+    """Close the user's open entry in one statement; return its (id, check_in_time) or None."""
+    table = connection.ops.quote_name(CheckInCheckOut._meta.db_table)
+    if connection.features.can_return_columns_from_insert:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET check_out_time = %s, updated_at = %s '
+                f'WHERE user_id = %s AND check_out_time IS NULL RETURNING id, check_in_time',
+                [connection.ops.adapt_datetimefield_value(when), connection.ops.adapt_datetimefield_value(timezone.now()), user_id],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            return None
+        entry_id, check_in_time = rows[0]
+        # Raw rows skip the ORM's conversions (SQLite hands back strings).
+        column = CheckInCheckOut._meta.get_field('check_in_time').get_col(CheckInCheckOut._meta.db_table)
+        for converter in connection.ops.get_db_converters(column):
+            check_in_time = converter(check_in_time, column, connection)
+        return entry_id, check_in_time
+
+    # Backends without UPDATE ... RETURNING: the update is still conditional.
+    open_entry = CheckInCheckOut.objects.filter(user_id=user_id, check_out_time__isnull=True).values_list('id', 'check_in_time').first()
+    if open_entry and CheckInCheckOut.objects.filter(pk=open_entry[0], check_out_time__isnull=True).update(check_out_time=when, updated_at=timezone.now()):
+        return open_entry
+    return None
+
+
+def _insert_open_entry(user_id, when):
+    """Insert an open entry unless the user has one; return the new id, or None."""
+    if not (connection.features.can_return_columns_from_insert and connection.features.supports_partial_indexes):
+        try:
+            with transaction.atomic():
+                return CheckInCheckOut.objects.create(user_id=user_id, check_in_time=when).pk
+        except IntegrityError:
+            return None
+
+    # The conflict target is the checkin_one_open_entry constraint.
+    table = connection.ops.quote_name(CheckInCheckOut._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, check_in_time, updated_at) VALUES (%s, %s, %s) '
+            f'ON CONFLICT (user_id) WHERE check_out_time IS NULL DO NOTHING RETURNING id',
+            [user_id, connection.ops.adapt_datetimefield_value(when), connection.ops.adapt_datetimefield_value(timezone.now())],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    # The raw INSERT bypasses post_save, so publish the check-in here.
+    usercache.invalidate([user_id])
+    attendance.publish(attendance.CHECK_IN, row[0], user_id, when)
+    return row[0]
+
+
+def check_in(user_id, when):
+    """
+    Open an entry for the user unless one is open already, in one statement
+    and without locking rows. Return (entry id, whether it was created).
+    """
+    while True:
+        entry_id = _insert_open_entry(user_id, when)
+        if entry_id is not None:
+            return entry_id, True
+        open_id = CheckInCheckOut.objects.filter(user_id=user_id, check_out_time__isnull=True).values_list('id', flat=True).first()
+        # Otherwise the open entry was closed since the INSERT; try again.
+        if open_id is not None:
+            return open_id, False
+
+
+def punch(user_id, when, tz=None):
+    """
+    Toggle the user's attendance: close the open entry, or open a new one.
+    Concurrent scans that find the user checked out open a single entry.
+    """
+    tz = tz or resolve_timezone(None)
+    closed = _close_open_entry(user_id, when)
+    if closed is not None:
+        entry_id, check_in_time = closed
+        refresh_daily_hours(user_id, [entry_day(check_in_time, tz)], tz)
+        usercache.invalidate([user_id])
+        # The raw UPDATE bypasses post_save, so publish the check-out here.
+        attendance.publish(attendance.CHECK_OUT, entry_id, user_id, when)
+        return CHECKED_OUT, entry_id
+
+    entry_id, _ = check_in(user_id, when)
+    return CHECKED_IN, entry_id
+
+
+class ScanError(ValueError):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def _scanned_code(data):
+    try:
+        return uuid.UUID(str(data.get('qr_code', '')))
+    except (AttributeError, ValueError):
+        raise ScanError('Invalid QR code.', 400)
+
+
+def _replayed(previous):
+    """The first answer to a repeated Idempotency-Key, or None if it has expired since."""
+    if previous == SCAN_PENDING:
+        raise ScanError('A scan with this key is still being processed.', 409)
+    return previous
+
+
+def _user_of(resolved):
+    if resolved is None:
+        raise ScanError('Unknown QR code.', 404)
+    return resolved
+
+
+def _scan_result(status, entry_id, user_id, when):
+    return {'status': status, 'entry_id': entry_id, 'user_id': user_id, 'time': when.isoformat()}
+
+
+def scan(request, data):
+    """
+    Punch the user of the QR code in a kiosk request's ``data``. Return the
+    result, and whether it replays the answer to an earlier request with the
+    same Idempotency-Key; raise ScanError for a request that can't be served.
+    """
+    qr_code = _scanned_code(data)
+    cache_key = _idempotency_cache_key(request)
+    if cache_key and not cache.add(cache_key, SCAN_PENDING, settings.KIOSK_IDEMPOTENCY_TTL):
+        previous = _replayed(cache.get(cache_key))
+        if previous is not None:
+            return previous, True
+
+    try:
+        user_id, time_zone = _user_of(qr_codes.resolve(qr_code))
+        now = timezone.now()
+        result = _scan_result(*punch(user_id, now, resolve_timezone(time_zone)), user_id, now)
+    except Exception:
+        if cache_key:
+            cache.delete(cache_key)
+        raise
+    if cache_key:
+        cache.set(cache_key, result, settings.KIOSK_IDEMPOTENCY_TTL)
+    return result, False
+
+
+async def ascan(request, data):
+    """Like scan(), with the async cache and ORM APIs."""
+    qr_code = _scanned_code(data)
+    cache_key = _idempotency_cache_key(request)
+    if cache_key and not await cache.aadd(cache_key, SCAN_PENDING, settings.KIOSK_IDEMPOTENCY_TTL):
+        previous = _replayed(await cache.aget(cache_key))
+        if previous is not None:
+            return previous, True
+
+    try:
+        user_id, time_zone = _user_of(await qr_codes.aresolve(qr_code))
+        now = timezone.now()
+        # punch() is a single UPDATE ... RETURNING (or INSERT) plus the rollup
+        # refresh; one hop to the DB thread is cheaper than one per statement.
+        result = _scan_result(*await sync_to_async(punch)(user_id, now, resolve_timezone(time_zone)), user_id, now)
+    except Exception:
+        if cache_key:
+            await cache.adelete(cache_key)
+        raise
+    if cache_key:
+        await cache.aset(cache_key, result, settings.KIOSK_IDEMPOTENCY_TTL)
+    return result, False
+
+
+@dataclass
+class SyncResult:
+    received: int = 0
+    duplicates: int = 0
+    checked_in: int = 0
+    checked_out: int = 0
+    rejected: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'received': self.received,
+            'duplicates': self.duplicates,
+            'checked_in': self.checked_in,
+            'checked_out': self.checked_out,
+            'rejected': self.rejected,
+        }
+
+
+def _parse_event(raw):
+    """Return (event_id, device_id, qr_code, event_time) or raise ValueError."""
+    try:
+        event_id = str(raw['event_id'])[:64]
+        device_id = str(raw.get('device_id', ''))[:64]
+        qr_code = uuid.UUID(str(raw['qr_code']))
+        event_time = parse_datetime(str(raw['event_time']))
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError('event_id, qr_code and event_time are required')
+    if not event_id:
+        raise ValueError('event_id is required')
+    if event_time is None:
+        raise ValueError('event_time is not an ISO 8601 timestamp')
+    if timezone.is_naive(event_time):
+        raise ValueError('event_time needs a UTC offset')
+    return event_id, device_id, qr_code, event_time
+
+
+def ingest_scan_events(raw_events, chunk_size=1000):
+    """
+    Replay buffered kiosk scans in time order.
+
+    Every scan toggles its user's attendance just like a live scan. Events
+    already seen (by event_id) are skipped, so a kiosk can resend its whole
+    buffer. Each chunk is written with bulk queries inside its own transaction.
+    """
+    result = SyncResult()
+    events = {}
+    for raw in raw_events:
+        result.received += 1
+        try:
+            event_id, device_id, qr_code, event_time = _parse_event(raw)
+        except ValueError as error:
+            result.rejected.append({'event': raw, 'reason': str(error)})
+            continue
+        if event_id in events:
+            result.duplicates += 1
+            continue
+        events[event_id] = (event_id, device_id, qr_code, event_time)
+
+    owners = {}
+    codes = {qr_code for _, _, qr_code, _ in events.values()}
+    for qr_code, user_id, time_zone in QRCode.objects.filter(qr_code__in=codes).values_list('qr_code', 'user_id', 'user__time_zone'):
+        owners[qr_code] = (user_id, resolve_timezone(time_zone))
+
+    ordered = []
+    for event_id, device_id, qr_code, event_time in events.values():
+        if qr_code not in owners:
+            result.rejected.append({'event_id': event_id, 'reason': 'unknown QR code'})
+            continue
+        ordered.append((event_time, event_id, device_id, owners[qr_code][0]))
+    ordered.sort()
+
+    for chunk_start in range(0, len(ordered), chunk_size):
+        chunk = ordered[chunk_start:chunk_start + chunk_size]
+        for _ in range(SYNC_CHUNK_ATTEMPTS):
+            attempted = replace(result, rejected=list(result.rejected))
+            try:
+                _ingest_chunk(chunk, owners, attempted)
+            except IntegrityError:
+                # A live scan opened an entry for one of the users meanwhile. The
+                # chunk was rolled back; replay it against the stored open entries.
+                continue
+            result = attempted
+            break
+        else:
+            # Nothing of the chunk was stored, so the kiosk can send it again.
+            result.rejected += [{'event_id': event_id, 'reason': 'conflicted with live scans'} for _, event_id, _, _ in chunk]
+    return result
+
+
+def _claim_events(chunk):
+    """
+    Store the ScanEvent rows of the chunk's events, except those stored
+    already, and return the ids of the ones stored here. An event that a
+    concurrent sync is storing waits for it and is then skipped, so each
+    event is claimed, and toggles attendance, exactly once.
+    """
+    if not (connection.features.can_return_rows_from_bulk_insert and connection.features.supports_ignore_conflicts):
+        claimed = set()
+        for event_time, event_id, device_id, user_id in chunk:
+            try:
+                with transaction.atomic():
+                    ScanEvent.objects.create(event_id=event_id, device_id=device_id, user_id=user_id, event_time=event_time)
+            except IntegrityError:
+                continue
+            claimed.add(event_id)
+        return claimed
+
+    table = connection.ops.quote_name(ScanEvent._meta.db_table)
+    fields = [ScanEvent._meta.get_field(name) for name in ('event_id', 'device_id', 'user', 'event_time', 'received_at')]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    received_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    batch_size = connection.ops.bulk_batch_size(fields, chunk)
+    claimed = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(chunk), batch_size):
+            batch = chunk[start:start + batch_size]
+            params = []
+            for event_time, event_id, device_id, user_id in batch:
+                params += [event_id, device_id, user_id, connection.ops.adapt_datetimefield_value(event_time), received_at]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))} "
+                f"ON CONFLICT (event_id) DO NOTHING RETURNING event_id",
+                params,
+            )
+            claimed.update(event_id for event_id, in cursor.fetchall())
+    return claimed
+
+
+def _ingest_chunk(chunk, owners, result):
+    with transaction.atomic():
+        claimed = _claim_events(chunk)
+        fresh = [event for event in chunk if event[1] in claimed]
+        result.duplicates += len(chunk) - len(fresh)
+        if not fresh:
+            return
+
+        # Locked, so a live punch can't close one of them before the bulk_update below.
+        user_ids = {user_id for _, _, _, user_id in fresh}
+        open_entries = dict.fromkeys(user_ids)
+        for entry in CheckInCheckOut.objects.select_for_update().filter(user_id__in=user_ids, check_out_time__isnull=True):
+            open_entries[entry.user_id] = entry
+
+        rejected, created, closed = [], [], {}
+        for event_time, event_id, device_id, user_id in fresh:
+            entry = open_entries[user_id]
+            if entry is None:
+                entry = CheckInCheckOut(user_id=user_id, check_in_time=event_time)
+                created.append(entry)
+                open_entries[user_id] = entry
+                result.checked_in += 1
+            elif entry.check_in_time <= event_time:
+                entry.check_out_time = event_time
+                entry.updated_at = timezone.now()
+                if entry.pk is not None:
+                    closed[entry.pk] = entry
+                open_entries[user_id] = None
+                result.checked_out += 1
+            else:
+                # Would open a second, overlapping entry next to the one already open.
+                result.rejected.append({'event_id': event_id, 'reason': 'older than the open check-in'})
+                rejected.append(event_id)
+
+        # A rejected event is not kept as seen: resending it is rejected again.
+        if rejected:
+            ScanEvent.objects.filter(event_id__in=rejected).delete()
+        # Close before inserting: a user may have at most one open entry at any time.
+        CheckInCheckOut.objects.bulk_update(closed.values(), ['check_out_time', 'updated_at'])
+        CheckInCheckOut.objects.bulk_create(created)
+
+        # Bulk writes send no post_save; replay the attendance changes in time order.
+        changes = [(entry.check_in_time, attendance.CHECK_IN, entry) for entry in created]
+        changes += [(entry.check_out_time, attendance.CHECK_OUT, entry) for entry in [*created, *closed.values()] if entry.check_out_time]
+        for when, kind, entry in sorted(changes, key=lambda change: change[0]):
+            attendance.publish(kind, entry.pk, entry.user_id, when)
+
+        touched = defaultdict(set)
+        owner_tz = {user_id: tz for user_id, tz in owners.values()}
+        for entry in [*created, *closed.values()]:
+            if entry.check_out_time is not None:
+                touched[entry.user_id].add(entry_day(entry.check_in_time, owner_tz[entry.user_id]))
+        refresh_many_daily_hours(touched, owner_tz)
+        usercache.invalidate(entry.user_id for entry in [*created, *closed.values()])
@@ -0,0 +1,58 @@
+import json
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tracker import analytics
+from tracker.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Print attendance statistics of all users (or --user) over a date range: average shift length, '
+        'first-arrival percentiles, overtime days, late-arrival rates and a weekday/hour check-in heatmap.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help='First day (default: first of this month).')
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help='Last day (default: end of this month).')
+        parser.add_argument('--user', action='append', dest='usernames', help='Only this user (repeatable).')
+        parser.add_argument('--late-after', help='Local time after which an arrival is late (default: ANALYTICS_LATE_AFTER).')
+        parser.add_argument('--json', action='store_true', help='Print the statistics as JSON.')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        start = options['start'] or today.replace(day=1)
+        end = options['end'] or (today.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        if end < start:
+            raise CommandError('--to is before --from.')
+
+        users = CustomUser.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        started = time.perf_counter()
+        try:
+            stats = analytics.attendance_statistics(users, start, end, late_after=options['late_after'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        elapsed = time.perf_counter() - started
+
+        if options['json']:
+            self.stdout.write(json.dumps({'from': start.isoformat(), 'to': end.isoformat(), **stats}, indent=2))
+            return
+
+        self.stdout.write(f"{start} to {end}: {stats['entries']} shifts on {stats['days_worked']} days of {len(stats['users'])} users")
+        self.stdout.write(f"Average shift: {stats['average_shift_hours']} h, overtime days: {stats['overtime_days']}, late rate: {stats['late_rate']}")
+        self.stdout.write('First arrival (h): ' + ', '.join(f'p{p} {hours}' for p, hours in stats['arrival_percentiles'].items()))
+        self.stdout.write('Check-ins by weekday and hour:')
+        for day, row in stats['heatmap'].items():
+            self.stdout.write(f"  {day} " + ' '.join(f'{count:>4}' for count in row))
+        self.stdout.write(f"{'user':<24} {'shifts':>7} {'avg h':>6} {'arrival':>8} {'days':>5} {'overtime':>9} {'late':>6}")
+        for row in stats['users']:
+            self.stdout.write(
+                f"{row['username']:<24} {row['shifts']:>7} {row['average_shift_hours'] or '-':>6} {row['median_arrival'] or '-':>8} "
+                f"{row['days_worked']:>5} {row['overtime_days']:>9} {row['late_rate'] if row['late_rate'] is not None else '-':>6}"
+            )
+        self.stdout.write(self.style.SUCCESS(f'Computed in {elapsed:.2f}s.'))
@@ -0,0 +1,107 @@
+import asyncio
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from tracker.models import CheckInCheckOut, CustomUser, QRCode
+
+USERNAME_PREFIX = 'async-benchmark-'
+SCENARIOS = ('index', 'summary', 'kiosk_scan')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/second of the sync views (WSGI handler, one thread per concurrent request) '
+        'with their async twins (ASGI handler, one event loop) at the given concurrency. '
+        'Runs in-process against the configured database with throw-away users.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--scenario', choices=SCENARIOS, action='append', dest='scenarios')
+
+    def handle(self, *args, **options):
+        if CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f"Users named '{USERNAME_PREFIX}*' already exist; remove them first.")
+
+        user = CustomUser.objects.create_user(username=f'{USERNAME_PREFIX}user')
+        scanners = CustomUser.objects.bulk_create([CustomUser(username=f'{USERNAME_PREFIX}{i}') for i in range(500)])
+        codes = [str(qr.qr_code) for qr in QRCode.objects.bulk_create([QRCode(user=scanner) for scanner in scanners])]
+        self.api_key = uuid.uuid4().hex
+        self.codes = codes
+
+        try:
+            # The in-process test clients always send Host: testserver.
+            with override_settings(KIOSK_API_KEYS=[self.api_key], ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self.stdout.write(f"{'scenario':<12} {'server':<6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+                for scenario in options['scenarios'] or SCENARIOS:
+                    for mode, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                        results, wall = run(scenario, user, options['requests'], options['concurrency'])
+                        self.report(scenario, mode, results, wall)
+        finally:
+            CheckInCheckOut.objects.filter(user__username__startswith=USERNAME_PREFIX).delete()
+            CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    def request_args(self, scenario, i):
+        if scenario == 'kiosk_scan':
+            return 'post', (reverse('kiosk_scan'), {'qr_code': self.codes[i % len(self.codes)]}), {'headers': {'X-Kiosk-Key': self.api_key}}
+        return 'get', (reverse(scenario),), {}
+
+    def run_wsgi(self, scenario, user, requests, concurrency):
+        with override_settings(ROOT_URLCONF='tracker.urls'):
+            template = Client()
+            template.force_login(user)
+
+            def call(i):
+                client = Client()
+                client.cookies = template.cookies
+                method, args, extra = self.request_args(scenario, i)
+                started = time.perf_counter()
+                response = getattr(client, method)(*args, **extra)
+                elapsed = time.perf_counter() - started
+                close_old_connections()
+                return response.status_code, elapsed
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(call, range(requests)))
+            return results, time.perf_counter() - started
+
+    def run_asgi(self, scenario, user, requests, concurrency):
+        with override_settings(ROOT_URLCONF='tracker.async_urls'):
+            client = AsyncClient()
+            client.force_login(user)
+
+            async def main():
+                gate = asyncio.Semaphore(concurrency)
+
+                async def call(i):
+                    method, args, extra = self.request_args(scenario, i)
+                    async with gate:
+                        started = time.perf_counter()
+                        response = await getattr(client, method)(*args, **extra)
+                        return response.status_code, time.perf_counter() - started
+
+                started = time.perf_counter()
+                results = await asyncio.gather(*(call(i) for i in range(requests)))
+                return results, time.perf_counter() - started
+
+            return asyncio.run(main())
+
+    def report(self, scenario, mode, results, wall):
+        latencies = sorted(elapsed for _, elapsed in results)
+        percentiles = statistics.quantiles(latencies, n=100)
+        errors = sum(1 for status, _ in results if status >= 400)
+        self.stdout.write(
+            f"{scenario:<12} {mode:<6} {len(results) / wall:>9.1f} {percentiles[49] * 1000:>8.1f} "
+            f"{percentiles[94] * 1000:>8.1f} {errors:>7}"
+        )
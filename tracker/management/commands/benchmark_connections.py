@@ -0,0 +1,132 @@
+import copy
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from tracker.models import CheckInCheckOut, CustomUser, QRCode
+
+USERNAME_PREFIX = 'conn-benchmark-'
+SCENARIOS = ('kiosk_scan', 'summary')
+MODES = ('per-request', 'persistent', 'pool')
+
+
+def pool_available():
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    if not is_psycopg3:
+        return False
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@contextmanager
+def connection_mode(mode):
+    """Switch the default connection to a mode for the duration of the block."""
+    original = copy.deepcopy(connection.settings_dict)
+    connection.close()
+    connection.settings_dict['CONN_MAX_AGE'] = 0 if mode in ('per-request', 'pool') else 600
+    connection.settings_dict['CONN_HEALTH_CHECKS'] = mode == 'persistent'
+    options = connection.settings_dict.setdefault('OPTIONS', {})
+    options.pop('pool', None)
+    if mode == 'pool':
+        options['pool'] = {'min_size': 1, 'max_size': 4}
+    try:
+        yield
+    finally:
+        connection.close()
+        if mode == 'pool':
+            connection.close_pool()
+        connection.settings_dict.clear()
+        connection.settings_dict.update(original)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure what opening database connections adds to short requests. The same requests run with a new '
+        'connection per request (CONN_MAX_AGE=0), with persistent connections and health checks, and, on '
+        'PostgreSQL with psycopg 3, with a connection pool. Runs in-process against the configured database '
+        'with throw-away users; connections are released after every request as the request handler does.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--scenario', choices=SCENARIOS, default='kiosk_scan')
+        parser.add_argument('--mode', choices=MODES, action='append', dest='modes')
+
+    def handle(self, *args, **options):
+        if CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f"Users named '{USERNAME_PREFIX}*' already exist; remove them first.")
+
+        user = CustomUser.objects.create_user(username=f'{USERNAME_PREFIX}user')
+        scanners = CustomUser.objects.bulk_create([CustomUser(username=f'{USERNAME_PREFIX}{i}') for i in range(200)])
+        self.codes = [str(qr.qr_code) for qr in QRCode.objects.bulk_create([QRCode(user=scanner) for scanner in scanners])]
+        self.api_key = uuid.uuid4().hex
+
+        try:
+            # The in-process test client always sends Host: testserver.
+            with override_settings(KIOSK_API_KEYS=[self.api_key], ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self.stdout.write(
+                    f"{'mode':<12} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'connect p50':>12} {'connect p95':>12} {'opened':>7}"
+                )
+                for mode in options['modes'] or MODES:
+                    if mode == 'pool' and not pool_available():
+                        self.stdout.write(f"{mode:<12} skipped: needs PostgreSQL with psycopg 3 and psycopg_pool")
+                        continue
+                    with connection_mode(mode):
+                        self.report(mode, *self.run(options['scenario'], user, options['requests']))
+        finally:
+            CheckInCheckOut.objects.filter(user__username__startswith=USERNAME_PREFIX).delete()
+            CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    def run(self, scenario, user, requests):
+        client = Client()
+        client.force_login(user)
+        close_old_connections()
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        latencies, setups = [], []
+        connection_created.connect(count)
+        try:
+            for i in range(requests):
+                started = time.perf_counter()
+                # What the first query of the request would otherwise pay for.
+                connection.ensure_connection()
+                connected = time.perf_counter()
+                if scenario == 'kiosk_scan':
+                    response = client.post(reverse('kiosk_scan'), {'qr_code': self.codes[i % len(self.codes)]}, headers={'X-Kiosk-Key': self.api_key})
+                else:
+                    response = client.get(reverse('summary'))
+                latencies.append(time.perf_counter() - started)
+                setups.append(connected - started)
+                if response.status_code >= 400:
+                    raise CommandError(f'{scenario} answered HTTP {response.status_code}')
+                # The request_finished handler: close (or return) the connection when due.
+                close_old_connections()
+        finally:
+            connection_created.disconnect(count)
+        return latencies, setups, len(opened)
+
+    def report(self, mode, latencies, setups, opened):
+        latencies, setups = sorted(latencies), sorted(setups)
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        setup_percentiles = statistics.quantiles(setups, n=100) if len(setups) > 1 else setups * 99
+        self.stdout.write(
+            f"{mode:<12} {percentiles[49] * 1000:>8.2f} {percentiles[94] * 1000:>8.2f} {latencies[-1] * 1000:>8.2f} "
+            f"{setup_percentiles[49] * 1000:>12.3f} {setup_percentiles[94] * 1000:>12.3f} {opened:>7}"
+        )
@@ -0,0 +1,241 @@
+import json
+import statistics
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from tracker import jobs, urls
+from tracker.models import CheckInCheckOut, CustomUser, QRCode, ReportJob
+
+# Upper bounds per scenario. Query counts must not grow with the amount of
+# data, so they are exact budgets; latencies are p95 budgets in milliseconds
+# for the default generate_load_data set and can be scaled per machine.
+THRESHOLDS = {
+    'index': {'queries': 2, 'p95_ms': 50},
+    'login': {'queries': 0, 'p95_ms': 50},
+    'logout': {'queries': 4, 'p95_ms': 50},
+    'time_history': {'queries': 2, 'p95_ms': 75},
+    'time_history (count)': {'queries': 2, 'p95_ms': 100},
+    'summary': {'queries': 2, 'p95_ms': 50},
+    'team_timesheet': {'queries': 3, 'p95_ms': 150},
+    'team_timesheet (director)': {'queries': 3, 'p95_ms': 250},
+    'team_analytics': {'queries': 4, 'p95_ms': 150},
+    'team_analytics (director)': {'queries': 4, 'p95_ms': 250},
+    'calendar_heatmap': {'queries': 4, 'p95_ms': 100},
+    'calendar_heatmap (team)': {'queries': 4, 'p95_ms': 150},
+    'calendar_heatmap (director)': {'queries': 4, 'p95_ms': 250},
+    'live_attendance': {'queries': 2, 'p95_ms': 50},
+    'attendance_stream': {'queries': 4, 'p95_ms': 75},
+    'export_monthly_timesheet': {'queries': 3, 'p95_ms': 250},
+    'export_monthly_timesheet (detail)': {'queries': 3, 'p95_ms': 2000},
+    'request_report': {'queries': 6, 'p95_ms': 50},
+    'report_status': {'queries': 3, 'p95_ms': 50},
+    'report_download': {'queries': 3, 'p95_ms': 50},
+    'view_user_timesheet': {'queries': 4, 'p95_ms': 100},
+    'edit_time_entry': {'queries': 3, 'p95_ms': 75},
+    'add_time_entry': {'queries': 3, 'p95_ms': 300},
+    'bulk_edit_time_entries': {'queries': 9, 'p95_ms': 150},
+    'kiosk_scan': {'queries': 6, 'p95_ms': 75},
+    'kiosk_sync': {'queries': 11, 'p95_ms': 300},
+    'api_entries': {'queries': 4, 'p95_ms': 50},
+    'api_totals': {'queries': 4, 'p95_ms': 50},
+    'api_team_totals': {'queries': 5, 'p95_ms': 150},
+    'metrics': {'queries': 2, 'p95_ms': 50},
+}
+
+# Transaction bookkeeping, not work done for the view.
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every URL of tracker.urls against data from generate_load_data and report latency percentiles '
+        'and query counts. Fails when a scenario exceeds its query or latency budget.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--prefix', default='load-')
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Only run this scenario (repeatable).')
+        parser.add_argument('--thresholds', help='JSON file whose budgets override the built-in ones.')
+        parser.add_argument('--latency-scale', type=float, default=1.0, help='Multiply the latency budgets (slow machines).')
+        parser.add_argument('--no-latency', action='store_true', help='Only enforce the query budgets.')
+        parser.add_argument('--output', help='Write the measurements to this JSON file.')
+
+    def handle(self, *args, **options):
+        thresholds = {name: dict(budget) for name, budget in THRESHOLDS.items()}
+        if options['thresholds']:
+            with open(options['thresholds']) as f:
+                for name, budget in json.load(f).items():
+                    thresholds.setdefault(name, {}).update(budget)
+
+        scenarios = self.scenarios(options['prefix'])
+        uncovered = {pattern.name for pattern in urls.urlpatterns} - {url_name for url_name, *_ in scenarios.values()}
+        if uncovered:
+            raise CommandError(f"No benchmark scenario for: {', '.join(sorted(uncovered))}")
+        selected = options['scenarios'] or list(scenarios)
+        unknown = set(selected) - scenarios.keys()
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+        results, failures = {}, []
+        self.kiosk_key = uuid.uuid4().hex
+        # The in-process test client always sends Host: testserver.
+        with override_settings(KIOSK_API_KEYS=[self.kiosk_key], ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            self.stdout.write(f"{'scenario':<36} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'queries':>8}")
+            for name in selected:
+                result = results[name] = self.measure(name, *scenarios[name], options['iterations'])
+                self.stdout.write(
+                    f"{name:<36} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['max_ms']:>8.1f} {result['queries']:>8}"
+                )
+                budget = thresholds.get(name, {})
+                if result['status'] >= 400:
+                    failures.append(f"{name}: HTTP {result['status']}")
+                if 'queries' in budget and result['queries'] > budget['queries']:
+                    failures.append(f"{name}: {result['queries']} queries (budget {budget['queries']})")
+                if not options['no_latency'] and 'p95_ms' in budget:
+                    limit = budget['p95_ms'] * options['latency_scale']
+                    if result['p95_ms'] > limit:
+                        failures.append(f"{name}: p95 {result['p95_ms']:.1f} ms (budget {limit:.0f} ms)")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'vendor': connection.vendor, 'results': results}, f, indent=2)
+        if failures:
+            raise CommandError('Performance budget exceeded:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS(f"{len(selected)} scenarios within budget."))
+
+    def scenarios(self, prefix):
+        """Map scenario names to (url name, user, method, path factory, extra request kwargs)."""
+        people = {user.username: user for user in CustomUser.objects.filter(
+            username__in=[f'{prefix}admin', f'{prefix}director', f'{prefix}t0-manager', f'{prefix}t0-e1']
+        )}
+        try:
+            admin, director = people[f'{prefix}admin'], people[f'{prefix}director']
+            manager, employee = people[f'{prefix}t0-manager'], people[f'{prefix}t0-e1']
+        except KeyError:
+            raise CommandError(f"No '{prefix}*' data found; run generate_load_data first.")
+        entry = CheckInCheckOut.objects.filter(user=employee).order_by('-check_in_time').first()
+        codes = [str(code) for code in QRCode.objects.filter(user__username__startswith=prefix).values_list('qr_code', flat=True)[:500]]
+
+        def path(name, *args, query=''):
+            return lambda i: reverse(name, args=args) + query
+
+        def scan(i):
+            return {'data': {'qr_code': codes[i % len(codes)]}}
+
+        # A finished summary export of this month, as request_report would queue it.
+        today = timezone.localdate(timezone=admin.tzinfo)
+        month_end = (today.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        report, _ = jobs.enqueue('timesheet', {
+            'from': today.replace(day=1).isoformat(), 'to': month_end.isoformat(),
+            'mode': 'summary', 'gzip': False, 'time_zone': str(admin.tzinfo),
+        }, admin)
+        if report.status != ReportJob.DONE and (claimed := jobs.claim('benchmark', pk=report.pk)) is not None:
+            jobs.execute(claimed)
+
+        team_entries = list(CheckInCheckOut.objects.filter(user__in=manager.managed_users, check_out_time__isnull=False)[:50])
+
+        def bulk_edit(i):
+            # Alternate between two check-out times so every run writes.
+            changes = [
+                {'entry_id': entry.pk, 'check_out_time': (entry.check_out_time + timedelta(minutes=i % 2)).isoformat()}
+                for entry in team_entries
+            ]
+            return {'data': {'changes': changes}, 'content_type': 'application/json'}
+
+        def sync(i):
+            now = timezone.now()
+            events = [
+                {'event_id': uuid.uuid4().hex, 'device_id': 'benchmark', 'qr_code': codes[(i * 50 + n) % len(codes)], 'event_time': now.isoformat()}
+                for n in range(50)
+            ]
+            return {'data': json.dumps({'events': events}), 'content_type': 'application/json'}
+
+        return {
+            'index': ('index', employee, 'get', path('index'), None),
+            'login': ('login', None, 'get', path('login'), None),
+            'logout': ('logout', employee, 'get', path('logout'), None),
+            'time_history': ('time_history', employee, 'get', path('time_history'), None),
+            'time_history (count)': ('time_history', employee, 'get', path('time_history', query='?count=1'), None),
+            'summary': ('summary', employee, 'get', path('summary'), None),
+            'team_timesheet': ('team_timesheet', manager, 'get', path('team_timesheet'), None),
+            'team_timesheet (director)': ('team_timesheet', director, 'get', path('team_timesheet'), None),
+            'team_analytics': ('team_analytics', manager, 'get', path('team_analytics'), None),
+            'team_analytics (director)': ('team_analytics', director, 'get', path('team_analytics'), None),
+            'calendar_heatmap': ('calendar_heatmap', employee, 'get', path('calendar_heatmap'), None),
+            'calendar_heatmap (team)': ('calendar_heatmap', manager, 'get', path('calendar_heatmap', query='?team=1'), None),
+            'calendar_heatmap (director)': ('calendar_heatmap', director, 'get', path('calendar_heatmap', query='?team=1'), None),
+            'live_attendance': ('live_attendance', manager, 'get', path('live_attendance'), None),
+            'attendance_stream': ('attendance_stream', director, 'get', path('attendance_stream'), None),
+            'export_monthly_timesheet': ('export_monthly_timesheet', admin, 'get', path('export_monthly_timesheet'), None),
+            'export_monthly_timesheet (detail)': (
+                'export_monthly_timesheet', admin, 'get', path('export_monthly_timesheet', query='?mode=detail'), None,
+            ),
+            'request_report': ('request_report', admin, 'post', path('request_report'), None),
+            'report_status': (
+                'report_status', admin, 'get', path('report_status', report.pk), lambda i: {'headers': {'Accept': 'application/json'}},
+            ),
+            'report_download': ('report_download', admin, 'get', path('report_download', report.pk), None),
+            'view_user_timesheet': ('view_user_timesheet', manager, 'get', path('view_user_timesheet', employee.pk), None),
+            'edit_time_entry': ('edit_time_entry', manager, 'get', path('edit_time_entry', entry.pk), None),
+            'add_time_entry': ('add_time_entry', admin, 'get', path('add_time_entry'), None),
+            'bulk_edit_time_entries': ('bulk_edit_time_entries', manager, 'post', path('bulk_edit_time_entries'), bulk_edit),
+            'kiosk_scan': ('kiosk_scan', None, 'post', path('kiosk_scan'), lambda i: {**scan(i), 'headers': {'X-Kiosk-Key': self.kiosk_key}}),
+            'api_entries': ('api_entries', employee, 'get', path('api_entries'), None),
+            'api_totals': ('api_totals', employee, 'get', path('api_totals'), None),
+            'api_team_totals': ('api_team_totals', manager, 'get', path('api_team_totals'), None),
+            'metrics': ('metrics', admin, 'get', path('metrics'), None),
+            'kiosk_sync': ('kiosk_sync', None, 'post', path('kiosk_sync'), lambda i: {**sync(i), 'headers': {'X-Kiosk-Key': self.kiosk_key}}),
+        }
+
+    def measure(self, name, url_name, user, method, path, extra, iterations):
+        client = Client()
+        latencies, queries, status = [], 0, 0
+        # Reads may be routed to the replica: count the queries on both.
+        aliases = sorted({DEFAULT_DB_ALIAS, settings.REPLICA_DATABASE} - {None})
+        # The first request warms caches (role graph, templates) and is not counted.
+        for i in range(iterations + 1):
+            if user is not None and (i == 0 or url_name == 'logout'):
+                client.force_login(user)
+            kwargs = extra(i) if extra else {}
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in aliases]
+                started = time.perf_counter()
+                response = getattr(client, method)(path(i), **kwargs)
+                if response.streaming:
+                    if url_name == 'attendance_stream':
+                        # Endless: time the snapshot.
+                        next(iter(response.streaming_content))
+                    else:
+                        for _ in response.streaming_content:
+                            pass
+                response.close()
+                elapsed = time.perf_counter() - started
+            if i == 0:
+                continue
+            latencies.append(elapsed)
+            queries = max(queries, sum(
+                1 for capture in captured for query in capture.captured_queries
+                if not query['sql'].startswith(SAVEPOINT_STATEMENTS)
+            ))
+            status = max(status, response.status_code)
+
+        latencies.sort()
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            'p50_ms': percentiles[49] * 1000,
+            'p95_ms': percentiles[94] * 1000,
+            'max_ms': latencies[-1] * 1000,
+            'queries': queries,
+            'status': status,
+        }
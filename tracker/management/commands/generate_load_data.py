@@ -0,0 +1,147 @@
+import math
+import random
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from tracker.models import CheckInCheckOut, CustomUser, ManagedRole, QRCode, Role, TimeEntryLog, resolve_timezone
+from tracker.permissions import invalidate_role_graph
+from tracker.rollups import rebuild_daily_hours
+
+# Most staff follow the server time zone; some teams sit elsewhere.
+TIME_ZONES = ['', '', '', 'Europe/Berlin', 'America/New_York']
+SHIFT_STARTS = [time(6), time(8), time(9), time(9), time(10), time(14)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic users, a two-level manager hierarchy, QR codes and years of '
+        'check-in/check-out history for benchmarking. All names start with --prefix.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--team-size', type=int, default=25, help='Users per team, including its manager.')
+        parser.add_argument('--years', type=float, default=1.0, help='Length of the generated history.')
+        parser.add_argument('--prefix', default='load-')
+        parser.add_argument('--password', default='password', help='Password of every generated user.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', help='Remove previously generated data first.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if CustomUser.objects.filter(username__startswith=prefix).exists():
+            if not options['clear']:
+                raise CommandError(f"Users named '{prefix}*' already exist; run with --clear to replace them.")
+            CustomUser.objects.filter(username__startswith=prefix).delete()
+            Role.objects.filter(name__startswith=prefix).delete()
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        users, managers = self.create_people(prefix, options['users'], options['team_size'], options['password'])
+        entries, logs = self.create_history(users, managers, options['years'])
+
+        rollups = rebuild_daily_hours([user.pk for user in users])
+        invalidate_role_graph()
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(users)} users in {len({manager.pk for manager in managers.values()})} teams, {entries} time entries, "
+            f"{logs} edit log rows and {rollups} daily rollup rows."
+        ))
+
+    @transaction.atomic
+    def create_people(self, prefix, user_count, team_size, password):
+        password = make_password(password)
+        teams = max(1, math.ceil(max(user_count - 2, 1) / team_size))
+
+        director_role = Role.objects.create(name=f'{prefix}director')
+        manager_roles = Role.objects.bulk_create([Role(name=f'{prefix}manager-{team}') for team in range(teams)])
+        employee_roles = Role.objects.bulk_create([Role(name=f'{prefix}employee-{team}') for team in range(teams)])
+        ManagedRole.objects.bulk_create(
+            [ManagedRole(manager_role=director_role, managed_role=role) for role in manager_roles]
+            + [ManagedRole(manager_role=manager, managed_role=employee) for manager, employee in zip(manager_roles, employee_roles)]
+        )
+
+        # An admin and a director over all team managers, then the teams.
+        people = [
+            (CustomUser(username=f'{prefix}admin', password=password, is_staff=True), None, None),
+            (CustomUser(username=f'{prefix}director', password=password), director_role, None),
+        ]
+        for i in range(max(user_count - 2, 1)):
+            team, seat = divmod(i, team_size)
+            time_zone = TIME_ZONES[team % len(TIME_ZONES)]
+            name, role = (f't{team}-manager', manager_roles[team]) if seat == 0 else (f't{team}-e{seat}', employee_roles[team])
+            people.append((CustomUser(username=f'{prefix}{name}', password=password, time_zone=time_zone), role, team))
+
+        users = CustomUser.objects.bulk_create([user for user, _, _ in people], batch_size=self.batch_size)
+        CustomUser.roles.through.objects.bulk_create(
+            [CustomUser.roles.through(customuser_id=user.pk, role_id=role.pk) for user, role, _ in people if role],
+            batch_size=self.batch_size,
+        )
+        QRCode.objects.bulk_create([QRCode(user=user) for user in users], batch_size=self.batch_size)
+
+        # Employees' edits are made by their team manager.
+        team_managers = {team: user for user, role, team in people if team is not None and role == manager_roles[team]}
+        managers = {user.pk: team_managers[team] for user, role, team in people if team is not None and role == employee_roles[team]}
+        return users, managers
+
+    def create_history(self, users, managers, years):
+        now = timezone.now()
+        first_day = (now - timedelta(days=round(365 * years))).date()
+        pending, entries, logs = [], 0, 0
+        for user in users:
+            tz = resolve_timezone(user.time_zone)
+            shift_start = self.rng.choice(SHIFT_STARTS)
+            day, today = first_day, now.astimezone(tz).date()
+            while day <= today:
+                # Weekdays only, with the odd day of leave.
+                if day.weekday() < 5 and self.rng.random() > 0.06:
+                    pending.extend(self.shift(user, day, shift_start, tz, now))
+                day += timedelta(days=1)
+                if len(pending) >= self.batch_size:
+                    entries, logs = entries + len(pending), logs + self.flush(pending, managers)
+                    pending = []
+        if pending:
+            entries, logs = entries + len(pending), logs + self.flush(pending, managers)
+        return entries, logs
+
+    def shift(self, user, day, shift_start, tz, now):
+        start = datetime.combine(day, shift_start, tzinfo=tz) + timedelta(minutes=self.rng.gauss(0, 12))
+        end = start + timedelta(hours=min(max(self.rng.gauss(8.25, 0.6), 4), 11))
+        parts = [(start, end)]
+        if self.rng.random() < 0.15:
+            # Clocked out for lunch.
+            lunch = start + timedelta(hours=4, minutes=self.rng.randint(-30, 30))
+            back = lunch + timedelta(minutes=self.rng.randint(30, 60))
+            parts = [(start, lunch), (back, end + (back - lunch))]
+
+        entries = []
+        for check_in, check_out in parts:
+            if check_in > now:
+                break
+            entries.append(CheckInCheckOut(user=user, check_in_time=check_in, check_out_time=check_out if check_out <= now else None))
+        return entries
+
+    @transaction.atomic
+    def flush(self, entries, managers):
+        CheckInCheckOut.objects.bulk_create(entries)
+        logs = []
+        for entry in entries:
+            editor = managers.get(entry.user_id)
+            if editor is None or entry.check_out_time is None or self.rng.random() >= 0.02:
+                continue
+            if self.rng.random() < 0.5:
+                # Forgot to check out; the manager filled it in.
+                old_check_in, old_check_out = entry.check_in_time, None
+            else:
+                old_check_in, old_check_out = entry.check_in_time - timedelta(minutes=self.rng.randint(5, 90)), entry.check_out_time
+            logs.append(TimeEntryLog(
+                entry=entry, edited_by=editor,
+                old_check_in=old_check_in, new_check_in=entry.check_in_time,
+                old_check_out=old_check_out, new_check_out=entry.check_out_time,
+            ))
+        TimeEntryLog.objects.bulk_create(logs)
+        return len(logs)
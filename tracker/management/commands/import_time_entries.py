@@ -0,0 +1,55 @@
+import csv
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.importer import EntryImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Import historical time entries from a CSV file (header: username,check_in_time,check_out_time) '
+        'or a .jsonl file of objects with the same keys. Use "-" to read CSV from stdin. Times without '
+        "a UTC offset are read in the user's time zone. Entries already stored are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=20000)
+        parser.add_argument('--rejects', help='Write rejected rows (line and reason) to this CSV file.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        importer = EntryImporter(chunk_size=options['chunk_size'])
+        started = time.perf_counter()
+
+        def progress(result):
+            rate = result.read / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(
+                f"{result.read} rows read, {result.imported} imported, {result.duplicates} duplicates, "
+                f"{len(result.rejected)} rejected ({rate:,.0f} rows/s)"
+            )
+
+        try:
+            with nullcontext(sys.stdin) if path == '-' else open(path, encoding='utf-8', newline='') as handle:
+                result = importer.run(read_rows(handle, path), progress)
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+
+        if options['rejects'] and result.rejected:
+            with open(options['rejects'], 'w', newline='') as out:
+                writer = csv.DictWriter(out, fieldnames=['line', 'reason'])
+                writer.writeheader()
+                writer.writerows(result.rejected)
+        for rejected in result.rejected[:20]:
+            self.stderr.write(f"Line {rejected['line']}: {rejected['reason']}")
+        if len(result.rejected) > 20:
+            self.stderr.write(f"... and {len(result.rejected) - 20} more rejected rows.")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.imported} of {result.read} rows in {elapsed:.1f}s "
+            f"({result.read / max(elapsed, 1e-9):,.0f} rows/s): {result.duplicates} duplicates, {len(result.rejected)} rejected."
+        ))
@@ -0,0 +1,79 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from tracker.models import CheckInCheckOut, CustomUser, QRCode
+
+USERNAME_PREFIX = 'kiosk-loadtest-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer the kiosk scan endpoint from several threads and report the sustained throughput. '
+        'Creates throw-away users in the configured database and removes them afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--scans', type=int, default=5000)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated users and entries.')
+
+    def handle(self, *args, **options):
+        if CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f"Users named '{USERNAME_PREFIX}*' already exist; remove them or run with a clean database.")
+
+        users = CustomUser.objects.bulk_create(
+            [CustomUser(username=f'{USERNAME_PREFIX}{i}') for i in range(options['users'])]
+        )
+        codes = [qr.qr_code for qr in QRCode.objects.bulk_create([QRCode(user=user) for user in users])]
+        api_key = uuid.uuid4().hex
+
+        def scan(i):
+            client = Client()
+            started = time.perf_counter()
+            response = client.post(
+                reverse('kiosk_scan'),
+                {'qr_code': str(codes[i % len(codes)])},
+                HTTP_X_KIOSK_KEY=api_key,
+                HTTP_IDEMPOTENCY_KEY=f'loadtest-{api_key}-{i}',
+            )
+            elapsed = time.perf_counter() - started
+            connection.close()
+            return response.status_code, elapsed
+
+        try:
+            # The in-process test client always sends Host: testserver.
+            with override_settings(KIOSK_API_KEYS=[api_key], ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                    results = list(pool.map(scan, range(options['scans'])))
+                wall = time.perf_counter() - started
+
+            failures = sum(1 for status, _ in results if status != 200)
+            latencies = sorted(elapsed for _, elapsed in results)
+            percentiles = statistics.quantiles(latencies, n=100)
+            duplicated = (
+                CheckInCheckOut.objects.filter(user__in=users, check_out_time__isnull=True)
+                .values('user').annotate(open_entries=Count('id')).filter(open_entries__gt=1).count()
+            )
+
+            self.stdout.write(f"Scans:      {len(results)} over {options['threads']} threads, {failures} failed")
+            self.stdout.write(f"Throughput: {len(results) / wall:.1f} scans/s")
+            self.stdout.write(
+                f"Latency:    p50 {percentiles[49] * 1000:.1f} ms, p95 {percentiles[94] * 1000:.1f} ms, "
+                f"p99 {percentiles[98] * 1000:.1f} ms"
+            )
+            self.stdout.write(f"Users with more than one open entry: {duplicated}")
+        finally:
+            if not options['keep']:
+                CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).delete()
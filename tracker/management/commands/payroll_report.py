@@ -0,0 +1,41 @@
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tracker.payroll import write_report
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the payroll report (hours, overtime and open entries per user and day) as CSV. Users are '
+        'split into shards that are computed by --processes worker processes; the output does not depend '
+        'on the number of processes or shards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='CSV file to write.')
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help='First day (default: first of this month).')
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help='Last day (default: end of this month).')
+        parser.add_argument('--processes', type=int, default=settings.PAYROLL_PROCESSES)
+        parser.add_argument('--shards', type=int, help='Number of user shards (default: 4 per process).')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        start = options['start'] or today.replace(day=1)
+        end = options['end'] or (today.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        if end < start:
+            raise CommandError('--to is before --from.')
+
+        started = time.perf_counter()
+        try:
+            with open(options['output'], 'wb') as out:
+                shards = write_report(out, start, end, processes=options['processes'], shards=options['shards'])
+        except OSError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote payroll for {start} to {end} in {time.perf_counter() - started:.2f}s "
+            f"({shards} shards, {options['processes']} processes)."
+        ))
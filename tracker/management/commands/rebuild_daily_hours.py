@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker import usercache
+from tracker.models import CustomUser
+from tracker.rollups import rebuild_daily_hours
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user, per-day hours rollup from the check-in/check-out entries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', help='Only rebuild this user (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            users = dict(CustomUser.objects.filter(username__in=options['usernames']).values_list('username', 'id'))
+            missing = set(options['usernames']) - users.keys()
+            if missing:
+                raise CommandError(f"Unknown user(s): {', '.join(sorted(missing))}")
+            user_ids = list(users.values())
+
+        created = rebuild_daily_hours(user_ids, batch_size=options['batch_size'])
+        if user_ids is None:
+            usercache.invalidate_all()
+        else:
+            usercache.invalidate(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} daily rollup rows."))
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tracker import jobs
+
+# How often the stale-job and retention sweeps run, in seconds.
+SWEEP_INTERVAL = 60
+
+
+def _run_in_child(job):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if not apps.ready:
+        django.setup()
+    try:
+        jobs.execute(job)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued report jobs. Each job runs in a child process, at most --processes at a time, and is '
+        'killed and retried after REPORT_JOB_TIMEOUT seconds. Start as many workers as needed, on any host.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.REPORT_WORKER_PROCESSES,
+                            help='Jobs run at once. 0 runs them one by one in this process, without a timeout.')
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        # Stop cleanly on SIGTERM, like on Ctrl-C.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.stdout.write(f'Worker {self.worker} started with {options["processes"]} process(es).')
+        if options['processes'] == 0:
+            self.run_inline(options['poll_interval'], options['burst'])
+        else:
+            self.supervise(options['processes'], options['poll_interval'], options['burst'])
+
+    def sweep(self):
+        reclaimed, purged = jobs.reclaim_stale(), jobs.purge()
+        if reclaimed or purged:
+            self.stdout.write(f'Reclaimed {reclaimed} stale job(s), purged {purged} old job(s).')
+
+    def run_inline(self, poll_interval, burst):
+        last_sweep = 0
+        while True:
+            if time.monotonic() - last_sweep > SWEEP_INTERVAL:
+                self.sweep()
+                last_sweep = time.monotonic()
+            job = jobs.claim(self.worker)
+            if job is not None:
+                jobs.execute(job)
+                self.report(job)
+            elif burst:
+                return
+            else:
+                time.sleep(poll_interval)
+
+    def supervise(self, processes, poll_interval, burst):
+        context = multiprocessing.get_context()
+        running = {}
+        last_sweep = 0
+        try:
+            while True:
+                for process, (job, deadline) in list(running.items()):
+                    if process.is_alive() and time.monotonic() < deadline:
+                        continue
+                    if process.is_alive():
+                        process.kill()
+                        error = f'timed out after {settings.REPORT_JOB_TIMEOUT} seconds'
+                    else:
+                        error = f'worker process exited with code {process.exitcode}'
+                    process.join()
+                    del running[process]
+                    # A no-op when the child already stored its result.
+                    jobs.fail(job, error)
+                    self.report(job)
+
+                if time.monotonic() - last_sweep > SWEEP_INTERVAL:
+                    self.sweep()
+                    last_sweep = time.monotonic()
+
+                claimed = None
+                while len(running) < processes and (claimed := jobs.claim(self.worker)) is not None:
+                    # The child must open its own database connections.
+                    connections.close_all()
+                    process = context.Process(target=_run_in_child, args=(claimed,))
+                    process.start()
+                    running[process] = (claimed, time.monotonic() + settings.REPORT_JOB_TIMEOUT)
+
+                if burst and not running and claimed is None:
+                    return
+                time.sleep(poll_interval if claimed is None else 0.1)
+        finally:
+            for process, (job, _) in running.items():
+                process.terminate()
+                process.join()
+                jobs.release(job)
+
+    def report(self, job):
+        job.refresh_from_db()
+        self.stdout.write(f'Job {job.pk} ({job.kind}): {job.status}, attempt {job.attempts} of {job.max_attempts}.')
@@ -0,0 +1,44 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.kiosk import ingest_scan_events
+
+
+def read_events(path):
+    with open(path, encoding='utf-8') as handle:
+        if path.endswith('.jsonl'):
+            for number, line in enumerate(handle, 1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as error:
+                        raise CommandError(f"{path}:{number}: {error}")
+        else:
+            data = json.load(handle)
+            yield from data['events'] if isinstance(data, dict) else data
+
+
+class Command(BaseCommand):
+    help = (
+        'Ingest scan events buffered by an offline kiosk. Accepts a JSON list (or {"events": [...]}) '
+        'or a .jsonl file of {"event_id", "device_id", "qr_code", "event_time"} objects.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=settings.KIOSK_SYNC_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            result = ingest_scan_events(read_events(options['path']), chunk_size=options['chunk_size'])
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(str(error))
+
+        for rejected in result.rejected:
+            self.stderr.write(f"Rejected {rejected.get('event_id', rejected.get('event'))}: {rejected['reason']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Received {result.received} events: {result.checked_in} check-ins, {result.checked_out} check-outs, "
+            f"{result.duplicates} duplicates, {len(result.rejected)} rejected."
+        ))
@@ -0,0 +1,179 @@
+"""
+In-process request metrics, exported in the Prometheus text format.
+
+Each worker process keeps its own histograms; Prometheus scrapes every worker
+and sums them. Database and template timings are attributed to the request
+running in the current context, so they also follow sync_to_async hops.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.backends import django as django_backend
+
+slow_query_logger = logging.getLogger('tracker.db.slow')
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+UNRESOLVED_VIEW = 'unresolved'
+
+_current = ContextVar('tracker_request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    METRICS = {
+        'tracker_request_duration_seconds': ('Time until the response was complete, per view.', SECONDS_BUCKETS),
+        'tracker_db_queries': ('Database queries per request, per view.', QUERY_BUCKETS),
+        'tracker_db_duration_seconds': ('Time spent in database queries per request, per view.', SECONDS_BUCKETS),
+        'tracker_template_render_seconds': ('Time spent rendering templates per request, per view.', SECONDS_BUCKETS),
+        'tracker_response_size_bytes': ('Response body size, per view.', SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name in self.METRICS}
+            self._responses = {}
+
+    def record(self, stats, status_code):
+        values = {
+            'tracker_request_duration_seconds': stats.duration,
+            'tracker_db_queries': stats.queries,
+            'tracker_db_duration_seconds': stats.db_time,
+            'tracker_template_render_seconds': stats.template_time,
+            'tracker_response_size_bytes': stats.size,
+        }
+        with self._lock:
+            for name, value in values.items():
+                histograms = self._histograms[name]
+                if stats.view not in histograms:
+                    histograms[stats.view] = Histogram(self.METRICS[name][1])
+                histograms[stats.view].observe(value)
+            key = (stats.view, status_code)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def render(self):
+        lines = [
+            '# HELP tracker_responses_total Responses sent, per view and status code.',
+            '# TYPE tracker_responses_total counter',
+        ]
+        with self._lock:
+            for (view, status_code), count in sorted(self._responses.items()):
+                lines.append(f'tracker_responses_total{{view="{_escape(view)}",status="{status_code}"}} {count}')
+            for name, (help_text, buckets) in self.METRICS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for view, histogram in sorted(self._histograms[name].items()):
+                    label = f'view="{_escape(view)}"'
+                    cumulative = 0
+                    for bound, count in zip([*buckets, '+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class RequestStats:
+    def __init__(self, request):
+        self.request = request
+        self.started = time.perf_counter()
+        self.duration = 0
+        self.queries = 0
+        self.db_time = 0
+        self.template_time = 0
+        self.size = 0
+
+    @property
+    def view(self):
+        match = getattr(self.request, 'resolver_match', None)
+        # Unnamed URL patterns get the dotted path of their view as view_name.
+        return match.view_name if match else UNRESOLVED_VIEW
+
+
+def start_request(request):
+    stats = RequestStats(request)
+    _current.set(stats)
+    return stats
+
+
+def finish_request(stats, status_code):
+    stats.duration = time.perf_counter() - stats.started
+    registry.record(stats, status_code)
+    _current.set(None)
+
+
+def instrument_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+        if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+            slow_query_logger.warning(
+                'Slow query (%.1f ms) in view %s: %s', elapsed * 1000,
+                stats.view if stats is not None else '-', sql,
+            )
+
+
+def install_query_instrumentation(sender, connection, **kwargs):
+    if instrument_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrument_query)
+
+
+class Template:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.template_time += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The stock Django template backend, timing every render for the metrics."""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name))
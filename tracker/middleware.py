@@ -0,0 +1,172 @@
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import tracemalloc
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics, routers
+
+profile_logger = logging.getLogger('tracker.profile')
+
+PROFILERS = ('cprofile', 'tracemalloc')
+
+# Profiling slows the request down and tracemalloc traces the whole process,
+# so only one request is profiled at a time; others run unprofiled.
+_profiling = threading.Lock()
+
+
+class Profiler:
+    def __init__(self, mode):
+        self.mode = mode
+
+    @classmethod
+    def start(cls, request, user):
+        mode = request.headers.get('X-Profile')
+        if not settings.METRICS_PROFILING or mode not in PROFILERS or not user.is_staff:
+            return None
+        if not _profiling.acquire(blocking=False):
+            return None
+        profiler = cls(mode)
+        if mode == 'cprofile':
+            profiler.profile = cProfile.Profile()
+            profiler.profile.enable()
+        else:
+            profiler.was_tracing = tracemalloc.is_tracing()
+            if not profiler.was_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            profiler.before = tracemalloc.take_snapshot()
+        return profiler
+
+    def stop(self, view, response):
+        try:
+            if self.mode == 'cprofile':
+                self.profile.disable()
+                out = io.StringIO()
+                pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(30)
+                report = out.getvalue()
+            else:
+                peak = tracemalloc.get_traced_memory()[1]
+                growth = tracemalloc.take_snapshot().compare_to(self.before, 'lineno')[:20]
+                if not self.was_tracing:
+                    tracemalloc.stop()
+                report = f'peak {peak} bytes\n' + '\n'.join(str(stat) for stat in growth)
+                response['X-Profile-Memory-Peak'] = str(peak)
+            response['X-Profile'] = self.mode
+            profile_logger.info('%s profile of view %s:\n%s', self.mode, view, report)
+        finally:
+            _profiling.release()
+
+
+class MetricsMiddleware:
+    """
+    Record query count and time, template time, latency and size per view.
+
+    Send "X-Profile: cprofile" or "X-Profile: tracemalloc" as a staff user to
+    log a profile of the request, when METRICS_PROFILING is on. cProfile only
+    sees the thread the request started in, so under ASGI it covers the
+    async code but not sync views run in the thread pool.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = metrics.start_request(request)
+        profiler = Profiler.start(request, request.user) if 'X-Profile' in request.headers else None
+        response = self.get_response(request)
+        return self.finish(stats, profiler, response)
+
+    async def __acall__(self, request):
+        stats = metrics.start_request(request)
+        profiler = Profiler.start(request, await request.auser()) if 'X-Profile' in request.headers else None
+        response = await self.get_response(request)
+        return self.finish(stats, profiler, response)
+
+    def finish(self, stats, profiler, response):
+        if profiler is not None:
+            profiler.stop(stats.view, response)
+        if not response.streaming:
+            stats.size = len(response.content)
+            metrics.finish_request(stats, response.status_code)
+        elif response.is_async:
+            response.streaming_content = _acount(response.streaming_content, stats, response.status_code)
+        else:
+            response.streaming_content = _count(response.streaming_content, stats, response.status_code)
+        return response
+
+
+# Streaming responses are recorded once the body has been sent (or abandoned).
+def _count(chunks, stats, status_code):
+    try:
+        for chunk in chunks:
+            stats.size += len(chunk)
+            yield chunk
+    finally:
+        metrics.finish_request(stats, status_code)
+
+
+async def _acount(chunks, stats, status_code):
+    try:
+        async for chunk in chunks:
+            stats.size += len(chunk)
+            yield chunk
+    finally:
+        metrics.finish_request(stats, status_code)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Track whether a request wrote to the primary database, for routers.ReplicaRouter.
+
+    A request that wrote sets a short-lived cookie, and requests carrying it
+    read from the primary, so a client sees its own writes despite replication
+    lag. Put it before SessionMiddleware so session saves count as writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state, token = routers.start_request(pinned=routers.STICKY_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.finish_request(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = routers.start_request(pinned=routers.STICKY_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.finish_request(token)
+        return self.finish(state, response)
+
+    def finish(self, state, response):
+        if state.wrote and settings.REPLICA_DATABASE:
+            response.set_cookie(
+                routers.STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:22
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_daily_hours(apps, schema_editor):
+    CheckInCheckOut = apps.get_model('tracker', 'CheckInCheckOut')
+    DailyHours = apps.get_model('tracker', 'DailyHours')
+    rows = (
+        CheckInCheckOut.objects.filter(check_out_time__isnull=False)
+        .annotate(day=TruncDate('check_in_time'))
+        .values('user_id', 'day')
+        .annotate(duration=Sum(ExpressionWrapper(F('check_out_time') - F('check_in_time'), output_field=DurationField())))
+        .order_by()
+    )
+    DailyHours.objects.bulk_create(
+        (DailyHours(user_id=row['user_id'], day=row['day'], duration=row['duration']) for row in rows.iterator()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0003_alter_checkincheckout_check_in_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('duration', models.DurationField(default=datetime.timedelta)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_daily_hours_per_user')],
+            },
+        ),
+        migrations.RunPython(populate_daily_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:25
+
+import tracker.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0004_dailyhours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='time_zone',
+            field=models.CharField(blank=True, help_text="IANA time zone used to bucket this user's hours into days, e.g. Europe/Berlin. Defaults to the site time zone.", max_length=64, validators=[tracker.models.validate_time_zone]),
+        ),
+        migrations.AddIndex(
+            model_name='checkincheckout',
+            index=models.Index(fields=['user', 'check_in_time'], name='checkin_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkincheckout',
+            index=models.Index(fields=['check_in_time'], name='checkin_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkincheckout',
+            index=models.Index(condition=models.Q(('check_out_time__isnull', True)), fields=['user'], name='checkin_open_entry_idx'),
+        ),
+    ]
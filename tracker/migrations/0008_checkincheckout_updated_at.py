@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0007_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkincheckout',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
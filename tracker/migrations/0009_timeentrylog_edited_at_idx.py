@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_checkincheckout_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timeentrylog',
+            index=models.Index(fields=['edited_at'], name='timeentrylog_edited_at_idx'),
+        ),
+    ]
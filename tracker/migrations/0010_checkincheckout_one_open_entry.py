@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:40
+
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Now
+
+
+def close_duplicate_open_entries(apps, schema_editor):
+    if not schema_editor.connection.features.supports_partial_indexes:
+        return
+    CheckInCheckOut = apps.get_model('tracker', 'CheckInCheckOut')
+    open_entries = CheckInCheckOut.objects.filter(check_out_time__isnull=True)
+    newer = open_entries.filter(user_id=OuterRef('user_id')).filter(
+        Q(check_in_time__gt=OuterRef('check_in_time')) | Q(check_in_time=OuterRef('check_in_time'), pk__gt=OuterRef('pk')),
+    )
+    # Keep each user's newest open entry. The older ones are double scans;
+    # closing them at their own check-in adds no hours to the rollup.
+    open_entries.filter(Exists(newer)).update(check_out_time=F('check_in_time'), updated_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_timeentrylog_edited_at_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_open_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='checkincheckout',
+            constraint=models.UniqueConstraint(condition=models.Q(('check_out_time__isnull', True)), fields=('user',), name='checkin_one_open_entry', violation_error_message='This user already has an open time entry.'),
+        ),
+        migrations.RemoveIndex(
+            model_name='checkincheckout',
+            name='checkin_open_entry_idx',
+        ),
+    ]
@@ -1,7 +1,24 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.utils import timezone
+from datetime import timedelta
 import uuid
+import zoneinfo
+
+def resolve_timezone(name):
+    if name:
+        try:
+            return zoneinfo.ZoneInfo(name)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            pass
+    return timezone.get_default_timezone()
+
+def validate_time_zone(value):
+    try:
+        zoneinfo.ZoneInfo(value)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f"'{value}' is not a known time zone.")
 
 class Role(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -25,22 +42,55 @@ class ManagedRole(models.Model):
 
 class CustomUser(AbstractUser):
     roles = models.ManyToManyField(Role, blank=True)
+    time_zone = models.CharField(
+        max_length=64, blank=True, validators=[validate_time_zone],
+        help_text='IANA time zone used to bucket this user\'s hours into days, e.g. Europe/Berlin. Defaults to the site time zone.'
+    )
+    # Moved by every save except a login's; the export reuse stamp relies on it.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_time_zone = instance.__dict__.get('time_zone')
+        return instance
+
+    @property
+    def tzinfo(self):
+        return resolve_timezone(self.time_zone)
+
+    def _role_graph(self):
+        # Memoized on the instance, so a request asks for the graph once
+        graph = getattr(self, '_role_graph_cache', None)
+        if graph is None:
+            from .permissions import role_graph
+            graph = self._role_graph_cache = role_graph()
+        return graph
 
     @property
     def is_manager(self):
-        manager_roles = ManagedRole.objects.values_list('manager_role', flat=True)
-        user_roles = self.roles.all()
-        return any(role.id in manager_roles for role in user_roles)
+        return self._role_graph().is_manager(self.pk)
+
+    @property
+    def managed_user_ids(self):
+        return self._role_graph().managed_user_ids(self.pk)
+
+    def can_manage(self, user_id):
+        """
+        Whether the user's roles manage one of ``user_id``'s roles. Without a
+        shared cache, a role change made by another worker (such as revoking
+        a manager) is seen here only after up to ROLE_GRAPH_TIMEOUT seconds.
+        """
+        return user_id in self.managed_user_ids
 
     @property
     def managed_users(self):
-        if not self.is_manager:
+        managed_role_ids = self._role_graph().managed_role_ids(self.pk)
+        if not managed_role_ids:
             return CustomUser.objects.none()
 
-        managed_roles_qs = ManagedRole.objects.filter(manager_role__in=self.roles.all())
-        managed_roles_ids = managed_roles_qs.values_list('managed_role_id', flat=True)
-        
-        return CustomUser.objects.filter(roles__id__in=managed_roles_ids)
+        members = CustomUser.roles.through.objects.filter(role_id__in=managed_role_ids)
+        return CustomUser.objects.filter(pk__in=members.values('customuser_id'))
 
     def __str__(self):
         return self.username
@@ -49,6 +99,31 @@ class CheckInCheckOut(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     check_in_time = models.DateTimeField(default=timezone.now)
     check_out_time = models.DateTimeField(null=True, blank=True)
+    # Bulk writers (bulk_update, raw UPDATEs) must set it themselves; the API's ETags rely on it.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'check_in_time'], name='checkin_user_time_idx'),
+            models.Index(fields=['check_in_time'], name='checkin_time_idx'),
+        ]
+        constraints = [
+            # At most one open entry per user; kiosk.check_in() relies on it to stay race-free.
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(check_out_time__isnull=True), name='checkin_one_open_entry',
+                violation_error_message='This user already has an open time entry.',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so the daily rollup can also refresh
+        # the day (or user) an edited entry was moved away from.
+        instance._loaded_user_id = instance.__dict__.get('user_id')
+        instance._loaded_check_in_time = instance.__dict__.get('check_in_time')
+        instance._loaded_check_out_time = instance.__dict__.get('check_out_time')
+        return instance
 
     @property
     def duration(self):
@@ -59,6 +134,23 @@ class CheckInCheckOut(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.check_in_time}"
 
+class DailyHours(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    day = models.DateField()
+    duration = models.DurationField(default=timedelta)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_daily_hours_per_user'),
+        ]
+
+    @property
+    def hours(self):
+        return self.duration.total_seconds() / 3600
+
+    def __str__(self):
+        return f"{self.user_id} - {self.day}: {self.hours:.2f}h"
+
 class QRCode(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     qr_code = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -74,4 +166,52 @@ class TimeEntryLog(models.Model):
     old_check_in = models.DateTimeField()
     new_check_in = models.DateTimeField()
     old_check_out = models.DateTimeField(null=True, blank=True)
-    new_check_out = models.DateTimeField(null=True, blank=True)
\ No newline at end of file
+    new_check_out = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['edited_at'], name='timeentrylog_edited_at_idx'),
+        ]
+
+class ScanEvent(models.Model):
+    event_id = models.CharField(max_length=64, unique=True)
+    device_id = models.CharField(max_length=64)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    event_time = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.event_id} from {self.device_id} at {self.event_time}"
+
+class ReportJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)
+    # Hash of the kind, parameters and data version; equal keys share one artifact.
+    cache_key = models.CharField(max_length=64, db_index=True)
+    requested_by = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    artifact = models.FileField(upload_to='reports/', blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_after'], condition=models.Q(status='queued'), name='reportjob_queued_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
@@ -0,0 +1,129 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+
+def estimate_count(queryset, exact_below=0):
+    """
+    Row estimate from the PostgreSQL planner, or an exact count elsewhere.
+    Estimates below ``exact_below`` are replaced by an exact count, which is
+    cheap for so few rows.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = plan[0]['Plan']['Plan Rows']
+    return queryset.count() if estimate < exact_below else estimate
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Page-number paginator whose total is the planner's estimate, for admin
+    changelists of tables too large to COUNT(*) on every page view.
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        return estimate_count(self.object_list, self.exact_below)
+
+
+def encode_cursor(instance, field, direction):
+    payload = json.dumps([getattr(instance, field).isoformat(), instance.pk, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, pk, direction = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev'):
+            return None
+        return datetime.fromisoformat(value), int(pk), direction
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous, count=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if self.has_next:
+            return encode_cursor(self.object_list[-1], self.paginator.field, 'next')
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous:
+            return encode_cursor(self.object_list[0], self.paginator.field, 'prev')
+        return None
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset newest first on (field, pk) using opaque cursors.
+
+    Every page is a bounded index range scan, so deep pages cost the same as
+    the first one. There are no page numbers; the total is only available as
+    an estimate on request.
+    """
+
+    def __init__(self, queryset, per_page, field='check_in_time'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+
+    def get_page(self, token=None, with_count=False):
+        cursor = decode_cursor(token) if token else None
+        field = self.field
+
+        if cursor is None:
+            rows = list(self.queryset.order_by(f'-{field}', '-pk')[:self.per_page + 1])
+            has_next, has_previous = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        else:
+            value, pk, direction = cursor
+            if direction == 'next':
+                older = Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+                rows = list(
+                    self.queryset.filter(older, **{f'{field}__lte': value}).order_by(f'-{field}', '-pk')[:self.per_page + 1]
+                )
+                has_next, has_previous = len(rows) > self.per_page, True
+                rows = rows[:self.per_page]
+            else:
+                newer = Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+                rows = list(
+                    self.queryset.filter(newer, **{f'{field}__gte': value}).order_by(field, 'pk')[:self.per_page + 1]
+                )
+                has_next, has_previous = True, len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+
+        count = estimate_count(self.queryset) if with_count else None
+        return KeysetPage(rows, self, has_next, has_previous, count)
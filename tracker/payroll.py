@@ -0,0 +1,127 @@
+"""
+Month-end payroll report, computed in shards of users by a pool of processes.
+
+Users are split into contiguous runs of the username order, and each shard
+writes its users' rows without looking at the others. Concatenating the
+shard outputs in order therefore gives the same bytes whatever the number
+of shards or processes.
+"""
+import csv
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta, timezone
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+from .exports import Echo
+from .models import CheckInCheckOut, CustomUser, DailyHours, resolve_timezone
+from .rollups import day_range, entry_day
+
+HEADER = ['Username', 'Date', 'Hours', 'Overtime Hours', 'Open Entries']
+TOTAL = 'Total'
+
+# Shards are queried with IN lists of their user ids, so keep them bounded.
+MAX_SHARD_USERS = 2000
+
+
+def _hours(duration):
+    return f"{duration.total_seconds() / 3600:.2f}"
+
+
+def shard_bounds(usernames, shards):
+    """Split the ordered usernames into at most ``shards`` half-open [lower, upper) ranges."""
+    size = max(1, -(-len(usernames) // max(1, shards)))
+    lowers = usernames[size::size]
+    return list(zip([None, *lowers], [*lowers, None]))
+
+
+def shard_lines(lower, upper, start, end):
+    """
+    Yield the CSV lines of the users in [lower, upper): one line per day with
+    hours or open entries, then the user's total line.
+    """
+    overtime_after = timedelta(hours=settings.PAYROLL_OVERTIME_DAILY_HOURS)
+    users = CustomUser.objects.order_by('username')
+    if lower is not None:
+        users = users.filter(username__gte=lower)
+    if upper is not None:
+        users = users.filter(username__lt=upper)
+    users = list(users.values_list('id', 'username', 'time_zone'))
+    timezones = {user_id: resolve_timezone(time_zone) for user_id, _, time_zone in users}
+
+    hours = defaultdict(dict)
+    rollups = DailyHours.objects.filter(user_id__in=timezones, day__gte=start, day__lte=end)
+    for user_id, day, duration in rollups.values_list('user_id', 'day', 'duration').iterator(chunk_size=5000):
+        hours[user_id][day] = duration
+
+    # Open entries are bucketed by the owner's local day, so read a day more on each side.
+    open_entries = defaultdict(Counter)
+    lower_time, upper_time = day_range(start - timedelta(days=1), end + timedelta(days=1), timezone.utc)
+    entries = CheckInCheckOut.objects.filter(
+        user_id__in=timezones, check_out_time__isnull=True, check_in_time__gte=lower_time, check_in_time__lt=upper_time,
+    )
+    for user_id, check_in in entries.values_list('user_id', 'check_in_time'):
+        day = entry_day(check_in, timezones[user_id])
+        if start <= day <= end:
+            open_entries[user_id][day] += 1
+
+    writer = csv.writer(Echo())
+    for user_id, username, _ in users:
+        total = overtime = timedelta()
+        for day in sorted(hours[user_id].keys() | open_entries[user_id].keys()):
+            worked = hours[user_id].get(day, timedelta())
+            extra = max(worked - overtime_after, timedelta())
+            total += worked
+            overtime += extra
+            yield writer.writerow([username, day.isoformat(), _hours(worked), _hours(extra), open_entries[user_id][day]])
+        yield writer.writerow([username, TOTAL, _hours(total), _hours(overtime), sum(open_entries[user_id].values())])
+
+
+def _init_worker():
+    if not apps.ready:
+        django.setup()
+
+
+def _write_shard(lower, upper, start, end, path):
+    with open(path, 'wb') as out:
+        for line in shard_lines(lower, upper, start, end):
+            out.write(line.encode('utf-8'))
+
+
+def write_report(out, start, end, processes=1, shards=None):
+    """
+    Write the payroll CSV of the inclusive date range to the binary file ``out``.
+
+    With more than one process, every shard is computed in a worker process
+    with its own database connection, and the shard files are appended in
+    order.
+    """
+    usernames = list(CustomUser.objects.order_by('username').values_list('username', flat=True))
+    bounds = shard_bounds(usernames, max(shards or processes * 4, -(-len(usernames) // MAX_SHARD_USERS)))
+    out.write(csv.writer(Echo()).writerow(HEADER).encode('utf-8'))
+
+    if processes <= 1:
+        for lower, upper in bounds:
+            for line in shard_lines(lower, upper, start, end):
+                out.write(line.encode('utf-8'))
+        return len(bounds)
+
+    # Forked workers must not share this process's connections.
+    connections.close_all()
+    with tempfile.TemporaryDirectory() as directory, ProcessPoolExecutor(
+        processes, mp_context=multiprocessing.get_context(), initializer=_init_worker,
+    ) as pool:
+        paths = [os.path.join(directory, f'{number}.csv') for number in range(len(bounds))]
+        futures = [pool.submit(_write_shard, lower, upper, start, end, path) for (lower, upper), path in zip(bounds, paths)]
+        for future, path in zip(futures, paths):
+            future.result()
+            with open(path, 'rb') as shard:
+                shutil.copyfileobj(shard, out)
+    return len(bounds)
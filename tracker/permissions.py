@@ -0,0 +1,106 @@
+import threading
+import uuid
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import CustomUser, ManagedRole
+
+GRAPH_VERSION_KEY = 'tracker:role-graph-version'
+
+_lock = threading.Lock()
+_graph = None
+
+
+class RoleGraph:
+    """Snapshot of which roles manage which, and which users hold each role."""
+
+    def __init__(self, version, manages, user_roles):
+        self.version = version
+        self.manages = manages
+        self.user_roles = user_roles
+        self.role_users = defaultdict(set)
+        for user_id, role_ids in user_roles.items():
+            for role_id in role_ids:
+                self.role_users[role_id].add(user_id)
+        self._managed_user_ids = {}
+
+    @classmethod
+    def load(cls, version):
+        # From the primary even inside replica-routed views: the graph is shared
+        # by later requests and must not lag behind a role change.
+        manages = defaultdict(set)
+        for manager_role_id, managed_role_id in ManagedRole.objects.using(DEFAULT_DB_ALIAS).values_list('manager_role_id', 'managed_role_id'):
+            manages[manager_role_id].add(managed_role_id)
+
+        user_roles = defaultdict(set)
+        for user_id, role_id in CustomUser.roles.through.objects.using(DEFAULT_DB_ALIAS).values_list('customuser_id', 'role_id'):
+            user_roles[user_id].add(role_id)
+
+        return cls(version, dict(manages), dict(user_roles))
+
+    def is_manager(self, user_id):
+        return any(role_id in self.manages for role_id in self.user_roles.get(user_id, ()))
+
+    def managed_role_ids(self, user_id):
+        managed = set()
+        for role_id in self.user_roles.get(user_id, ()):
+            managed |= self.manages.get(role_id, set())
+        return managed
+
+    def managed_user_ids(self, user_id):
+        try:
+            return self._managed_user_ids[user_id]
+        except KeyError:
+            pass
+        managed = set()
+        for role_id in self.managed_role_ids(user_id):
+            managed |= self.role_users.get(role_id, set())
+        managed = self._managed_user_ids[user_id] = frozenset(managed)
+        return managed
+
+
+def role_graph():
+    """
+    Return the current graph, reloading it if any process invalidated it, or
+    once its version expires (the only way a per-process cache sees a change
+    made by another process).
+    """
+    global _graph
+    version = cache.get(GRAPH_VERSION_KEY)
+    graph = _graph
+    if graph is not None and version is not None and graph.version == version:
+        return graph
+
+    with _lock:
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(GRAPH_VERSION_KEY, version, settings.ROLE_GRAPH_TIMEOUT)
+            version = cache.get(GRAPH_VERSION_KEY, version)
+        if _graph is None or _graph.version != version:
+            _graph = RoleGraph.load(version)
+        return _graph
+
+
+async def arole_graph():
+    version = await cache.aget(GRAPH_VERSION_KEY)
+    graph = _graph
+    if graph is not None and version is not None and graph.version == version:
+        return graph
+    return await sync_to_async(role_graph)()
+
+
+def _bump_version():
+    global _graph
+    cache.set(GRAPH_VERSION_KEY, uuid.uuid4().hex, settings.ROLE_GRAPH_TIMEOUT)
+    _graph = None
+
+
+def invalidate_role_graph():
+    _bump_version()
+    # Bump again once the change is visible to other connections, so no process
+    # keeps a graph it loaded from the not yet committed state.
+    transaction.on_commit(_bump_version)
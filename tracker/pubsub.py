@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """
+    Buffer of published events for one listener.
+
+    A listener that falls more than maxsize events behind loses its buffer and
+    is flagged as overflowed, so it can resynchronise instead of blocking the
+    publisher.
+    """
+
+    def __init__(self, broker, maxsize):
+        self.broker = broker
+        self.maxsize = maxsize
+        self.overflowed = False
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = None
+        self._async_ready = None
+
+    def put(self, event):
+        with self._lock:
+            if len(self._events) >= self.maxsize:
+                self._events.clear()
+                self.overflowed = True
+            else:
+                self._events.append(event)
+            loop, async_ready = self._loop, self._async_ready
+        self._ready.set()
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(async_ready.set)
+            except RuntimeError:
+                # The listener's event loop is already closed.
+                pass
+
+    def drain(self):
+        """Return (events, overflowed) and reset the buffer."""
+        with self._lock:
+            events, overflowed = list(self._events), self.overflowed
+            self._events.clear()
+            self.overflowed = False
+            self._ready.clear()
+            if self._async_ready is not None:
+                self._async_ready.clear()
+        return events, overflowed
+
+    def wait(self, timeout):
+        return self._ready.wait(timeout)
+
+    async def await_events(self, timeout):
+        with self._lock:
+            if self._async_ready is None:
+                self._loop = asyncio.get_running_loop()
+                self._async_ready = asyncio.Event()
+                if self._events or self.overflowed:
+                    self._async_ready.set()
+            async_ready = self._async_ready
+        try:
+            await asyncio.wait_for(async_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalBroker:
+    """
+    In-memory fan-out to the listeners of this process.
+
+    Needs no external service; with several worker processes each one only
+    sees the writes it made itself, so deployments that run more than one
+    process should point ATTENDANCE_BROKER at a shared backend exposing the
+    same publish/subscribe methods.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = Subscription(self, self.maxsize)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+
+broker = import_string(getattr(settings, 'ATTENDANCE_BROKER', 'tracker.pubsub.LocalBroker'))()
@@ -0,0 +1,173 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import DurationField, ExpressionWrapper, F, FilteredRelation, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from . import usercache
+from .models import CheckInCheckOut, CustomUser, DailyHours, resolve_timezone
+
+WORKED = ExpressionWrapper(F('check_out_time') - F('check_in_time'), output_field=DurationField())
+
+
+def user_timezone(user_id):
+    return resolve_timezone(CustomUser.objects.filter(pk=user_id).values_list('time_zone', flat=True).first())
+
+
+def entry_day(check_in_time, tz):
+    return timezone.localdate(check_in_time, tz)
+
+
+def day_start(day, tz):
+    return timezone.make_aware(datetime.combine(day, time.min), tz)
+
+
+def day_range(start, end, tz):
+    """Half-open [start, end + 1 day) timestamp bounds for an inclusive date range."""
+    return day_start(start, tz), day_start(end + timedelta(days=1), tz)
+
+
+def with_period_hours(users, start, end):
+    """Annotate users with ``total``, their worked time in the inclusive date range."""
+    return users.annotate(
+        period=FilteredRelation('dailyhours', condition=Q(dailyhours__day__gte=start, dailyhours__day__lte=end)),
+        total=Coalesce(Sum('period__duration'), Value(timedelta()), output_field=DurationField()),
+    )
+
+
+def _dashboard_query(user_id, today):
+    start_of_week = today - timedelta(days=today.weekday())
+    start_of_month = today.replace(day=1)
+    rollups = DailyHours.objects.filter(user_id=user_id, day__gte=min(start_of_week, start_of_month))
+    aggregates = {
+        'weekly': Sum('duration', filter=Q(day__gte=start_of_week)),
+        'monthly': Sum('duration', filter=Q(day__gte=start_of_month)),
+    }
+    return rollups, aggregates
+
+
+def _as_hours(totals):
+    return {
+        'weekly_hours': (totals['weekly'] or timedelta()).total_seconds() / 3600,
+        'monthly_hours': (totals['monthly'] or timedelta()).total_seconds() / 3600,
+    }
+
+
+def dashboard_hours(user):
+    """This week's and this month's hours of a user, in one aggregate over the rollup (cached)."""
+    today = timezone.localdate(timezone=user.tzinfo)
+
+    def compute():
+        rollups, aggregates = _dashboard_query(user.pk, today)
+        return _as_hours(rollups.aggregate(**aggregates))
+
+    return usercache.get_or_compute(user.pk, 'dashboard', compute, today)
+
+
+async def adashboard_hours(user):
+    today = timezone.localdate(timezone=user.tzinfo)
+
+    async def compute():
+        rollups, aggregates = _dashboard_query(user.pk, today)
+        return _as_hours(await rollups.aaggregate(**aggregates))
+
+    return await usercache.aget_or_compute(user.pk, 'dashboard', compute, today)
+
+
+def refresh_daily_hours(user_id, days, tz=None):
+    """Recompute the rollup rows of one user for the given days."""
+    refresh_many_daily_hours({user_id: days}, {user_id: tz} if tz else None)
+
+
+def refresh_many_daily_hours(days_by_user, timezones=None):
+    """
+    Recompute the rollup rows for {user_id: days}, with one aggregate query per
+    time zone involved. Bulk writers call this, since they bypass the signals.
+    """
+    days_by_user = {user_id: set(days) for user_id, days in days_by_user.items() if days}
+    if not days_by_user:
+        return
+
+    timezones = {user_id: tz for user_id, tz in (timezones or {}).items() if tz is not None}
+    missing = days_by_user.keys() - timezones.keys()
+    if missing:
+        for user_id, tz_name in CustomUser.objects.filter(pk__in=missing).values_list('pk', 'time_zone'):
+            timezones[user_id] = resolve_timezone(tz_name)
+
+    users_by_zone = defaultdict(list)
+    for user_id in days_by_user:
+        users_by_zone[timezones.get(user_id, resolve_timezone(None))].append(user_id)
+
+    totals = {}
+    for tz, user_ids in users_by_zone.items():
+        all_days = set().union(*(days_by_user[user_id] for user_id in user_ids))
+        lower, upper = day_range(min(all_days), max(all_days), tz)
+        rows = (
+            CheckInCheckOut.objects.filter(
+                user_id__in=user_ids,
+                check_in_time__gte=lower,
+                check_in_time__lt=upper,
+                check_out_time__isnull=False,
+            )
+            .annotate(day=TruncDate('check_in_time', tzinfo=tz))
+            .values('user_id', 'day')
+            .annotate(duration=Sum(WORKED))
+            .values_list('user_id', 'day', 'duration')
+        )
+        for user_id, day, duration in rows:
+            if day in days_by_user[user_id]:
+                totals[user_id, day] = duration
+
+    empty = Q()
+    for user_id, days in days_by_user.items():
+        empty_days = {day for day in days if (user_id, day) not in totals}
+        if empty_days:
+            empty |= Q(user_id=user_id, day__in=empty_days)
+
+    with transaction.atomic():
+        if empty:
+            DailyHours.objects.filter(empty).delete()
+        if totals:
+            DailyHours.objects.bulk_create(
+                [DailyHours(user_id=user_id, day=day, duration=duration) for (user_id, day), duration in totals.items()],
+                update_conflicts=True,
+                unique_fields=['user', 'day'],
+                update_fields=['duration'],
+                batch_size=1000,
+            )
+
+
+def rebuild_daily_hours(user_ids=None, batch_size=2000):
+    """Rebuild the rollup from scratch, optionally only for some users."""
+    users = CustomUser.objects.all()
+    rollups = DailyHours.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        # Days are bucketed in each user's own time zone, so group per zone.
+        for tz_name in users.order_by().values_list('time_zone', flat=True).distinct():
+            rows = (
+                CheckInCheckOut.objects.filter(check_out_time__isnull=False, user__in=users.filter(time_zone=tz_name))
+                .annotate(day=TruncDate('check_in_time', tzinfo=resolve_timezone(tz_name)))
+                .values('user_id', 'day')
+                .annotate(duration=Sum(WORKED))
+                .order_by()
+                .values_list('user_id', 'day', 'duration')
+            )
+            batch = []
+            for user_id, day, duration in rows.iterator(chunk_size=batch_size):
+                batch.append(DailyHours(user_id=user_id, day=day, duration=duration))
+                if len(batch) >= batch_size:
+                    DailyHours.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            if batch:
+                DailyHours.objects.bulk_create(batch)
+                created += len(batch)
+    return created
@@ -0,0 +1,95 @@
+"""
+Read/write routing between the primary database and a read replica.
+
+Writes always go to the primary. Reads go to the replica only inside views
+decorated with @reads_from_replica, and only while the request has not been
+pinned to the primary: a request that wrote is pinned for its remaining
+queries, and ReplicaRoutingMiddleware pins the requests of the same client
+for REPLICA_STICKY_SECONDS afterwards, so the page shown after a save is
+never older than the save.
+"""
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+STICKY_COOKIE = 'primary_db'
+
+
+@dataclass
+class RoutingState:
+    pinned: bool = False
+    wrote: bool = False
+
+
+# Mutated rather than set, so writes made in sync_to_async threads are seen by the middleware.
+_state = ContextVar('tracker_db_routing', default=None)
+_replica_reads = ContextVar('tracker_replica_reads', default=False)
+
+
+def start_request(pinned=False):
+    state = RoutingState(pinned=pinned)
+    return state, _state.set(state)
+
+
+def finish_request(token):
+    _state.reset(token)
+
+
+def _use_replica():
+    if not settings.REPLICA_DATABASE or not _replica_reads.get():
+        return False
+    state = _state.get()
+    return state is None or not (state.pinned or state.wrote)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica():
+            return settings.REPLICA_DATABASE
+        # Not None: an instance loaded from the replica would otherwise pull its relations from there.
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def _replica_chunks(chunks):
+    # Streaming bodies run their queries after the view has returned.
+    iterator = iter(chunks)
+    while True:
+        token = _replica_reads.set(True)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _replica_reads.reset(token)
+        yield chunk
+
+
+def reads_from_replica(view):
+    """Send the read queries of a read-only (sync) view to the replica."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            response = view(request, *args, **kwargs)
+            stream_from_replica = _use_replica()
+        finally:
+            _replica_reads.reset(token)
+        if stream_from_replica and response.streaming and not response.is_async:
+            response.streaming_content = _replica_chunks(response.streaming_content)
+        return response
+    return wrapper
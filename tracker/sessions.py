@@ -0,0 +1,36 @@
+"""
+Cached database sessions that coalesce rewrites of unchanged sessions.
+
+Sessions are read from the cache like Django's cached_db engine. A save
+that only moves the expiry (SESSION_SAVE_EVERY_REQUEST) refreshes the cached
+copy; the database row is rewritten at most every SESSION_DB_WRITE_INTERVAL
+seconds, or as soon as the session data changes.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+
+
+class SessionStore(cached_db.SessionStore):
+    cache_key_prefix = 'tracker.sessions'
+
+    def _written_key(self):
+        return self.cache_key + ':written'
+
+    def _digest(self):
+        return hashlib.sha1(self.serializer().dumps(self._get_session())).hexdigest()
+
+    def save(self, must_create=False):
+        digest = self._digest()
+        if not must_create and self.session_key is not None and self._cache.get(self._written_key()) == digest:
+            self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+            return
+        super().save(must_create)
+        self._cache.set(self._written_key(), digest, settings.SESSION_DB_WRITE_INTERVAL)
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        session_key = session_key or self.session_key
+        if session_key is not None:
+            self._cache.delete(f'{self.cache_key_prefix}{session_key}:written')
@@ -0,0 +1,141 @@
+from django.db.backends.signals import connection_created
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import attendance, metrics, usercache
+from .kiosk import qr_codes
+from .models import CheckInCheckOut, CustomUser, ManagedRole, QRCode, Role, TimeEntryLog
+from .permissions import invalidate_role_graph
+from .rollups import entry_day, rebuild_daily_hours, refresh_daily_hours, user_timezone
+
+
+@receiver(post_save, sender=CheckInCheckOut)
+def update_daily_hours_on_save(sender, instance, created, **kwargs):
+    if created and instance.check_out_time is None:
+        # A fresh open entry adds nothing to the rollup yet.
+        instance._loaded_user_id = instance.user_id
+        instance._loaded_check_in_time = instance.check_in_time
+        usercache.invalidate([instance.user_id])
+        return
+
+    tz = instance.user.tzinfo
+    days = {entry_day(instance.check_in_time, tz)}
+
+    loaded_user_id = getattr(instance, '_loaded_user_id', None)
+    loaded_check_in = getattr(instance, '_loaded_check_in_time', None)
+    if loaded_user_id is not None and loaded_check_in is not None:
+        if loaded_user_id == instance.user_id:
+            days.add(entry_day(loaded_check_in, tz))
+        else:
+            loaded_tz = user_timezone(loaded_user_id)
+            refresh_daily_hours(loaded_user_id, [entry_day(loaded_check_in, loaded_tz)], loaded_tz)
+
+    refresh_daily_hours(instance.user_id, days, tz)
+    # After the rollup, so the dashboard is not cached from the old totals.
+    usercache.invalidate([instance.user_id, loaded_user_id])
+
+    instance._loaded_user_id = instance.user_id
+    instance._loaded_check_in_time = instance.check_in_time
+
+
+@receiver(post_delete, sender=CheckInCheckOut)
+def update_daily_hours_on_delete(sender, instance, origin=None, **kwargs):
+    # Deleting the user cascades to its rollup rows as well.
+    if getattr(origin, 'model', type(origin)) is CustomUser:
+        return
+    tz = user_timezone(instance.user_id)
+    refresh_daily_hours(instance.user_id, [entry_day(instance.check_in_time, tz)], tz)
+    usercache.invalidate([instance.user_id])
+
+
+@receiver(post_save, sender=CheckInCheckOut)
+def publish_attendance_on_save(sender, instance, created, **kwargs):
+    if instance.check_out_time is None:
+        attendance.publish(attendance.CHECK_IN, instance.pk, instance.user_id, instance.check_in_time)
+    elif not created and getattr(instance, '_loaded_check_out_time', None) is None:
+        attendance.publish(attendance.CHECK_OUT, instance.pk, instance.user_id, instance.check_out_time)
+    instance._loaded_check_out_time = instance.check_out_time
+
+
+@receiver(post_delete, sender=CheckInCheckOut)
+def publish_attendance_on_delete(sender, instance, **kwargs):
+    if instance.check_out_time is None:
+        attendance.publish(attendance.CHECK_OUT, instance.pk, instance.user_id, None)
+
+
+@receiver(post_save, sender=TimeEntryLog)
+def invalidate_user_cache_on_edit(sender, instance, **kwargs):
+    usercache.invalidate([instance.entry.user_id])
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_cache_on_user_save(sender, instance, created, **kwargs):
+    # Also covers new users: ids can be reused (after a rollback, or by SQLite
+    # after the newest users are deleted), so never serve an old user's values.
+    # Saves drop the cached login (tracker.auth) as well, e.g. on a password change.
+    usercache.invalidate([instance.pk])
+
+
+@receiver(user_logged_out)
+def invalidate_user_cache_on_logout(sender, user, **kwargs):
+    if user is not None:
+        usercache.invalidate([user.pk])
+
+
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_cache_on_user_delete(sender, instance, **kwargs):
+    usercache.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+def rebucket_daily_hours_on_time_zone_change(sender, instance, created, **kwargs):
+    loaded_time_zone = getattr(instance, '_loaded_time_zone', None)
+    if not created and loaded_time_zone is not None and loaded_time_zone != instance.time_zone:
+        rebuild_daily_hours([instance.pk])
+        usercache.invalidate([instance.pk])
+        qr_codes.clear()
+    instance._loaded_time_zone = instance.time_zone
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=ManagedRole)
+@receiver(post_delete, sender=ManagedRole)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_role_graph_on_change(sender, **kwargs):
+    invalidate_role_graph()
+
+
+@receiver(m2m_changed, sender=CustomUser.roles.through)
+def invalidate_role_graph_on_roles_change(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_role_graph()
+        instance.__dict__.pop('_role_graph_cache', None)
+
+
+@receiver(m2m_changed, sender=CustomUser.roles.through)
+def invalidate_user_cache_on_roles_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # The cached login holds the user's roles.
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            usercache.invalidate([instance.pk])
+    elif action == 'pre_clear':
+        usercache.invalidate(instance.customuser_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        usercache.invalidate(pk_set)
+
+
+@receiver(post_save, sender=Role)
+@receiver(pre_delete, sender=Role)
+def invalidate_user_cache_on_role_change(sender, instance, **kwargs):
+    usercache.invalidate(instance.customuser_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=QRCode)
+@receiver(post_delete, sender=QRCode)
+def forget_cached_qr_code(sender, instance, **kwargs):
+    qr_codes.discard(instance.qr_code)
+
+
+connection_created.connect(metrics.install_query_instrumentation)
@@ -1,8 +1,29 @@
-from django.test import TestCase, Client
-from django.urls import reverse
-from .models import CustomUser, Role, Right, ManagedRole, CheckInCheckOut, QRCode, TimeEntryLog
+from django.test import TestCase, TransactionTestCase, Client, override_settings, skipUnlessDBFeature
+from django.urls import ResolverMatch, resolve, reverse
+from . import analytics, bulk_edit, exports, heatmap, importer, jobs, kiosk, metrics, payroll, permissions, rollups, routers, usercache, views
+from .pubsub import LocalBroker, broker
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from .models import CustomUser, Role, Right, ManagedRole, CheckInCheckOut, QRCode, ReportJob, ScanEvent, TimeEntryLog, DailyHours, resolve_timezone
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, connections
+from django.db.models import F, NOT_PROVIDED
+from django.test.utils import CaptureQueriesContext
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
+import asyncio
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from unittest import mock
 
 class UserModelTest(TestCase):
     def setUp(self):
@@ -119,6 +140,11 @@ class ViewsTest(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, f"{reverse('login')}?next={reverse('time_history')}")
 
+    def test_summary_view(self):
+        self.client.login(username='testuser', password='password')
+        response = self.client.get(reverse('summary'))
+        self.assertEqual(response.json(), {'username': 'testuser', 'checked_in': False, 'weekly_hours': 0.0, 'monthly_hours': 0.0})
+
     def test_export_monthly_timesheet_admin(self):
         self.client.login(username='admin', password='password')
         response = self.client.get(reverse('export_monthly_timesheet'))
@@ -194,4 +220,1795 @@ class ManagerViewsTest(TestCase):
         self.assertRedirects(response, reverse('view_user_timesheet', args=[self.employee_user.id]))
         self.entry.refresh_from_db()
         self.assertAlmostEqual(self.entry.check_in_time, new_check_in_time, delta=timedelta(seconds=1))
-        self.assertTrue(TimeEntryLog.objects.filter(entry=self.entry).exists())
\ No newline at end of file
+        self.assertTrue(TimeEntryLog.objects.filter(entry=self.entry).exists())
+
+    def test_edit_time_entry_post_loads_entry_once(self):
+        self.client.login(username='manager', password='password')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('edit_time_entry', args=[self.entry.id]), {
+                'check_in_time': (self.entry.check_in_time - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M'),
+                'check_out_time': self.entry.check_out_time.strftime('%Y-%m-%dT%H:%M'),
+            })
+        entry_reads = [q for q in queries.captured_queries if q['sql'].startswith('SELECT') and 'FROM "tracker_checkincheckout"' in q['sql'] and 'GROUP BY' not in q['sql']]
+        self.assertEqual(len(entry_reads), 1)
+        log = TimeEntryLog.objects.get(entry=self.entry)
+        self.assertEqual(log.old_check_in, self.entry.check_in_time)
+
+# The replica alias mirrors the test database, so reads routed to it see the
+# data; TransactionTestCase makes that data visible to its connection.
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.client = Client()
+        manager_role = Role.objects.create(name='manager')
+        employee_role = Role.objects.create(name='employee')
+        self.manager = CustomUser.objects.create_user(username='manager', password='password', is_staff=True)
+        self.manager.roles.add(manager_role)
+        self.employee = CustomUser.objects.create_user(username='employee', password='password')
+        self.employee.roles.add(employee_role)
+        ManagedRole.objects.create(manager_role=manager_role, managed_role=employee_role)
+        self.entry = CheckInCheckOut.objects.create(
+            user=self.employee, check_in_time=timezone.now() - timedelta(hours=2), check_out_time=timezone.now(),
+        )
+        self.client.force_login(self.manager)
+
+    def get(self, name, *args):
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse(name, args=args))
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_reporting_views_read_from_replica(self):
+        for name, args in [('team_timesheet', []), ('view_user_timesheet', [self.employee.pk]), ('export_monthly_timesheet', [])]:
+            with self.subTest(name):
+                primary, replica = self.get(name, *args)
+                self.assertGreater(replica, 0)
+                self.assertNotIn(routers.STICKY_COOKIE, self.client.cookies)
+
+    def test_other_views_read_from_primary(self):
+        primary, replica = self.get('index')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        response = self.client.post(reverse('edit_time_entry', args=[self.entry.pk]), {
+            'check_in_time': (self.entry.check_in_time - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M'),
+            'check_out_time': self.entry.check_out_time.strftime('%Y-%m-%dT%H:%M'),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[routers.STICKY_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+        primary, replica = self.get('view_user_timesheet', self.employee.pk)
+        self.assertEqual(replica, 0)
+
+        del self.client.cookies[routers.STICKY_COOKIE]
+        primary, replica = self.get('view_user_timesheet', self.employee.pk)
+        self.assertGreater(replica, 0)
+
+    def test_role_graph_loads_from_primary(self):
+        token = routers._replica_reads.set(True)
+        self.addCleanup(routers._replica_reads.reset, token)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            graph = permissions.RoleGraph.load('v')
+        self.assertEqual(len(replica), 0)
+        self.assertIn(self.employee.id, graph.managed_user_ids(self.manager.id))
+
+    def test_writes_go_to_primary(self):
+        entry = CheckInCheckOut.objects.using('replica').get(pk=self.entry.pk)
+        self.assertEqual(routers.ReplicaRouter().db_for_write(CheckInCheckOut, instance=entry), 'default')
+        self.assertEqual(routers.ReplicaRouter().db_for_read(CustomUser, instance=entry), 'default')
+
+    def test_benchmark_counts_replica_queries(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command('generate_load_data', users=12, team_size=5, years=0.1, stdout=StringIO())
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark_views', scenarios=['team_timesheet'], iterations=2, no_latency=True, output=output.name, stdout=StringIO())
+            result = json.load(output)['results']['team_timesheet']
+        self.assertEqual(result['queries'], 3)
+
+
+class BulkEditTest(TestCase):
+    def setUp(self):
+        manager_role = Role.objects.create(name='manager')
+        employee_role = Role.objects.create(name='employee')
+        ManagedRole.objects.create(manager_role=manager_role, managed_role=employee_role)
+        self.manager = CustomUser.objects.create_user(username='manager', password='password')
+        self.manager.roles.add(manager_role)
+        self.employees = []
+        for i in range(30):
+            employee = CustomUser.objects.create_user(username=f'employee{i}', password='password')
+            employee.roles.add(employee_role)
+            self.employees.append(employee)
+        self.outsider = CustomUser.objects.create_user(username='outsider', password='password')
+        self.monday = datetime.fromisoformat('2024-03-04T09:00:00+00:00')
+        # A week of forgotten check-outs, one per employee and day.
+        self.open_entries = [
+            CheckInCheckOut.objects.create(user=employee, check_in_time=self.monday + timedelta(days=i % 5))
+            for i, employee in enumerate(self.employees)
+        ]
+        self.client.login(username='manager', password='password')
+
+    def post(self, changes):
+        return self.client.post(reverse('bulk_edit_time_entries'), {'changes': changes}, content_type='application/json')
+
+    def close_at_five(self, entries):
+        return [{'entry_id': entry.id, 'check_out_time': (entry.check_in_time + timedelta(hours=8)).isoformat()} for entry in entries]
+
+    def test_closes_missed_check_outs_in_one_request(self):
+        response = self.post(self.close_at_five(self.open_entries))
+        self.assertEqual(response.json(), {'updated': 30, 'unchanged': 0})
+        self.assertFalse(CheckInCheckOut.objects.filter(check_out_time__isnull=True).exists())
+        self.assertEqual(TimeEntryLog.objects.filter(edited_by=self.manager, old_check_out__isnull=True).count(), 30)
+        self.assertEqual(DailyHours.objects.get(user=self.employees[0], day=self.monday.date()).hours, 8)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        self.post(self.close_at_five(self.open_entries[:2]))
+        with CaptureQueriesContext(connection) as small:
+            self.post(self.close_at_five(self.open_entries[2:4]))
+        with CaptureQueriesContext(connection) as large:
+            self.post(self.close_at_five(self.open_entries[4:]))
+        self.assertEqual(len(small), len(large))
+
+    def test_naive_times_are_read_in_the_owner_time_zone(self):
+        self.employees[0].time_zone = 'Europe/Berlin'
+        self.employees[0].save()
+        entry = self.open_entries[0]
+        self.post([{'entry_id': entry.id, 'check_out_time': '2024-03-04T17:30:00'}])
+        entry.refresh_from_db()
+        self.assertEqual(entry.check_out_time, datetime.fromisoformat('2024-03-04T16:30:00+00:00'))
+
+    def test_entries_outside_the_team_reject_the_whole_batch(self):
+        foreign = CheckInCheckOut.objects.create(user=self.outsider, check_in_time=self.monday)
+        response = self.post(self.close_at_five([self.open_entries[0], foreign]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'index': 1, 'entry_id': foreign.id, 'error': 'unknown entry or not in your team'}])
+        self.assertEqual(CheckInCheckOut.objects.filter(check_out_time__isnull=False).count(), 0)
+        self.assertFalse(TimeEntryLog.objects.exists())
+
+    def test_invalid_changes_are_reported(self):
+        entry = self.open_entries[0]
+        response = self.post([
+            {'entry_id': entry.id, 'check_out_time': (entry.check_in_time - timedelta(hours=1)).isoformat()},
+            {'entry_id': self.open_entries[1].id, 'check_out_time': 'yesterday'},
+            {'entry_id': self.open_entries[2].id},
+            {'check_out_time': 'x'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['error'] for error in response.json()['errors']], ['nothing to change', 'entry_id is required'])
+        response = self.post([
+            {'entry_id': entry.id, 'check_out_time': (entry.check_in_time - timedelta(hours=1)).isoformat()},
+            {'entry_id': self.open_entries[1].id, 'check_out_time': 'yesterday'},
+        ])
+        self.assertEqual([error['error'] for error in response.json()['errors']], ['check_out_time is before check_in_time', 'not an ISO 8601 timestamp'])
+        self.assertFalse(TimeEntryLog.objects.exists())
+
+    def test_requires_manager(self):
+        self.client.login(username='employee0', password='password')
+        self.assertEqual(self.post(self.close_at_five(self.open_entries[:1])).status_code, 403)
+        self.client.login(username='manager', password='password')
+        self.assertEqual(self.client.get(reverse('bulk_edit_time_entries')).status_code, 405)
+
+class DailyHoursRollupTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.admin_user = CustomUser.objects.create_superuser(username='admin', password='password')
+        self.now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def rollup(self):
+        return {row.day: row.hours for row in DailyHours.objects.filter(user=self.user)}
+
+    def test_closed_entry_creates_rollup(self):
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now - timedelta(hours=2), check_out_time=self.now)
+        self.assertEqual(self.rollup(), {timezone.localdate(self.now): 2.0})
+
+    def test_open_entry_is_not_counted_until_closed(self):
+        entry = CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now - timedelta(hours=3))
+        self.assertEqual(self.rollup(), {})
+        entry.check_out_time = self.now
+        entry.save()
+        self.assertEqual(self.rollup(), {timezone.localdate(self.now): 3.0})
+
+    def test_moving_entry_refreshes_both_days(self):
+        entry = CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now - timedelta(hours=2), check_out_time=self.now)
+        entry = CheckInCheckOut.objects.get(pk=entry.pk)
+        entry.check_in_time -= timedelta(days=1)
+        entry.check_out_time -= timedelta(days=1)
+        entry.save()
+        self.assertEqual(self.rollup(), {timezone.localdate(self.now) - timedelta(days=1): 2.0})
+
+    def test_delete_removes_rollup(self):
+        entry = CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now - timedelta(hours=2), check_out_time=self.now)
+        entry.delete()
+        self.assertEqual(self.rollup(), {})
+
+    def test_add_time_entry_updates_rollup(self):
+        self.client.login(username='admin', password='password')
+        self.client.post(reverse('add_time_entry'), {
+            'user': self.user.id,
+            'check_in_time': (self.now - timedelta(hours=4)).strftime('%Y-%m-%dT%H:%M'),
+            'check_out_time': self.now.strftime('%Y-%m-%dT%H:%M'),
+        })
+        self.assertEqual(self.rollup(), {timezone.localdate(self.now): 4.0})
+
+    def test_rebuild_command(self):
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now - timedelta(hours=2), check_out_time=self.now)
+        DailyHours.objects.all().delete()
+        call_command('rebuild_daily_hours', stdout=StringIO())
+        self.assertEqual(self.rollup(), {timezone.localdate(self.now): 2.0})
+
+    def test_index_reads_totals_from_rollup(self):
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now - timedelta(hours=2), check_out_time=self.now)
+        self.client.login(username='testuser', password='password')
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['weekly_hours'], 2.0)
+        self.assertEqual(response.context['monthly_hours'], 2.0)
+
+
+class UserCacheTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        manager_role, employee_role = Role.objects.create(name='manager'), Role.objects.create(name='employee')
+        ManagedRole.objects.create(manager_role=manager_role, managed_role=employee_role)
+        self.manager = CustomUser.objects.create_user(username='manager', password='password')
+        self.manager.roles.add(manager_role)
+        self.user.roles.add(employee_role)
+        self.now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.entry = CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now - timedelta(hours=2), check_out_time=self.now)
+        self.client.login(username='testuser', password='password')
+
+    def summary(self):
+        return self.client.get(reverse('summary')).json()
+
+    def test_hot_dashboard_needs_only_auth_queries(self):
+        self.client.get(reverse('index'))
+        # The session and the user.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['weekly_hours'], 2.0)
+        self.summary()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.summary()['weekly_hours'], 2.0)
+
+    def test_hot_history_page_needs_only_auth_queries(self):
+        self.client.get(reverse('time_history'))
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('time_history'))
+        self.assertContains(response, '2.00')
+        with self.assertNumQueries(2 + 2):
+            self.client.get(reverse('time_history'), {'count': '1'})
+
+    def test_check_in_and_out_refresh_cached_values(self):
+        self.summary()
+        self.client.get(reverse('time_history'))
+        entry = CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now + timedelta(minutes=1))
+        self.assertTrue(self.summary()['checked_in'])
+        self.assertContains(self.client.get(reverse('time_history')), 'Still checked in')
+
+        kiosk.punch(self.user.pk, entry.check_in_time + timedelta(hours=1))
+        summary = self.summary()
+        self.assertFalse(summary['checked_in'])
+        self.assertEqual(summary['weekly_hours'], 3.0)
+
+    def test_manager_edits_refresh_cached_values(self):
+        self.summary()
+        manager = Client()
+        manager.login(username='manager', password='password')
+        check_out = timezone.localtime(self.now + timedelta(hours=1))
+        manager.post(reverse('edit_time_entry', args=[self.entry.pk]), {
+            'check_in_time': timezone.localtime(self.entry.check_in_time).strftime('%Y-%m-%dT%H:%M'),
+            'check_out_time': check_out.strftime('%Y-%m-%dT%H:%M'),
+        })
+        self.assertEqual(self.summary()['weekly_hours'], 3.0)
+
+        manager.post(reverse('bulk_edit_time_entries'), {'changes': [{'entry_id': self.entry.pk, 'check_out_time': self.now.isoformat()}]}, content_type='application/json')
+        self.assertEqual(self.summary()['weekly_hours'], 2.0)
+
+    def test_evicted_version_is_not_reused(self):
+        self.summary()
+        DailyHours.objects.filter(user=self.user).update(duration=timedelta(hours=5))
+        # Writes that bypass the writers above are not seen...
+        self.assertEqual(self.summary()['weekly_hours'], 2.0)
+        # ...until the user's version is gone, which starts a new one.
+        cache.delete(usercache._version_key(self.user.pk))
+        self.assertEqual(self.summary()['weekly_hours'], 5.0)
+
+    def test_rebuild_invalidates_every_user(self):
+        self.summary()
+        CheckInCheckOut.objects.filter(pk=self.entry.pk).update(check_out_time=self.now + timedelta(hours=2))
+        call_command('rebuild_daily_hours', stdout=StringIO())
+        self.assertEqual(self.summary()['weekly_hours'], 4.0)
+
+
+class AuthCacheTest(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(AUTH_CACHE=True, SESSION_ENGINE='tracker.sessions'))
+        cache.clear()
+        self.client = Client()
+        self.role = Role.objects.create(name='employee')
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.user.roles.add(self.role)
+        self.client.login(username='testuser', password='password')
+
+    def test_warm_index_needs_no_queries(self):
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['user'], self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(response.context['user'].roles.all()), [self.role])
+
+    @override_settings(ROOT_URLCONF='tracker.async_urls')
+    def test_warm_async_index_needs_no_queries(self):
+        # The async index loads the user with request.auser().
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Hello, testuser!')
+
+    def test_user_changes_are_seen_at_once(self):
+        self.client.get(reverse('index'))
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.client.get(reverse('index')).context['user'].is_authenticated)
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.get(reverse('index'))
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertFalse(self.client.get(reverse('index')).context['user'].is_authenticated)
+
+    def test_role_changes_are_seen_at_once(self):
+        self.client.get(reverse('index'))
+        other = Role.objects.create(name='other')
+        other.customuser_set.add(self.user)
+        self.assertEqual(set(self.client.get(reverse('index')).context['user'].roles.all()), {self.role, other})
+        self.role.delete()
+        self.assertEqual(list(self.client.get(reverse('index')).context['user'].roles.all()), [other])
+
+    def test_logout_drops_the_session_and_the_cached_user(self):
+        self.client.get(reverse('index'))
+        session_key = self.client.session.session_key
+        self.client.get(reverse('logout'))
+        self.assertFalse(self.client.get(reverse('index')).context['user'].is_authenticated)
+        self.assertIsNone(cache.get(f'tracker.sessions{session_key}'))
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_unchanged_sessions_are_written_once_per_interval(self):
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                self.client.get(reverse('index'))
+        self.assertEqual([q for q in queries.captured_queries if 'django_session' in q['sql']], [])
+
+        # The interval is over.
+        cache.delete(f'tracker.sessions{self.client.session.session_key}:written')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertTrue([q for q in queries.captured_queries if 'django_session' in q['sql']])
+
+
+class JsonApiTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        manager_role = Role.objects.create(name='manager')
+        employee_role = Role.objects.create(name='employee')
+        ManagedRole.objects.create(manager_role=manager_role, managed_role=employee_role)
+        self.manager = CustomUser.objects.create_user(username='manager', password='password')
+        self.manager.roles.add(manager_role)
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.user.roles.add(employee_role)
+        self.now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.entry = CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now - timedelta(hours=3), check_out_time=self.now)
+        self.params = {'from': self.now.date().isoformat(), 'to': self.now.date().isoformat()}
+        self.client.force_login(self.user)
+
+    def get(self, name, **headers):
+        return self.client.get(reverse(name), self.params, headers=headers)
+
+    def test_entries(self):
+        response = self.get('api_entries')
+        self.assertEqual(response.json()['entries'], [{
+            'id': self.entry.pk, 'check_in': (self.now - timedelta(hours=3)).isoformat().replace('+00:00', 'Z'),
+            'check_out': self.now.isoformat().replace('+00:00', 'Z'), 'hours': 3.0,
+        }])
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_totals(self):
+        data = self.get('api_totals').json()
+        self.assertEqual(data['hours'], 3.0)
+        self.assertEqual(data['days'], [{'day': self.now.date().isoformat(), 'hours': 3.0}])
+
+    def test_unchanged_data_is_not_modified_without_building_the_payload(self):
+        etag = self.get('api_totals')['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('api_totals', if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries.captured_queries if 'tracker_dailyhours' in q['sql']])
+
+    def test_deletes_are_not_missed_by_if_modified_since(self):
+        CheckInCheckOut.objects.filter(pk=self.entry.pk).delete()
+        self.assertEqual(self.get('api_entries', if_modified_since='Fri, 01 Jan 2100 00:00:00 GMT').status_code, 200)
+
+    def test_every_write_path_changes_the_etag(self):
+        etags = {self.get('api_entries')['ETag']}
+        kiosk.punch(self.user.pk, self.now + timedelta(hours=1))
+        etags.add(self.get('api_entries')['ETag'])
+        kiosk.punch(self.user.pk, self.now + timedelta(hours=2))
+        etags.add(self.get('api_entries')['ETag'])
+        bulk_edit.bulk_edit_entries(self.manager, [{'entry_id': self.entry.pk, 'check_out_time': (self.now + timedelta(minutes=1)).isoformat()}])
+        etags.add(self.get('api_entries')['ETag'])
+        CheckInCheckOut.objects.filter(pk=self.entry.pk).delete()
+        response = self.get('api_entries', if_none_match=etags.copy().pop())
+        etags.add(response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(etags), 5)
+
+    def test_team_totals(self):
+        self.assertEqual(self.get('api_team_totals').status_code, 403)
+        self.client.force_login(self.manager)
+        response = self.get('api_team_totals')
+        self.assertEqual(response.json()['users'], [{'id': self.user.pk, 'username': 'testuser', 'hours': 3.0}])
+        self.assertEqual(self.get('api_team_totals', if_none_match=response['ETag']).status_code, 304)
+        CustomUser.objects.create_user(username='newcomer').roles.add(Role.objects.get(name='employee'))
+        self.assertEqual(self.get('api_team_totals', if_none_match=response['ETag']).status_code, 200)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.get('api_entries').status_code, 401)
+
+
+class TeamTimesheetTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        manager_role = Role.objects.create(name='manager')
+        employee_role = Role.objects.create(name='employee')
+        ManagedRole.objects.create(manager_role=manager_role, managed_role=employee_role)
+        self.manager_user = CustomUser.objects.create_user(username='manager', password='password')
+        self.manager_user.roles.add(manager_role)
+        self.employees = []
+        for i in range(5):
+            employee = CustomUser.objects.create_user(username=f'employee{i}', password='password')
+            employee.roles.add(employee_role)
+            self.employees.append(employee)
+        self.now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        CheckInCheckOut.objects.create(
+            user=self.employees[0], check_in_time=self.now - timedelta(hours=3), check_out_time=self.now
+        )
+        CheckInCheckOut.objects.create(
+            user=self.employees[0], check_in_time=self.now - timedelta(days=14, hours=5), check_out_time=self.now - timedelta(days=14)
+        )
+        self.client.login(username='manager', password='password')
+
+    def hours_by_username(self, response):
+        return {data['user'].username: data['hours'] for data in response.context['timesheet_data']}
+
+    def test_current_week_includes_users_without_entries(self):
+        response = self.client.get(reverse('team_timesheet'))
+        hours = self.hours_by_username(response)
+        self.assertEqual(hours['employee0'], 3.0)
+        self.assertEqual(hours['employee1'], 0.0)
+        self.assertEqual(len(hours), 5)
+
+    def test_selected_week(self):
+        year, week, _ = (self.now - timedelta(days=14)).isocalendar()
+        response = self.client.get(reverse('team_timesheet'), {'week': f'{year}-W{week:02d}'})
+        self.assertEqual(self.hours_by_username(response)['employee0'], 5.0)
+
+    def test_selected_range(self):
+        response = self.client.get(reverse('team_timesheet'), {
+            'from': (self.now - timedelta(days=14)).date().isoformat(),
+            'to': self.now.date().isoformat(),
+        })
+        self.assertEqual(self.hours_by_username(response)['employee0'], 8.0)
+
+    def test_query_count_does_not_grow_with_team_size(self):
+        with CaptureQueriesContext(connection) as small_team:
+            self.client.get(reverse('team_timesheet'))
+        employee_role = Role.objects.get(name='employee')
+        for i in range(5, 25):
+            CustomUser.objects.create_user(username=f'employee{i}', password='password').roles.add(employee_role)
+        with CaptureQueriesContext(connection) as large_team:
+            response = self.client.get(reverse('team_timesheet'))
+        self.assertEqual(len(self.hours_by_username(response)), 25)
+        self.assertEqual(len(large_team), len(small_team))
+
+
+class AttendanceAnalyticsTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        manager_role = Role.objects.create(name='manager')
+        employee_role = Role.objects.create(name='employee')
+        ManagedRole.objects.create(manager_role=manager_role, managed_role=employee_role)
+        self.manager = CustomUser.objects.create_user(username='manager', password='password')
+        self.manager.roles.add(manager_role)
+        self.employee = CustomUser.objects.create_user(username='employee', password='password')
+        self.employee.roles.add(employee_role)
+        self.remote = CustomUser.objects.create_user(username='remote', password='password', time_zone='America/New_York')
+        self.remote.roles.add(employee_role)
+        self.outsider = CustomUser.objects.create_user(username='outsider', password='password')
+        self.day = date(2025, 3, 4)  # a Tuesday
+
+        def at(day, hour, minute=0, tz=None):
+            return datetime.combine(day, time(hour, minute), tzinfo=tz or resolve_timezone('UTC'))
+
+        next_day = self.day + timedelta(days=1)
+        for check_in, check_out in [
+            (at(self.day, 8), at(self.day, 17, 30)),
+            (at(next_day, 9, 30), at(next_day, 12)),
+            (at(next_day, 13), at(next_day, 17)),
+        ]:
+            CheckInCheckOut.objects.create(user=self.employee, check_in_time=check_in, check_out_time=check_out)
+        CheckInCheckOut.objects.create(user=self.employee, check_in_time=at(next_day, 18))
+        ny = resolve_timezone('America/New_York')
+        # 01:00 UTC on the 4th is still the 3rd in New York, outside the range.
+        CheckInCheckOut.objects.create(user=self.remote, check_in_time=at(self.day, 1), check_out_time=at(self.day, 4))
+        CheckInCheckOut.objects.create(user=self.remote, check_in_time=at(next_day, 8, tz=ny), check_out_time=at(next_day, 16, tz=ny))
+        CheckInCheckOut.objects.create(user=self.outsider, check_in_time=at(self.day, 10), check_out_time=at(self.day, 11))
+
+    def statistics(self, users=None):
+        users = users or CustomUser.objects.filter(pk__in=[self.employee.pk, self.remote.pk])
+        return analytics.attendance_statistics(users, self.day, self.day + timedelta(days=6))
+
+    def test_per_user_statistics(self):
+        employee, remote = self.statistics()['users']
+        self.assertEqual(employee, {
+            'user_id': self.employee.pk, 'username': 'employee', 'shifts': 3, 'average_shift_hours': 5.33,
+            'median_arrival': 8.75, 'days_worked': 2, 'overtime_days': 1, 'late_rate': 0.5,
+        })
+        self.assertEqual((remote['shifts'], remote['median_arrival'], remote['late_rate']), (1, 8.0, 0.0))
+
+    def test_overall_statistics(self):
+        stats = self.statistics()
+        self.assertEqual((stats['entries'], stats['days_worked'], stats['overtime_days']), (4, 3, 1))
+        self.assertEqual(stats['late_rate'], 0.333)
+        self.assertEqual(stats['arrival_percentiles']['50'], 8.0)
+        self.assertEqual(stats['heatmap']['Tue'][8], 1)
+        self.assertEqual(stats['heatmap']['Wed'][8:14], [1, 1, 0, 0, 0, 1])
+        self.assertEqual(sum(map(sum, stats['heatmap'].values())), 4)
+
+    def test_no_entries(self):
+        stats = analytics.attendance_statistics(CustomUser.objects.filter(pk=self.manager.pk), self.day, self.day)
+        self.assertEqual(stats['entries'], 0)
+        self.assertIsNone(stats['users'][0]['average_shift_hours'])
+        self.assertIsNone(stats['arrival_percentiles']['50'])
+        self.assertEqual(analytics.attendance_statistics(CustomUser.objects.none(), self.day, self.day)['users'], [])
+
+    def test_manager_view_covers_the_team(self):
+        self.client.force_login(self.manager)
+        params = {'from': self.day.isoformat(), 'to': (self.day + timedelta(days=6)).isoformat()}
+        response = self.client.get(reverse('team_analytics'), params)
+        self.assertContains(response, 'employee')
+        self.assertNotContains(response, 'outsider')
+        data = self.client.get(reverse('team_analytics'), params, headers={'Accept': 'application/json'}).json()
+        self.assertEqual([row['username'] for row in data['users']], ['employee', 'remote'])
+        self.assertEqual(data['entries'], 4)
+
+    def test_view_requires_manager(self):
+        self.client.force_login(self.employee)
+        self.assertRedirects(self.client.get(reverse('team_analytics')), reverse('index'))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('attendance_stats', '--from', self.day.isoformat(), '--to', self.day.isoformat(), '--json', stdout=out)
+        stats = json.loads(out.getvalue())
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual({row['username'] for row in stats['users'] if row['shifts']}, {'employee', 'outsider'})
+
+
+class CalendarHeatmapTest(TestCase):
+    def setUp(self):
+        manager_role = Role.objects.create(name='manager')
+        employee_role = Role.objects.create(name='employee')
+        ManagedRole.objects.create(manager_role=manager_role, managed_role=employee_role)
+        self.manager = CustomUser.objects.create_user(username='manager', password='password')
+        self.manager.roles.add(manager_role)
+        self.berlin = CustomUser.objects.create_user(username='berlin', password='password', time_zone='Europe/Berlin')
+        self.berlin.roles.add(employee_role)
+        self.remote = CustomUser.objects.create_user(username='remote', password='password', time_zone='America/New_York')
+        self.remote.roles.add(employee_role)
+        berlin, new_york = resolve_timezone('Europe/Berlin'), resolve_timezone('America/New_York')
+        for user, check_in, check_out in [
+            # A night shift, and one across the switch to summer time (7 hours).
+            (self.berlin, datetime(2024, 3, 4, 22, tzinfo=berlin), datetime(2024, 3, 5, 6, tzinfo=berlin)),
+            (self.berlin, datetime(2024, 3, 30, 22, tzinfo=berlin), datetime(2024, 3, 31, 6, tzinfo=berlin)),
+            # 23:00 on March 4 in New York is already March 5 in UTC and in Berlin.
+            (self.remote, datetime(2024, 3, 4, 20, tzinfo=new_york), datetime(2024, 3, 4, 23, tzinfo=new_york)),
+        ]:
+            CheckInCheckOut.objects.create(user=user, check_in_time=check_in, check_out_time=check_out)
+        CheckInCheckOut.objects.create(user=self.berlin, check_in_time=datetime(2024, 3, 6, 8, tzinfo=berlin))
+
+    def test_splits_entries_at_local_midnight(self):
+        hours = heatmap.hours_by_day(CustomUser.objects.filter(pk=self.berlin.pk), date(2024, 3, 4), date(2024, 3, 31))
+        self.assertEqual(len(hours), 28)
+        self.assertEqual({day: worked for day, worked in hours.items() if worked}, {
+            date(2024, 3, 4): 2.0, date(2024, 3, 5): 6.0, date(2024, 3, 30): 2.0, date(2024, 3, 31): 5.0,
+        })
+
+    def test_team_days_are_each_members_local_days_in_one_query(self):
+        team = self.manager.managed_users
+        with self.assertNumQueries(2):
+            hours = heatmap.hours_by_day(team, date(2024, 3, 4), date(2024, 3, 5))
+        self.assertEqual(hours, {date(2024, 3, 4): 5.0, date(2024, 3, 5): 6.0})
+
+    def test_offset_changes_are_exact(self):
+        lower = int(datetime(2024, 1, 1, tzinfo=resolve_timezone('UTC')).timestamp())
+        changes = heatmap.offset_changes(resolve_timezone('Europe/Berlin'), lower, lower + 366 * 86400)
+        self.assertEqual([(datetime.fromtimestamp(second, resolve_timezone('UTC')).isoformat(), offset) for second, offset in changes], [
+            ('2024-01-01T00:00:00+00:00', 3600), ('2024-03-31T01:00:00+00:00', 7200), ('2024-10-27T01:00:00+00:00', 3600),
+        ])
+
+    def test_view_for_self_manager_and_team(self):
+        self.client.login(username='berlin', password='password')
+        response = self.client.get(reverse('calendar_heatmap'), {'from': '2024-03-04', 'to': '2024-03-05'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {
+            'from': '2024-03-04', 'to': '2024-03-05', 'total_hours': 8.0,
+            'days': [{'day': '2024-03-04', 'hours': 2.0}, {'day': '2024-03-05', 'hours': 6.0}],
+        })
+        self.assertRedirects(self.client.get(reverse('calendar_heatmap'), {'team': 1}), reverse('index'))
+        self.assertRedirects(self.client.get(reverse('calendar_heatmap'), {'user': self.remote.pk}), reverse('index'))
+
+        self.client.login(username='manager', password='password')
+        response = self.client.get(reverse('calendar_heatmap'), {'user': self.remote.pk, 'from': '2024-03-04', 'to': '2024-03-04'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['total_hours'], 3.0)
+        response = self.client.get(reverse('calendar_heatmap'), {'team': 1, 'from': '2024-03-01', 'to': '2024-03-31'})
+        self.assertContains(response, 'Hours Calendar &ndash; Team')
+        self.assertContains(response, 'title="Sun, Mar 31, 2024: 5.00 h"')
+
+    def test_range_is_at_most_a_year(self):
+        self.client.login(username='berlin', password='password')
+        response = self.client.get(reverse('calendar_heatmap'), {'from': '2020-01-01', 'to': '2024-12-31'}, HTTP_ACCEPT='application/json')
+        self.assertEqual((response.json()['from'], len(response.json()['days'])), ('2024-01-01', heatmap.MAX_DAYS))
+
+
+class ExportTimesheetTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = CustomUser.objects.create_superuser(username='admin', password='password')
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.day = timezone.localdate() - timedelta(days=40)
+        check_in = timezone.make_aware(datetime.combine(self.day, time.min)) + timedelta(hours=8)
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=check_in, check_out_time=check_in + timedelta(hours=7, minutes=30))
+        self.client.login(username='admin', password='password')
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_monthly_timesheet'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_summary_for_range(self):
+        response, content = self.export(**{'from': self.day.isoformat(), 'to': self.day.isoformat()})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = content.decode().splitlines()
+        self.assertEqual(rows[0], 'Username,Total Hours')
+        self.assertEqual(rows[1:], ['admin,0.00', 'testuser,7.50'])
+
+    def test_summary_defaults_to_current_month(self):
+        _, content = self.export()
+        self.assertIn('testuser,0.00', content.decode().splitlines())
+
+    def test_summary_uses_single_query(self):
+        for i in range(10):
+            CustomUser.objects.create_user(username=f'user{i}', password='password')
+        with self.assertNumQueries(1):
+            lines = list(exports.csv_lines(exports.SUMMARY_HEADER, exports.summary_rows(self.day, self.day)))
+        self.assertEqual(len(lines), 13)
+
+    def test_detail_mode(self):
+        _, content = self.export(**{'from': self.day.isoformat(), 'to': self.day.isoformat(), 'mode': 'detail'})
+        rows = content.decode().splitlines()
+        self.assertEqual(rows[0], 'Username,Check-in Time,Check-out Time,Hours')
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1].startswith('testuser,') and rows[1].endswith(',7.50'))
+
+    def test_gzip(self):
+        response, content = self.export(**{'from': self.day.isoformat(), 'to': self.day.isoformat(), 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz', response['Content-Disposition'])
+        self.assertIn(b'testuser,7.50', gzip.decompress(content))
+
+    def test_gzip_off(self):
+        for value in ('0', 'false', ''):
+            with self.subTest(value):
+                response, content = self.export(**{'from': self.day.isoformat(), 'to': self.day.isoformat(), 'gzip': value})
+                self.assertEqual(response['Content-Type'], 'text/csv')
+                self.assertIn(b'testuser,7.50', content)
+
+
+class ReportJobTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, REPORT_JOB_RETRY_DELAY=60))
+
+        self.client = Client()
+        self.admin_user = CustomUser.objects.create_superuser(username='admin', password='password')
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.day = timezone.localdate() - timedelta(days=40)
+        check_in = timezone.make_aware(datetime.combine(self.day, time.min)) + timedelta(hours=8)
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=check_in, check_out_time=check_in + timedelta(hours=7, minutes=30))
+        self.client.login(username='admin', password='password')
+        self.params = {'from': self.day.isoformat(), 'to': self.day.isoformat()}
+
+    def request_report(self, **params):
+        response = self.client.post(reverse('request_report'), {**self.params, **params})
+        self.assertEqual(response.status_code, 302)
+        return ReportJob.objects.get(pk=resolve(response.url).kwargs['job_id'])
+
+    def status(self, job):
+        return self.client.get(reverse('report_status', args=[job.pk]), HTTP_ACCEPT='application/json').json()
+
+    def test_request_queues_job(self):
+        job = self.request_report(mode='detail')
+        self.assertEqual(job.status, ReportJob.QUEUED)
+        self.assertEqual(job.params, {**self.params, 'mode': 'detail', 'gzip': False, 'time_zone': 'UTC'})
+        self.assertFalse(self.request_report(mode='detail', gzip='false').params['gzip'])
+        self.assertEqual(job.requested_by, self.admin_user)
+        self.assertEqual(self.status(job)['status'], 'queued')
+        self.assertContains(self.client.get(reverse('report_status', args=[job.pk])), 'refreshes until it is ready')
+
+    def test_worker_stores_artifact_for_download(self):
+        job = self.request_report()
+        call_command('run_workers', '--burst', '--processes', '0', stdout=StringIO())
+        status = self.status(job)
+        self.assertEqual(status['status'], 'done')
+
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn(f'timesheet_{self.day}_{self.day}.csv', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), ['Username,Total Hours', 'admin,0.00', 'testuser,7.50'])
+
+    def test_gzip_artifact(self):
+        job = self.request_report(mode='detail', gzip='1')
+        jobs.execute(jobs.claim('test'))
+        job.refresh_from_db()
+        self.assertEqual(job.content_type, 'application/gzip')
+        self.assertTrue(job.filename.endswith('.csv.gz'))
+        with job.artifact.open('rb') as artifact:
+            self.assertIn(b'testuser,', gzip.decompress(artifact.read()))
+
+    def test_identical_request_reuses_job_until_data_changes(self):
+        job = self.request_report()
+        jobs.execute(jobs.claim('test'))
+        self.assertEqual(self.request_report(), job)
+        self.assertNotEqual(self.request_report(mode='detail'), job)
+
+        entry = CheckInCheckOut.objects.get()
+        CheckInCheckOut.objects.create(user=self.admin_user, check_in_time=entry.check_in_time)
+        self.assertNotEqual(self.request_report(), job)
+
+    def test_user_changes_are_not_served_from_a_reused_job(self):
+        job = self.request_report()
+        jobs.execute(jobs.claim('test'))
+        self.user.username = 'renamed'
+        self.user.save()
+        renamed = self.request_report()
+        self.assertNotEqual(renamed, job)
+        jobs.execute(jobs.claim('test'))
+        self.user.time_zone = 'Pacific/Kiritimati'
+        self.user.save()
+        self.assertNotEqual(self.request_report(), renamed)
+
+    def test_logins_do_not_invalidate_a_reused_job(self):
+        job = self.request_report()
+        jobs.execute(jobs.claim('test'))
+        self.client.login(username='testuser', password='password')
+        self.client.login(username='admin', password='password')
+        self.assertEqual(self.request_report(), job)
+
+    def test_unlogged_edits_are_not_served_from_a_reused_job(self):
+        job = self.request_report(mode='payroll')
+        jobs.execute(jobs.claim('test'))
+        self.assertEqual(self.request_report(mode='payroll'), job)
+        # Like the kiosk and bulk writers: no edit log row, but updated_at is set.
+        CheckInCheckOut.objects.update(check_in_time=F('check_in_time') + timedelta(minutes=30), updated_at=timezone.now())
+        self.assertNotEqual(self.request_report(mode='payroll'), job)
+
+    def test_failed_job_is_retried_then_fails(self):
+        job = self.request_report()
+        with mock.patch.dict(jobs.KINDS, {'timesheet': (mock.Mock(side_effect=RuntimeError('disk full')), None)}):
+            with self.assertLogs('tracker.jobs', 'ERROR'):
+                jobs.execute(jobs.claim('test'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (ReportJob.QUEUED, 1))
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=50))
+            self.assertIsNone(jobs.claim('test'))
+
+            for attempt in (2, 3):
+                ReportJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+                with self.assertLogs('tracker.jobs', 'ERROR'):
+                    jobs.execute(jobs.claim('test'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ReportJob.FAILED, 3))
+        self.assertEqual(self.status(job)['error'], 'RuntimeError: disk full')
+        self.assertEqual(self.client.get(reverse('report_download', args=[job.pk])).status_code, 404)
+        # A failed job is not reused.
+        self.assertNotEqual(self.request_report(), job)
+
+    def test_job_is_claimed_once(self):
+        job = self.request_report()
+        self.assertEqual(jobs.claim('worker-1'), job)
+        self.assertIsNone(jobs.claim('worker-2'))
+
+    def test_stale_job_is_reclaimed(self):
+        job = self.request_report()
+        jobs.claim('lost-worker')
+        ReportJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(jobs.reclaim_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (ReportJob.QUEUED, ''))
+        self.assertIn('lost-worker', job.error)
+
+    def test_purge_deletes_old_artifacts(self):
+        job = self.request_report()
+        jobs.execute(jobs.claim('test'))
+        job.refresh_from_db()
+        path = job.artifact.path
+        self.assertEqual(jobs.purge(days=1), 0)
+        ReportJob.objects.filter(pk=job.pk).update(finished_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(jobs.purge(days=1), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ReportJob.objects.exists())
+
+    def test_non_admin_cannot_request_or_download(self):
+        job = self.request_report()
+        self.client.login(username='testuser', password='password')
+        self.assertRedirects(self.client.post(reverse('request_report')), reverse('index'))
+        self.assertRedirects(self.client.get(reverse('report_status', args=[job.pk])), reverse('index'))
+        self.assertRedirects(self.client.get(reverse('report_download', args=[job.pk])), reverse('index'))
+
+
+@override_settings(PAYROLL_OVERTIME_DAILY_HOURS=8)
+class PayrollReportTest(TestCase):
+    def setUp(self):
+        self.day = timezone.localdate() - timedelta(days=40)
+        self.users = [CustomUser.objects.create_user(username=f'user{i}', password='password') for i in range(7)]
+        for offset, user in enumerate(self.users[:5]):
+            check_in = timezone.make_aware(datetime.combine(self.day, time.min)) + timedelta(hours=8)
+            CheckInCheckOut.objects.create(user=user, check_in_time=check_in, check_out_time=check_in + timedelta(hours=7 + offset))
+            CheckInCheckOut.objects.create(user=user, check_in_time=check_in + timedelta(days=1, hours=offset))
+        self.users[6].time_zone = 'Asia/Tokyo'
+        self.users[6].save()
+
+    def report(self, **kwargs):
+        out = BytesIO()
+        payroll.write_report(out, self.day, self.day + timedelta(days=1), **kwargs)
+        return out.getvalue()
+
+    def test_rows(self):
+        rows = self.report().decode().splitlines()
+        self.assertEqual(rows[0], 'Username,Date,Hours,Overtime Hours,Open Entries')
+        next_day = self.day + timedelta(days=1)
+        self.assertEqual(rows[1:4], [f'user0,{self.day},7.00,0.00,0', f'user0,{next_day},0.00,0.00,1', 'user0,Total,7.00,0.00,1'])
+        self.assertIn(f'user3,{self.day},10.00,2.00,0', rows)
+        self.assertIn('user3,Total,10.00,2.00,1', rows)
+        self.assertEqual(rows[-2:], ['user5,Total,0.00,0.00,0', 'user6,Total,0.00,0.00,0'])
+
+    def test_output_does_not_depend_on_sharding(self):
+        single = self.report(shards=1)
+        for shards in (2, 3, 7, 20):
+            self.assertEqual(self.report(shards=shards), single)
+
+    def test_shard_bounds_cover_every_username_once(self):
+        usernames = [f'u{i:02d}' for i in range(10)]
+        bounds = payroll.shard_bounds(usernames, 3)
+        self.assertEqual(bounds, [(None, 'u04'), ('u04', 'u08'), ('u08', None)])
+        self.assertEqual(payroll.shard_bounds([], 3), [(None, None)])
+
+    def test_shards_query_independently_of_size(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.report(shards=2)
+        self.assertEqual(len(queries), 1 + 2 * 3)
+
+    @override_settings(PAYROLL_PROCESSES=1)
+    def test_payroll_job(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        admin = CustomUser.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(admin)
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post(reverse('request_report'), {'mode': 'payroll', 'from': self.day, 'to': self.day + timedelta(days=1)})
+            job = ReportJob.objects.get(pk=resolve(response.url).kwargs['job_id'])
+            self.assertEqual((job.kind, job.params), ('payroll', {'from': str(self.day), 'to': str(self.day + timedelta(days=1))}))
+            jobs.execute(jobs.claim('test'))
+            response = self.client.get(reverse('report_download', args=[job.pk]))
+            self.assertEqual(b''.join(response.streaming_content), self.report())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as out:
+            self.addCleanup(os.remove, out.name)
+        call_command('payroll_report', out.name, '--from', str(self.day), '--to', str(self.day + timedelta(days=1)), '--processes', '1', stdout=StringIO())
+        with open(out.name, 'rb') as f:
+            self.assertEqual(f.read(), self.report())
+
+
+class UserTimeZoneTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', password='password', time_zone='America/New_York')
+
+    def test_tzinfo_falls_back_to_site_time_zone(self):
+        self.assertEqual(str(self.user.tzinfo), 'America/New_York')
+        self.assertEqual(CustomUser(time_zone='').tzinfo, timezone.get_default_timezone())
+
+    def test_rollup_buckets_days_in_user_time_zone(self):
+        # 02:00-04:00 UTC is the previous evening in New York
+        check_in = datetime.fromisoformat('2025-03-04T02:00:00+00:00')
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=check_in, check_out_time=check_in + timedelta(hours=2))
+        self.assertEqual(list(DailyHours.objects.values_list('day', flat=True)), [datetime(2025, 3, 3).date()])
+
+    def test_changing_time_zone_rebuckets_rollup(self):
+        check_in = datetime.fromisoformat('2025-03-04T02:00:00+00:00')
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=check_in, check_out_time=check_in + timedelta(hours=2))
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.time_zone = 'Europe/Berlin'
+        user.save()
+        self.assertEqual(list(DailyHours.objects.values_list('day', flat=True)), [datetime(2025, 3, 4).date()])
+
+
+# Checks the EXPLAIN output of the hot paths instead of assuming the indexes are used.
+class QueryPlanTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.start = timezone.localdate() - timedelta(days=30)
+        self.end = timezone.localdate()
+
+    # SQLite builds unconditional unique constraints inline, as an anonymous autoindex.
+    ROLLUP_INDEX = ('unique_daily_hours_per_user', 'sqlite_autoindex_tracker_dailyhours')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # The test tables are tiny, so make the planner show the index it would pick on real data.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), msg=f"Expected one of {index_names} in plan:\n{plan}")
+
+    def test_history_uses_user_time_index(self):
+        queryset = CheckInCheckOut.objects.filter(user=self.user).order_by('-check_in_time', '-id')[:10]
+        self.assertUsesIndex(queryset, 'checkin_user_time_idx')
+
+    def test_user_range_uses_user_time_index(self):
+        lower, upper = rollups.day_range(self.start, self.end, self.user.tzinfo)
+        queryset = CheckInCheckOut.objects.filter(user=self.user, check_in_time__gte=lower, check_in_time__lt=upper)
+        self.assertUsesIndex(queryset, 'checkin_user_time_idx')
+
+    def test_open_entry_uses_partial_index(self):
+        queryset = CheckInCheckOut.objects.filter(user=self.user, check_out_time__isnull=True)
+        self.assertUsesIndex(queryset, 'checkin_one_open_entry')
+
+    def test_dashboard_uses_rollup_index(self):
+        queryset = DailyHours.objects.filter(user=self.user, day__gte=self.start)
+        self.assertUsesIndex(queryset, *self.ROLLUP_INDEX)
+
+    def test_export_summary_uses_rollup_index(self):
+        queryset = rollups.with_period_hours(CustomUser.objects.all(), self.start, self.end).order_by('username')
+        self.assertUsesIndex(queryset, *self.ROLLUP_INDEX)
+
+    def test_export_detail_uses_time_index(self):
+        lower, upper = rollups.day_range(self.start, self.end, self.user.tzinfo)
+        queryset = CheckInCheckOut.objects.filter(check_in_time__gte=lower, check_in_time__lt=upper)
+        self.assertUsesIndex(queryset, 'checkin_time_idx')
+
+
+class RoleGraphTest(TestCase):
+    def setUp(self):
+        self.manager_role = Role.objects.create(name='manager')
+        self.employee_role = Role.objects.create(name='employee')
+        ManagedRole.objects.create(manager_role=self.manager_role, managed_role=self.employee_role)
+        self.manager_user = CustomUser.objects.create_user(username='manager', password='password')
+        self.manager_user.roles.add(self.manager_role)
+        self.employee_user = CustomUser.objects.create_user(username='employee', password='password')
+        self.employee_user.roles.add(self.employee_role)
+
+    def test_manager_relationships(self):
+        self.assertTrue(self.manager_user.is_manager)
+        self.assertFalse(self.employee_user.is_manager)
+        self.assertTrue(self.manager_user.can_manage(self.employee_user.id))
+        self.assertFalse(self.employee_user.can_manage(self.manager_user.id))
+        self.assertEqual(list(self.manager_user.managed_users), [self.employee_user])
+
+    def test_checks_cost_no_queries_when_warm(self):
+        manager = CustomUser.objects.get(pk=self.manager_user.pk)
+        manager.is_manager
+        manager = CustomUser.objects.get(pk=self.manager_user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(manager.is_manager)
+            self.assertTrue(manager.can_manage(self.employee_user.id))
+
+    def test_new_users_do_not_reload_the_graph(self):
+        self.assertTrue(self.manager_user.is_manager)
+        CustomUser.objects.create_user(username='newcomer', password='password')
+        manager = CustomUser.objects.get(pk=self.manager_user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(manager.can_manage(self.employee_user.id))
+
+    def test_role_changes_invalidate_graph(self):
+        self.assertTrue(self.manager_user.can_manage(self.employee_user.id))
+        self.employee_user.roles.remove(self.employee_role)
+        manager = CustomUser.objects.get(pk=self.manager_user.pk)
+        self.assertFalse(manager.can_manage(self.employee_user.id))
+
+    def test_managed_role_changes_invalidate_graph(self):
+        other_role = Role.objects.create(name='contractor')
+        contractor = CustomUser.objects.create_user(username='contractor', password='password')
+        contractor.roles.add(other_role)
+        self.assertFalse(CustomUser.objects.get(pk=self.manager_user.pk).can_manage(contractor.id))
+        ManagedRole.objects.create(manager_role=self.manager_role, managed_role=other_role)
+        self.assertTrue(CustomUser.objects.get(pk=self.manager_user.pk).can_manage(contractor.id))
+
+    @override_settings(ROLE_GRAPH_TIMEOUT=10)
+    def test_graph_is_reloaded_once_its_version_expires(self):
+        other_role = Role.objects.create(name='contractor')
+        contractor = CustomUser.objects.create_user(username='contractor', password='password')
+        contractor.roles.add(other_role)
+        self.assertFalse(CustomUser.objects.get(pk=self.manager_user.pk).can_manage(contractor.id))
+        # As if another worker, with its own cache, had made the change.
+        ManagedRole.objects.bulk_create([ManagedRole(manager_role=self.manager_role, managed_role=other_role)])
+        self.assertFalse(CustomUser.objects.get(pk=self.manager_user.pk).can_manage(contractor.id))
+        later = timezone.now().timestamp() + 11
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertTrue(CustomUser.objects.get(pk=self.manager_user.pk).can_manage(contractor.id))
+
+    def test_user_with_several_managed_roles_is_listed_once(self):
+        other_role = Role.objects.create(name='contractor')
+        ManagedRole.objects.create(manager_role=self.manager_role, managed_role=other_role)
+        self.employee_user.roles.add(other_role)
+        manager = CustomUser.objects.get(pk=self.manager_user.pk)
+        self.assertEqual(list(manager.managed_users), [self.employee_user])
+
+    def test_view_user_timesheet_rejects_unmanaged_user(self):
+        outsider = CustomUser.objects.create_user(username='outsider', password='password')
+        self.client.login(username='manager', password='password')
+        response = self.client.get(reverse('view_user_timesheet', args=[outsider.id]))
+        self.assertRedirects(response, reverse('team_timesheet'))
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        now = timezone.now()
+        # Pairs of entries share a check-in time to exercise the id tie-breaker
+        for i in range(25):
+            check_in = now - timedelta(hours=i // 2)
+            CheckInCheckOut.objects.create(user=self.user, check_in_time=check_in, check_out_time=check_in + timedelta(minutes=30))
+        self.expected = list(CheckInCheckOut.objects.filter(user=self.user).order_by('-check_in_time', '-id'))
+        self.paginator = KeysetPaginator(CheckInCheckOut.objects.filter(user=self.user), 10)
+
+    def test_walk_forward_and_back(self):
+        pages = [self.paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(self.paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([entry for page in pages for entry in page], self.expected)
+        self.assertFalse(pages[0].has_previous)
+
+        previous = self.paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(list(previous), list(pages[1]))
+        self.assertTrue(previous.has_next)
+        self.assertEqual(list(self.paginator.get_page(previous.previous_cursor)), list(pages[0]))
+
+    def test_deep_page_is_a_single_query(self):
+        page = self.paginator.get_page(self.paginator.get_page().next_cursor)
+        with self.assertNumQueries(1):
+            self.paginator.get_page(page.next_cursor)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        self.assertEqual(list(self.paginator.get_page('not-a-cursor')), self.expected[:10])
+
+    def test_count_is_optional(self):
+        self.assertIsNone(self.paginator.get_page().count)
+        self.assertEqual(self.paginator.get_page(with_count=True).count, 25)
+
+    def test_time_history_view(self):
+        self.client.login(username='testuser', password='password')
+        first = self.client.get(reverse('time_history'))
+        second = self.client.get(reverse('time_history'), {'cursor': first.context['page_obj'].next_cursor})
+        self.assertEqual(list(second.context['page_obj']), self.expected[10:20])
+        self.assertContains(second, 'newer')
+
+
+class AdminTest(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.admin)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def add_entries(self, users):
+        for i in range(users):
+            user = CustomUser.objects.create_user(username=f'employee{CustomUser.objects.count()}')
+            QRCode.objects.create(user=user)
+            entry = CheckInCheckOut.objects.create(user=user, check_in_time=self.now - timedelta(hours=i + 2), check_out_time=self.now)
+            TimeEntryLog.objects.create(
+                entry=entry, edited_by=self.admin, old_check_in=entry.check_in_time, new_check_in=entry.check_in_time,
+                old_check_out=None, new_check_out=entry.check_out_time,
+            )
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for name in ('checkincheckout', 'timeentrylog', 'qrcode', 'customuser'):
+            url = reverse(f'admin:tracker_{name}_changelist')
+            self.add_entries(3)
+            with CaptureQueriesContext(connection) as few:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.add_entries(20)
+            with CaptureQueriesContext(connection) as many:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(len(few), len(many), name)
+            self.assertEqual(sum('COUNT(' in query['sql'] for query in many), 1, name)
+
+    def test_user_is_picked_by_autocomplete(self):
+        self.add_entries(3)
+        response = self.client.get(reverse('admin:tracker_checkincheckout_add'))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, '>employee1<')
+
+    def test_search_by_exact_username(self):
+        self.add_entries(12)
+        response = self.client.get(reverse('admin:tracker_checkincheckout_changelist'), {'q': 'employee1'})
+        self.assertEqual([entry.user.username for entry in response.context['cl'].result_list], ['employee1'])
+
+    def autocomplete_users(self, term):
+        params = {'app_label': 'tracker', 'model_name': 'checkincheckout', 'field_name': 'user', 'term': term}
+        return sorted(result['text'] for result in self.client.get(reverse('admin:autocomplete'), params).json()['results'])
+
+    def test_user_autocomplete_matches_username_prefix(self):
+        self.add_entries(3)
+        CustomUser.objects.create_user(username='other', email='employee@example.com')
+        self.assertEqual(self.autocomplete_users('employee'), ['employee1', 'employee2', 'employee3'])
+        self.assertEqual(self.autocomplete_users('ployee'), [])
+
+    def test_entry_log_is_read_only(self):
+        self.add_entries(1)
+        log = TimeEntryLog.objects.get()
+        self.assertEqual(self.client.get(reverse('admin:tracker_timeentrylog_add')).status_code, 403)
+        response = self.client.post(reverse('admin:tracker_timeentrylog_change', args=[log.pk]), {'new_check_out': ''})
+        self.assertEqual(response.status_code, 403)
+
+    def test_estimated_paginator_counts_exactly_without_postgres(self):
+        self.add_entries(5)
+        paginator = EstimatedCountPaginator(CheckInCheckOut.objects.order_by('pk'), 2)
+        self.assertEqual(paginator.count, 5)
+        self.assertEqual(paginator.num_pages, 3)
+
+
+@override_settings(KIOSK_API_KEYS=['kiosk-key'])
+class KioskScanTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.qrcode = QRCode.objects.create(user=self.user)
+        kiosk.qr_codes.clear()
+
+    def scan(self, qr_code=None, key='kiosk-key', **headers):
+        return self.client.post(
+            reverse('kiosk_scan'), {'qr_code': str(qr_code or self.qrcode.qr_code)}, HTTP_X_KIOSK_KEY=key, **headers
+        )
+
+    def test_scan_toggles_check_in_and_out(self):
+        first = self.scan()
+        self.assertEqual(first.json()['status'], 'checked_in')
+        self.assertTrue(CheckInCheckOut.objects.filter(user=self.user, check_out_time__isnull=True).exists())
+
+        second = self.scan()
+        self.assertEqual(second.json()['status'], 'checked_out')
+        self.assertEqual(second.json()['entry_id'], first.json()['entry_id'])
+        entry = CheckInCheckOut.objects.get()
+        self.assertIsNotNone(entry.check_out_time)
+        self.assertTrue(DailyHours.objects.filter(user=self.user).exists())
+
+    def test_repeated_idempotency_key_is_replayed(self):
+        first = self.scan(HTTP_IDEMPOTENCY_KEY='scan-1')
+        replay = self.scan(HTTP_IDEMPOTENCY_KEY='scan-1')
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(CheckInCheckOut.objects.count(), 1)
+        self.assertIsNone(CheckInCheckOut.objects.get().check_out_time)
+
+    @override_settings(KIOSK_API_KEYS=['kiosk-key', 'other-kiosk'])
+    def test_idempotency_keys_are_per_kiosk(self):
+        scan_id = uuid.uuid4().hex
+        first = self.scan(HTTP_IDEMPOTENCY_KEY=scan_id)
+        other = self.scan(key='other-kiosk', HTTP_IDEMPOTENCY_KEY=scan_id)
+        self.assertNotIn('Idempotent-Replayed', other)
+        self.assertEqual((first.json()['status'], other.json()['status']), ('checked_in', 'checked_out'))
+
+    def test_known_code_is_resolved_from_cache(self):
+        self.scan()
+        with CaptureQueriesContext(connection) as queries:
+            self.scan()
+        self.assertFalse(any('tracker_qrcode' in query['sql'] for query in queries))
+
+    def test_rejects_bad_key_and_unknown_code(self):
+        self.assertEqual(self.scan(key='wrong').status_code, 403)
+        self.assertEqual(self.scan(key='schlüssel').status_code, 403)
+        self.assertEqual(self.scan(qr_code=uuid.uuid4()).status_code, 404)
+        self.assertEqual(
+            self.client.post(reverse('kiosk_scan'), {'qr_code': 'nope'}, HTTP_X_KIOSK_KEY='kiosk-key').status_code, 400
+        )
+
+    def test_deleted_code_is_evicted(self):
+        self.scan()
+        qr_code = self.qrcode.qr_code
+        self.qrcode.delete()
+        self.assertEqual(self.scan(qr_code=qr_code).status_code, 404)
+
+
+@override_settings(KIOSK_API_KEYS=['kiosk-key'])
+class KioskSyncTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.other = CustomUser.objects.create_user(username='other', password='password')
+        self.qr = QRCode.objects.create(user=self.user).qr_code
+        self.other_qr = QRCode.objects.create(user=self.other).qr_code
+        self.start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+
+    def event(self, event_id, qr_code, hours):
+        return {
+            'event_id': event_id, 'device_id': 'kiosk-1', 'qr_code': str(qr_code),
+            'event_time': (self.start + timedelta(hours=hours)).isoformat(),
+        }
+
+    def sync(self, events):
+        return self.client.post(
+            reverse('kiosk_sync'), json.dumps({'events': events}), content_type='application/json', HTTP_X_KIOSK_KEY='kiosk-key'
+        )
+
+    def test_events_are_paired_in_time_order(self):
+        events = [
+            self.event('e3', self.qr, 9), self.event('e1', self.qr, 1), self.event('e2', self.qr, 5),
+            self.event('e4', self.other_qr, 2), self.event('e5', self.other_qr, 3),
+        ]
+        result = self.sync(events).json()
+        self.assertEqual((result['checked_in'], result['checked_out']), (3, 2))
+        entries = list(CheckInCheckOut.objects.filter(user=self.user).order_by('check_in_time'))
+        self.assertEqual(entries[0].duration, 4.0)
+        self.assertIsNone(entries[1].check_out_time)
+        self.assertEqual(sum(row.hours for row in DailyHours.objects.filter(user=self.other)), 1.0)
+
+    def test_replayed_events_are_ignored(self):
+        events = [self.event('e1', self.qr, 1), self.event('e2', self.qr, 2)]
+        self.sync(events)
+        result = self.sync(events + [self.event('e3', self.qr, 3)]).json()
+        self.assertEqual(result['duplicates'], 2)
+        self.assertEqual(result['checked_in'], 1)
+        self.assertEqual(CheckInCheckOut.objects.count(), 2)
+
+    def test_closes_entry_opened_online_and_spans_chunks(self):
+        open_entry = CheckInCheckOut.objects.create(user=self.user, check_in_time=self.start)
+        result = kiosk.ingest_scan_events([self.event(f'e{i}', self.qr, i + 1) for i in range(5)], chunk_size=2)
+        self.assertEqual((result.checked_in, result.checked_out), (2, 3))
+        open_entry.refresh_from_db()
+        self.assertEqual(open_entry.duration, 1.0)
+        self.assertEqual(CheckInCheckOut.objects.filter(check_out_time__isnull=True).count(), 0)
+
+    def test_replays_chunk_that_conflicts_with_a_live_check_in(self):
+        bulk_create = CheckInCheckOut.objects.bulk_create
+        calls = []
+
+        def conflict_once(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise IntegrityError('UNIQUE constraint failed: checkin_one_open_entry')
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(CheckInCheckOut.objects, 'bulk_create', side_effect=conflict_once):
+            result = kiosk.ingest_scan_events([self.event('e1', self.qr, 1), self.event('e2', self.qr, 2)])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((result.received, result.checked_in, result.checked_out), (2, 1, 1))
+        self.assertEqual(CheckInCheckOut.objects.get(user=self.user).duration, 1.0)
+
+    def test_chunk_that_keeps_conflicting_is_rejected_for_a_resend(self):
+        conflict = IntegrityError('UNIQUE constraint failed: checkin_one_open_entry')
+        with mock.patch.object(CheckInCheckOut.objects, 'bulk_create', side_effect=conflict) as bulk_create:
+            result = self.sync([self.event('e1', self.qr, 1), self.event('e2', self.other_qr, 2)]).json()
+        self.assertEqual(bulk_create.call_count, kiosk.SYNC_CHUNK_ATTEMPTS)
+        self.assertEqual([rejected['event_id'] for rejected in result['rejected']], ['e1', 'e2'])
+        self.assertEqual((result['checked_in'], ScanEvent.objects.count()), (0, 0))
+        self.assertEqual(self.sync([self.event('e1', self.qr, 1)]).json()['checked_in'], 1)
+
+    def test_rejects_invalid_and_unknown_events(self):
+        result = self.sync([
+            {'event_id': 'bad', 'qr_code': str(self.qr), 'event_time': 'yesterday'},
+            self.event('unknown', uuid.uuid4(), 1),
+        ]).json()
+        self.assertEqual([rejected['reason'] for rejected in result['rejected']], [
+            'event_time is not an ISO 8601 timestamp', 'unknown QR code',
+        ])
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as handle:
+            handle.writelines(json.dumps(self.event(f'e{i}', self.qr, i)) + '\n' for i in range(4))
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('sync_kiosk_events', handle.name, stdout=out)
+        self.assertIn('2 check-ins, 2 check-outs', out.getvalue())
+
+
+class OpenEntryConstraintTest(TransactionTestCase):
+    THREADS = 12
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.now = timezone.now().replace(microsecond=0)
+
+    def hammer(self, function):
+        barrier = threading.Barrier(self.THREADS)
+
+        def scan(i):
+            try:
+                barrier.wait()
+                return function(self.user.pk, self.now + timedelta(seconds=i))
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.THREADS) as pool:
+            return list(pool.map(scan, range(self.THREADS)))
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_check_ins_open_one_entry(self):
+        results = self.hammer(kiosk.check_in)
+        entry = CheckInCheckOut.objects.get(user=self.user)
+        self.assertIsNone(entry.check_out_time)
+        self.assertEqual({entry_id for entry_id, _ in results}, {entry.pk})
+        self.assertEqual([created for _, created in results].count(True), 1)
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_punches_never_leave_two_open_entries(self):
+        results = self.hammer(kiosk.punch)
+        entries = CheckInCheckOut.objects.filter(user=self.user)
+        self.assertLessEqual(entries.filter(check_out_time__isnull=True).count(), 1)
+        checked_out = {entry_id for status, entry_id in results if status == kiosk.CHECKED_OUT}
+        self.assertEqual(checked_out, set(entries.filter(check_out_time__isnull=False).values_list('pk', flat=True)))
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_overlapping_syncs_toggle_each_event_once(self):
+        qr_code = QRCode.objects.create(user=self.user).qr_code
+        events = [
+            {'event_id': f'e{i}', 'qr_code': str(qr_code), 'event_time': (self.now + timedelta(hours=i)).isoformat()}
+            for i in range(5)
+        ]
+        barrier = threading.Barrier(2)
+
+        def sync(buffer):
+            try:
+                barrier.wait()
+                return kiosk.ingest_scan_events(buffer, chunk_size=2)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(2) as pool:
+            results = list(pool.map(sync, [events[:4], events]))
+        self.assertEqual(sum(result.checked_in + result.checked_out for result in results), 5)
+        self.assertEqual(sum(result.duplicates for result in results), 4)
+        entries = CheckInCheckOut.objects.filter(user=self.user).order_by('check_in_time')
+        self.assertEqual([(entry.check_in_time, entry.check_out_time) for entry in entries], [
+            (self.now, self.now + timedelta(hours=1)),
+            (self.now + timedelta(hours=2), self.now + timedelta(hours=3)),
+            (self.now + timedelta(hours=4), None),
+        ])
+
+    def test_database_rejects_a_second_open_entry(self):
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now)
+        with self.assertRaises(IntegrityError):
+            CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now + timedelta(minutes=1))
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now, check_out_time=self.now)
+
+    def test_edits_cannot_reopen_a_second_entry(self):
+        manager_role = Role.objects.create(name='manager')
+        employee_role = Role.objects.create(name='employee')
+        ManagedRole.objects.create(manager_role=manager_role, managed_role=employee_role)
+        manager = CustomUser.objects.create_user(username='manager', password='password')
+        manager.roles.add(manager_role)
+        self.user.roles.add(employee_role)
+        closed = CheckInCheckOut.objects.create(user=self.user, check_in_time=self.now - timedelta(days=1), check_out_time=self.now - timedelta(hours=16))
+        kiosk.check_in(self.user.pk, self.now)
+
+        self.client.login(username='manager', password='password')
+        response = self.client.post(reverse('edit_time_entry', args=[closed.pk]), {
+            'check_in_time': closed.check_in_time.strftime('%Y-%m-%dT%H:%M'), 'check_out_time': '',
+        })
+        self.assertContains(response, 'This user already has an open time entry.')
+        with self.assertRaises(bulk_edit.BulkEditError):
+            bulk_edit.bulk_edit_entries(manager, [{'entry_id': closed.pk, 'check_out_time': None}])
+        self.assertEqual(CheckInCheckOut.objects.filter(user=self.user, check_out_time__isnull=True).count(), 1)
+
+
+class ImportTimeEntriesTest(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username='alice', password='password')
+        self.bob = CustomUser.objects.create_user(username='bob', password='password', time_zone='Europe/Berlin')
+
+    def write(self, suffix, content):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def run_import(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_time_entries', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_imports_csv(self):
+        path = self.write('.csv', '\n'.join([
+            'username,check_in_time,check_out_time',
+            'alice,2020-02-03T09:00:00+00:00,2020-02-03T17:00:00+00:00',
+            'alice,2020-02-03T09:00:00+00:00,2020-02-03T17:00:00+00:00',
+            'bob,2020-02-03T09:00:00,2020-02-03T12:00:00',
+            'bob,2020-02-04T09:00:00,',
+            'carol,2020-02-03T09:00:00,2020-02-03T17:00:00',
+            'alice,yesterday,',
+            'alice,2020-02-05T09:00:00,2020-02-05T08:00:00',
+        ]) + '\n')
+        out, err = self.run_import(path, chunk_size=3)
+        self.assertIn('Imported 3 of 7 rows', out)
+        self.assertIn('1 duplicates, 3 rejected', out)
+        self.assertIn("Line 6: unknown user 'carol'", err)
+        self.assertIn("Line 7: 'yesterday' is not an ISO 8601 timestamp", err)
+        self.assertIn('Line 8: check_out_time is before check_in_time', err)
+
+        bob_entry = CheckInCheckOut.objects.get(user=self.bob, check_out_time__isnull=False)
+        self.assertEqual(bob_entry.check_in_time, datetime.fromisoformat('2020-02-03T08:00:00+00:00'))
+        self.assertTrue(CheckInCheckOut.objects.filter(user=self.bob, check_out_time__isnull=True).exists())
+        self.assertEqual(DailyHours.objects.get(user=self.alice).hours, 8)
+
+        out, _ = self.run_import(path)
+        self.assertIn('Imported 0 of 7 rows', out)
+        self.assertEqual(CheckInCheckOut.objects.count(), 3)
+
+    def test_imports_jsonl_and_writes_rejects(self):
+        path = self.write('.jsonl', '\n'.join([
+            json.dumps({'username': 'alice', 'check_in_time': '2020-02-03T09:00:00Z', 'check_out_time': '2020-02-03T10:30:00Z'}),
+            '{not json',
+            json.dumps({'username': 'alice'}),
+        ]))
+        rejects = self.write('.csv', '')
+        out, _ = self.run_import(path, rejects=rejects)
+        self.assertIn('Imported 1 of 3 rows', out)
+        with open(rejects) as handle:
+            self.assertEqual(handle.read().splitlines(), ['line,reason', '2,Expecting property name enclosed in double quotes: line 1 column 2 (char 1)', '3,check_in_time is required'])
+        self.assertEqual(DailyHours.objects.get(user=self.alice).hours, 1.5)
+
+    def test_rejects_a_second_open_entry(self):
+        CheckInCheckOut.objects.create(user=self.bob, check_in_time=timezone.now())
+        path = self.write('.csv', 'username,check_in_time,check_out_time\n'
+                                  'alice,2020-02-03T09:00:00Z,\n'
+                                  'alice,2020-02-04T09:00:00Z,\n'
+                                  'bob,2020-02-03T09:00:00Z,\n'
+                                  'bob,2020-02-04T09:00:00Z,2020-02-04T17:00:00Z\n')
+        rejects = self.write('.csv', '')
+        out, _ = self.run_import(path, rejects=rejects)
+        self.assertIn('Imported 2 of 4 rows', out)
+        with open(rejects) as handle:
+            self.assertEqual(handle.read().splitlines(), ['line,reason', '3,the user already has an open entry', '4,the user already has an open entry'])
+        self.assertEqual(CheckInCheckOut.objects.filter(check_out_time__isnull=True).count(), 2)
+
+    def test_copy_writes_every_required_column(self):
+        required = {
+            field.column for field in CheckInCheckOut._meta.concrete_fields
+            if not field.null and not field.primary_key and field.db_default is NOT_PROVIDED
+        }
+        self.assertLessEqual(required, set(importer.COPY_COLUMNS))
+
+        copied = {}
+
+        class RawCursor:
+            def copy_expert(self, sql, buffer):
+                copied.update(sql=sql, rows=list(csv.reader(buffer)))
+
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.cursor = RawCursor()
+        with mock.patch.object(importer, 'connection', mock.MagicMock(cursor=mock.Mock(return_value=cursor))):
+            importer.EntryImporter().copy([(self.alice.id, timezone.now(), None)])
+        self.assertIn(f"({', '.join(importer.COPY_COLUMNS)}) FROM STDIN", copied['sql'])
+        [row] = copied['rows']
+        self.assertEqual(len(row), len(importer.COPY_COLUMNS))
+        self.assertTrue(row[importer.COPY_COLUMNS.index('updated_at')])
+
+    def test_rejects_csv_without_header(self):
+        with self.assertRaisesMessage(CommandError, 'CSV header lacks check_in_time, username'):
+            self.run_import(self.write('.csv', 'alice,2020-02-03T09:00:00,\n'))
+
+
+class LoadBenchmarkTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        # The benchmark closes its responses; see close_stream.
+        self.enterContext(mock.patch.object(connection, 'close_if_unusable_or_obsolete'))
+        call_command('generate_load_data', users=12, team_size=5, years=0.1, stdout=StringIO())
+
+    def test_generated_hierarchy_and_history(self):
+        director = CustomUser.objects.get(username='load-director')
+        manager = CustomUser.objects.get(username='load-t0-manager')
+        self.assertEqual(sorted(director.managed_users.values_list('username', flat=True)), ['load-t0-manager', 'load-t1-manager'])
+        self.assertEqual(manager.managed_users.count(), 4)
+        self.assertEqual(QRCode.objects.filter(user__username__startswith='load-').count(), 12)
+        self.assertGreater(CheckInCheckOut.objects.filter(user=manager).count(), 10)
+        self.assertLessEqual(CheckInCheckOut.objects.filter(check_out_time__isnull=True).count(), 12)
+        self.assertTrue(DailyHours.objects.filter(user=manager).exists())
+
+    def test_refuses_to_mix_with_existing_data(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_load_data', users=12, stdout=StringIO())
+
+    def test_benchmark_covers_every_url_within_budget(self):
+        out = StringIO()
+        call_command('benchmark_views', iterations=2, no_latency=True, stdout=out)
+        self.assertIn('scenarios within budget', out.getvalue())
+        for name in ('team_timesheet (director)', 'export_monthly_timesheet', 'kiosk_sync'):
+            self.assertIn(name, out.getvalue())
+
+    def test_benchmark_fails_over_budget(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'team_timesheet': {'queries': 1}}, f)
+        self.addCleanup(os.remove, f.name)
+        with self.assertRaisesMessage(CommandError, 'team_timesheet: 3 queries (budget 1)'):
+            call_command('benchmark_views', iterations=2, no_latency=True, thresholds=f.name, scenarios=['team_timesheet'], stdout=StringIO())
+
+
+# The benchmark closes and reopens the connection, which would end a
+# TestCase's transaction.
+class ConnectionBenchmarkTest(TransactionTestCase):
+    def test_reports_each_mode_and_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_connections', requests=3, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]], ['per-request', 'persistent', 'pool'])
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], settings.DATABASES['default']['CONN_MAX_AGE'])
+        self.assertFalse(CustomUser.objects.filter(username__startswith='conn-benchmark-').exists())
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        metrics.registry.reset()
+
+    def histogram(self, name, view):
+        return metrics.registry._histograms[name][view]
+
+    def test_records_per_view(self):
+        self.client.login(username='testuser', password='password')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertEqual(self.histogram('tracker_db_queries', 'index').sum, len(queries))
+        self.assertEqual(self.histogram('tracker_response_size_bytes', 'index').sum, len(response.content))
+        self.assertGreater(self.histogram('tracker_template_render_seconds', 'index').sum, 0)
+        self.assertGreater(self.histogram('tracker_db_duration_seconds', 'index').sum, 0)
+        self.assertEqual(self.histogram('tracker_request_duration_seconds', 'index').count, 1)
+
+    def test_streaming_responses_are_recorded_once_sent(self):
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('export_monthly_timesheet'))
+        self.assertNotIn('export_monthly_timesheet', metrics.registry._histograms['tracker_db_queries'])
+        body = b''.join(response.streaming_content)
+        self.assertEqual(self.histogram('tracker_response_size_bytes', 'export_monthly_timesheet').sum, len(body))
+        self.assertGreater(self.histogram('tracker_db_queries', 'export_monthly_timesheet').sum, 0)
+
+    def test_metrics_endpoint(self):
+        self.client.login(username='testuser', password='password')
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(response, 'tracker_request_duration_seconds_bucket{view="index",le="+Inf"} 1')
+        self.assertContains(response, 'tracker_responses_total{view="index",status="200"} 1')
+        self.assertContains(response, '# TYPE tracker_db_queries histogram')
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_metrics_endpoint_accepts_scraper_token(self):
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer schlüssel'}).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-token'}).status_code, 200)
+
+    def test_unnamed_views_are_labelled_by_their_path(self):
+        request = mock.Mock(resolver_match=ResolverMatch(views.index, (), {}, route='legacy/'))
+        self.assertEqual(metrics.RequestStats(request).view, 'tracker.views.index')
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_their_view(self):
+        with self.assertLogs('tracker.db.slow', 'WARNING') as logs:
+            self.client.login(username='testuser', password='password')
+            self.client.get(reverse('time_history'))
+        self.assertIn('in view time_history: SELECT', logs.output[-1])
+
+    @override_settings(METRICS_PROFILING=True)
+    def test_profile_header(self):
+        self.client.login(username='admin', password='password')
+        for mode in ('cprofile', 'tracemalloc'):
+            with self.assertLogs('tracker.profile', 'INFO') as logs:
+                response = self.client.get(reverse('index'), headers={'X-Profile': mode})
+            self.assertEqual(response['X-Profile'], mode)
+            self.assertIn(f'{mode} profile of view index', logs.output[0])
+
+        self.client.login(username='testuser', password='password')
+        self.assertNotIn('X-Profile', self.client.get(reverse('index'), headers={'X-Profile': 'cprofile'}))
+
+    def test_profile_header_is_ignored_unless_enabled(self):
+        self.client.login(username='admin', password='password')
+        self.assertNotIn('X-Profile', self.client.get(reverse('index'), headers={'X-Profile': 'cprofile'}))
+
+    @override_settings(ROOT_URLCONF='tracker.async_urls')
+    async def test_async_views_are_recorded(self):
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(reverse('summary'))
+        self.assertGreater(self.histogram('tracker_db_queries', 'summary').sum, 0)
+
+
+def read_event(chunk):
+    name, data = [line.split(': ', 1)[1] for line in chunk.strip().split('\n')[-2:]]
+    return name, json.loads(data)
+
+
+def close_stream(response):
+    # Closing fires request_finished, whose close_old_connections would close
+    # the test case's connection. Disconnecting it, as the test client does,
+    # isn't enough: the client's streaming wrapper, closed first, reconnects it.
+    with mock.patch.object(connection, 'close_if_unusable_or_obsolete'):
+        response.close()
+
+
+@override_settings(ATTENDANCE_STREAM_KEEPALIVE=1)
+class LiveAttendanceTest(TestCase):
+    def setUp(self):
+        self.manager_role = Role.objects.create(name='manager')
+        self.employee_role = Role.objects.create(name='employee')
+        ManagedRole.objects.create(manager_role=self.manager_role, managed_role=self.employee_role)
+        self.manager = CustomUser.objects.create_user(username='manager', password='password')
+        self.manager.roles.add(self.manager_role)
+        self.employee = CustomUser.objects.create_user(username='employee', password='password')
+        self.employee.roles.add(self.employee_role)
+        self.outsider = CustomUser.objects.create_user(username='outsider', password='password')
+        self.open_entry = CheckInCheckOut.objects.create(user=self.employee, check_in_time=timezone.now() - timedelta(hours=1))
+        CheckInCheckOut.objects.create(user=self.outsider, check_in_time=timezone.now() - timedelta(hours=1))
+        self.client.login(username='manager', password='password')
+
+    def open_stream(self):
+        response = self.client.get(reverse('attendance_stream'))
+        self.addCleanup(close_stream, response)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response, iter(response.streaming_content)
+
+    def test_snapshot_lists_open_entries_of_the_team(self):
+        response, stream = self.open_stream()
+        name, snapshot = read_event(next(stream).decode())
+        self.assertEqual(name, 'snapshot')
+        self.assertEqual(snapshot['users'], {str(self.employee.id): 'employee'})
+        self.assertEqual([entry['entry_id'] for entry in snapshot['present']], [self.open_entry.id])
+
+    def test_streams_team_deltas_without_queries(self):
+        response, stream = self.open_stream()
+        next(stream)
+        with self.captureOnCommitCallbacks(execute=True):
+            outside = CheckInCheckOut.objects.get(user=self.outsider)
+            outside.check_out_time = timezone.now()
+            outside.save()
+            self.open_entry.check_out_time = timezone.now()
+            self.open_entry.save()
+        with self.assertNumQueries(0):
+            chunk = next(stream).decode()
+        self.assertEqual(read_event(chunk)[0], 'check_out')
+        self.assertEqual(read_event(chunk)[1]['entry_id'], self.open_entry.id)
+        self.assertEqual(chunk.count('event: '), 1)
+
+    def test_kiosk_punches_are_published(self):
+        qrcode = QRCode.objects.create(user=self.employee)
+        response, stream = self.open_stream()
+        next(stream)
+        with self.captureOnCommitCallbacks(execute=True):
+            kiosk.punch(self.employee.id, timezone.now())
+        self.assertEqual(read_event(next(stream).decode()), ('check_out', {
+            'type': 'check_out', 'entry_id': self.open_entry.id, 'user_id': self.employee.id,
+            'time': CheckInCheckOut.objects.get(pk=self.open_entry.id).check_out_time.isoformat(),
+        }))
+        with self.captureOnCommitCallbacks(execute=True):
+            kiosk.ingest_scan_events([{'event_id': 'e1', 'qr_code': str(qrcode.qr_code), 'event_time': timezone.now().isoformat()}])
+        self.assertEqual(read_event(next(stream).decode())[0], 'check_in')
+
+    def test_rolled_back_writes_are_not_published(self):
+        response, stream = self.open_stream()
+        next(stream)
+        subscription = next(iter(broker._subscriptions))
+        with self.captureOnCommitCallbacks(execute=False):
+            self.open_entry.check_out_time = timezone.now()
+            self.open_entry.save()
+            CheckInCheckOut.objects.create(user=self.employee, check_in_time=timezone.now())
+        self.assertEqual(subscription.drain(), ([], False))
+
+    def test_closing_the_stream_unsubscribes(self):
+        before = broker.subscriber_count
+        response, stream = self.open_stream()
+        next(stream)
+        self.assertEqual(broker.subscriber_count, before + 1)
+        close_stream(response)
+        self.assertEqual(broker.subscriber_count, before)
+
+    def test_stream_requires_manager(self):
+        self.client.login(username='employee', password='password')
+        self.assertEqual(self.client.get(reverse('attendance_stream')).status_code, 403)
+        self.assertRedirects(self.client.get(reverse('live_attendance')), reverse('index'))
+
+    def test_slow_listener_is_flagged_instead_of_blocking(self):
+        local = LocalBroker(maxsize=2)
+        with local.subscribe() as subscription:
+            for i in range(3):
+                local.publish({'type': 'check_in', 'user_id': i})
+            self.assertEqual(subscription.drain(), ([], True))
+        self.assertEqual(local.subscriber_count, 0)
+
+    @override_settings(ROOT_URLCONF='tracker.async_urls')
+    async def test_async_stream(self):
+        await self.async_client.aforce_login(self.manager)
+        response = await self.async_client.get(reverse('attendance_stream'))
+        stream = aiter(response.streaming_content)
+        self.assertEqual(read_event((await anext(stream)).decode())[0], 'snapshot')
+        broker.publish({'type': 'check_in', 'entry_id': 0, 'user_id': self.outsider.id, 'time': None})
+        broker.publish({'type': 'check_out', 'entry_id': self.open_entry.id, 'user_id': self.employee.id, 'time': None})
+        name, event = read_event((await anext(stream)).decode())
+        self.assertEqual((name, event['entry_id']), ('check_out', self.open_entry.id))
+        await stream.aclose()
+
+
+@override_settings(ROOT_URLCONF='tracker.async_urls', KIOSK_API_KEYS=['kiosk-key'])
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', password='password')
+        self.qrcode = QRCode.objects.create(user=self.user)
+        now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        CheckInCheckOut.objects.create(user=self.user, check_in_time=now - timedelta(hours=2), check_out_time=now)
+        kiosk.qr_codes.clear()
+
+    def test_views_are_async(self):
+        for name in ('index', 'summary', 'kiosk_scan'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(reverse(name)).func), name)
+
+    async def test_index(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['weekly_hours'], 2.0)
+        self.assertContains(response, 'Hello, testuser!')
+
+    async def test_index_anonymous(self):
+        response = await self.async_client.get(reverse('index'))
+        self.assertContains(response, 'Please <a href="/login/">log in</a>')
+
+    async def test_summary(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('summary'))
+        self.assertEqual(response.json(), {'username': 'testuser', 'checked_in': False, 'weekly_hours': 2.0, 'monthly_hours': 2.0})
+
+    async def test_summary_requires_login(self):
+        response = await self.async_client.get(reverse('summary'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('summary')}", fetch_redirect_response=False)
+
+    async def test_kiosk_scan(self):
+        headers = {'X-Kiosk-Key': 'kiosk-key', 'Idempotency-Key': 'async-scan-1'}
+        response = await self.async_client.post(reverse('kiosk_scan'), {'qr_code': str(self.qrcode.qr_code)}, headers=headers)
+        self.assertEqual(response.json()['status'], 'checked_in')
+        replay = await self.async_client.post(reverse('kiosk_scan'), {'qr_code': str(self.qrcode.qr_code)}, headers=headers)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(await CheckInCheckOut.objects.filter(check_out_time__isnull=True).acount(), 1)
+
+    async def test_kiosk_scan_errors(self):
+        headers = {'X-Kiosk-Key': 'kiosk-key', 'Idempotency-Key': uuid.uuid4().hex}
+        response = await self.async_client.post(reverse('kiosk_scan'), {'qr_code': 'nope'}, headers=headers)
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid QR code.'}))
+        response = await self.async_client.post(reverse('kiosk_scan'), {'qr_code': str(uuid.uuid4())}, headers=headers)
+        self.assertEqual(response.status_code, 404)
+        # The key of a rejected scan is released for the retry.
+        response = await self.async_client.post(reverse('kiosk_scan'), {'qr_code': str(self.qrcode.qr_code)}, headers=headers)
+        self.assertEqual(response.json()['status'], 'checked_in')
@@ -1,14 +1,29 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('login/', views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
     path('history/', views.time_history, name='time_history'),
+    path('summary/', views.summary, name='summary'),
     path('team/', views.team_timesheet, name='team_timesheet'),
+    path('team/analytics/', views.team_analytics, name='team_analytics'),
+    path('calendar/', views.calendar_heatmap, name='calendar_heatmap'),
+    path('team/live/', views.live_attendance, name='live_attendance'),
+    path('team/live/stream/', views.attendance_stream, name='attendance_stream'),
     path('export/monthly_timesheet/', views.export_monthly_timesheet, name='export_monthly_timesheet'),
+    path('reports/', views.request_report, name='request_report'),
+    path('reports/<int:job_id>/', views.report_status, name='report_status'),
+    path('reports/<int:job_id>/download/', views.report_download, name='report_download'),
     path('user/<int:user_id>/timesheet/', views.view_user_timesheet, name='view_user_timesheet'),
     path('time_entry/<int:entry_id>/edit/', views.edit_time_entry, name='edit_time_entry'),
     path('time_entry/add/', views.add_time_entry, name='add_time_entry'),
+    path('time_entry/bulk_edit/', views.bulk_edit_time_entries, name='bulk_edit_time_entries'),
+    path('kiosk/scan/', views.kiosk_scan, name='kiosk_scan'),
+    path('kiosk/sync/', views.kiosk_sync, name='kiosk_sync'),
+    path('api/v1/entries/', api.entries, name='api_entries'),
+    path('api/v1/totals/', api.totals, name='api_totals'),
+    path('api/v1/team/totals/', api.team_totals, name='api_team_totals'),
+    path('metrics/', views.prometheus_metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Cache of values derived from one user's entries, such as dashboard totals
+and rendered history pages.
+
+Keys embed a per-user data version, so invalidating a user is a single
+write of a new version and old values simply age out of the (LRU) cache.
+Writers of CheckInCheckOut and TimeEntryLog rows call invalidate(): the
+signals for single saves, the bulk writers themselves. Only a shared cache
+sees every process's writes; with a per-process one, other processes keep
+their values until USER_CACHE_TIMEOUT, which is then short.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+GLOBAL_VERSION_KEY = 'tracker:user-data-version'
+
+
+def _version_key(user_id):
+    return f'{GLOBAL_VERSION_KEY}:{user_id}'
+
+
+def _key(user_id, versions, name, parts):
+    version = f"{versions[GLOBAL_VERSION_KEY]}.{versions[_version_key(user_id)]}"
+    # Parts can come from the query string; hash them into a safe key.
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'tracker:user-data:{user_id}:{version}:{name}:{digest}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def _versions(user_id):
+    keys = [GLOBAL_VERSION_KEY, _version_key(user_id)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Never fall back to an older version after an eviction: start a new one.
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+async def _aversions(user_id):
+    keys = [GLOBAL_VERSION_KEY, _version_key(user_id)]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, _new_version(), None)
+            versions[key] = await cache.aget(key)
+    return versions
+
+
+def get_or_compute(user_id, name, compute, *parts):
+    """Return the cached ``name`` value of the user for ``parts``, computing it on a miss."""
+    key = _key(user_id, _versions(user_id), name, parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, settings.USER_CACHE_TIMEOUT)
+    return value
+
+
+async def aget_or_compute(user_id, name, compute, *parts):
+    """Like get_or_compute(), with an async ``compute``."""
+    key = _key(user_id, await _aversions(user_id), name, parts)
+    value = await cache.aget(key)
+    if value is None:
+        value = await compute()
+        await cache.aset(key, value, settings.USER_CACHE_TIMEOUT)
+    return value
+
+
+def _bump(keys):
+    version = _new_version()
+    cache.set_many({key: version for key in keys}, None)
+
+
+def _bump_twice(keys):
+    _bump(keys)
+    # Bump again once the change is visible to other connections, so nothing
+    # computed from the not yet committed state stays cached.
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def invalidate(user_ids):
+    keys = [_version_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        _bump_twice(keys)
+
+
+def invalidate_all():
+    _bump_twice([GLOBAL_VERSION_KEY])
@@ -1,42 +1,38 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import login, logout
 from django.utils import timezone
-from datetime import timedelta
-from .models import CheckInCheckOut, CustomUser, TimeEntryLog
+from datetime import date, timedelta
+from .models import CheckInCheckOut, CustomUser, ReportJob, TimeEntryLog
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-import csv
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+import hmac
+import json
 from .forms import TimeEntryForm, NewTimeEntryForm
+from . import analytics, attendance, bulk_edit, exports, heatmap, jobs, kiosk, metrics, usercache
+from .pagination import KeysetPaginator
+from .rollups import dashboard_hours, with_period_hours
+from .routers import reads_from_replica
 
 def index(request):
     context = {}
     if request.user.is_authenticated:
-        now = timezone.now()
-        
-        # Weekly hours
-        start_of_week = now.date() - timedelta(days=now.weekday())
-        weekly_checkins = CheckInCheckOut.objects.filter(
-            user=request.user,
-            check_in_time__date__gte=start_of_week,
-            check_out_time__isnull=False
-        )
-        weekly_hours = sum(((ci.check_out_time - ci.check_in_time) for ci in weekly_checkins), timedelta())
-        context['weekly_hours'] = weekly_hours.total_seconds() / 3600
-
-        # Monthly hours
-        start_of_month = now.date().replace(day=1)
-        monthly_checkins = CheckInCheckOut.objects.filter(
-            user=request.user,
-            check_in_time__date__gte=start_of_month,
-            check_out_time__isnull=False
-        )
-        monthly_hours = sum(((ci.check_out_time - ci.check_in_time) for ci in monthly_checkins), timedelta())
-        context['monthly_hours'] = monthly_hours.total_seconds() / 3600
-        
+        context.update(dashboard_hours(request.user))
     return render(request, 'tracker/index.html', context)
 
+@login_required
+def summary(request):
+    open_entry = usercache.get_or_compute(
+        request.user.pk, 'checked-in', CheckInCheckOut.objects.filter(user=request.user, check_out_time__isnull=True).exists,
+    )
+    return JsonResponse({'username': request.user.username, 'checked_in': open_entry, **dashboard_hours(request.user)})
+
 def user_login(request):
     if request.method == 'POST':
         form = AuthenticationForm(request, data=request.POST)
@@ -54,84 +50,243 @@ def user_logout(request):
 
 @login_required
 def time_history(request):
-    checkin_list = CheckInCheckOut.objects.filter(user=request.user).order_by('-check_in_time')
-    paginator = Paginator(checkin_list, 10)
+    cursor, with_count = request.GET.get('cursor', ''), bool(request.GET.get('count'))
+
+    def page_html():
+        paginator = KeysetPaginator(CheckInCheckOut.objects.filter(user=request.user), 10)
+        page_obj = paginator.get_page(cursor, with_count=with_count)
+        return render_to_string('tracker/time_history_page.html', {'page_obj': page_obj, 'cursor': cursor})
+
+    html = usercache.get_or_compute(request.user.pk, 'history', page_html, cursor, with_count)
+    return render(request, 'tracker/time_history.html', {'page_html': mark_safe(html)})
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
 
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, 'tracker/time_history.html', {'page_obj': page_obj})
+def _parse_flag(value):
+    return (value or '').lower() in ('1', 'true', 'yes', 'on')
+
+def _selected_week_or_range(request, today):
+    """Return an inclusive (start, end) date range from ?week=YYYY-Www or ?from=&to=."""
+    week = request.GET.get('week')
+    if week:
+        try:
+            year, week_number = week.split('-W')
+            start = date.fromisocalendar(int(year), int(week_number), 1)
+            return start, start + timedelta(days=6)
+        except ValueError:
+            pass
+
+    start = _parse_date(request.GET.get('from'))
+    end = _parse_date(request.GET.get('to'))
+    if start or end:
+        start = start or end
+        end = end or start
+        return min(start, end), max(start, end)
+
+    start_of_week = today - timedelta(days=today.weekday())
+    return start_of_week, start_of_week + timedelta(days=6)
 
 @login_required
+@reads_from_replica
 def team_timesheet(request):
     if not request.user.is_manager:
         return redirect('index')
 
-    managed_users = request.user.managed_users
-    
-    now = timezone.now()
-    start_of_week = now.date() - timedelta(days=now.weekday())
-
-    timesheet_data = []
-    for user in managed_users:
-        weekly_checkins = CheckInCheckOut.objects.filter(
-            user=user,
-            check_in_time__date__gte=start_of_week,
-            check_out_time__isnull=False
-        )
-        weekly_hours = sum(((ci.check_out_time - ci.check_in_time) for ci in weekly_checkins), timedelta())
-        timesheet_data.append({
-            'user': user,
-            'weekly_hours': weekly_hours.total_seconds() / 3600
-        })
-
-    return render(request, 'tracker/team_timesheet.html', {'timesheet_data': timesheet_data})
+    start, end = _selected_week_or_range(request, timezone.localdate(timezone=request.user.tzinfo))
+
+    # One grouped query: every managed user, left-joined to the rollup rows of the period
+    team = with_period_hours(request.user.managed_users, start, end).order_by('username')
+
+    timesheet_data = [
+        {'user': user, 'hours': user.total.total_seconds() / 3600}
+        for user in team
+    ]
+
+    context = {
+        'timesheet_data': timesheet_data,
+        'start': start,
+        'end': end,
+        'week': '{}-W{:02d}'.format(*start.isocalendar()[:2]),
+    }
+    return render(request, 'tracker/team_timesheet.html', context)
+
+def _clock(hours):
+    return None if hours is None else '{:02d}:{:02d}'.format(*divmod(round(hours * 60), 60))
 
 @login_required
+@reads_from_replica
+def team_analytics(request):
+    if not (request.user.is_manager or request.user.is_staff):
+        return redirect('index')
+
+    start, end = _export_range(request.GET, request.user.tzinfo)
+    users = CustomUser.objects.all() if request.user.is_staff else request.user.managed_users
+    stats = analytics.attendance_statistics(users, start, end)
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'from': start, 'to': end, **stats})
+
+    for row in stats['users']:
+        row['median_arrival_clock'] = _clock(row['median_arrival'])
+    heat_max = max((count for row in stats['heatmap'].values() for count in row), default=0) or 1
+    context = {
+        'stats': stats,
+        'start': start,
+        'end': end,
+        'percentiles': [(p, _clock(hours)) for p, hours in stats['arrival_percentiles'].items()],
+        'heatmap': [(day, [(count, count / heat_max) for count in row]) for day, row in stats['heatmap'].items()],
+        'hours': range(24),
+    }
+    return render(request, 'tracker/team_analytics.html', context)
+
+def _heatmap_range(query, tz):
+    """?from=&to=, by default the year up to today; at most heatmap.MAX_DAYS days."""
+    end = _parse_date(query.get('to')) or timezone.localdate(timezone=tz)
+    start = _parse_date(query.get('from')) or end - timedelta(days=364)
+    start, end = min(start, end), max(start, end)
+    return max(start, end - timedelta(days=heatmap.MAX_DAYS - 1)), end
+
+@login_required
+@reads_from_replica
+def calendar_heatmap(request):
+    if request.GET.get('team'):
+        if not (request.user.is_manager or request.user.is_staff):
+            return redirect('index')
+        users = CustomUser.objects.all() if request.user.is_staff else request.user.managed_users
+        subject = 'Team'
+    else:
+        try:
+            user_id = int(request.GET.get('user', request.user.pk))
+        except ValueError:
+            user_id = None
+        if user_id != request.user.pk and not (user_id is not None and request.user.can_manage(user_id)):
+            return redirect('index')
+        users = CustomUser.objects.filter(pk=user_id)
+        subject = request.user.username if user_id == request.user.pk else None
+
+    start, end = _heatmap_range(request.GET, request.user.tzinfo)
+    hours = heatmap.hours_by_day(users, start, end)
+    total = round(sum(hours.values()), 2)
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'from': start, 'to': end, 'total_hours': total, 'days': [{'day': day, 'hours': worked} for day, worked in hours.items()]})
+
+    # Columns are weeks from Monday, rows are weekdays; days outside the range stay blank.
+    most = max(hours.values(), default=0) or 1
+    first_monday = start - timedelta(days=start.weekday())
+    weeks = [
+        [(day, hours.get(day), (hours.get(day) or 0) / most) for day in (monday + timedelta(days=i) for i in range(7))]
+        for monday in (first_monday + timedelta(weeks=week) for week in range((end - first_monday).days // 7 + 1))
+    ]
+    context = {
+        'subject': subject or users.values_list('username', flat=True).first(),
+        'start': start,
+        'end': end,
+        'total': total,
+        'weekdays': [(name, [week[number] for week in weeks]) for number, name in enumerate(analytics.WEEKDAYS)],
+        'team': bool(request.GET.get('team')),
+    }
+    return render(request, 'tracker/calendar_heatmap.html', context)
+
+@login_required
+def live_attendance(request):
+    if not request.user.is_manager:
+        return redirect('index')
+    return render(request, 'tracker/live_attendance.html')
+
+@login_required
+def attendance_stream(request):
+    if not request.user.is_manager:
+        return JsonResponse({'error': 'Only managers can watch attendance.'}, status=403)
+    return attendance.event_stream_response(attendance.stream(request.user.pk))
+
+def _export_range(query, tz):
+    """The inclusive date range of an export: ?from=&to=, by default the current month."""
+    today = timezone.localdate(timezone=tz)
+    start_of_month = today.replace(day=1)
+    end_of_month = (start_of_month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    start = _parse_date(query.get('from')) or start_of_month
+    end = _parse_date(query.get('to')) or end_of_month
+    return min(start, end), max(start, end)
+
+@login_required
+@reads_from_replica
 def export_monthly_timesheet(request):
     if not request.user.is_staff:
         return redirect('index')
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="monthly_timesheet.csv"'
+    tz = request.user.tzinfo
+    start, end = _export_range(request.GET, tz)
+    lines, filename = exports.timesheet(start, end, tz, detail=request.GET.get('mode') == 'detail')
 
-    writer = csv.writer(response)
-    writer.writerow(['Username', 'Total Hours'])
+    if _parse_flag(request.GET.get('gzip')):
+        response = StreamingHttpResponse(exports.gzip_chunks(lines), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(lines, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
-    now = timezone.now()
-    start_of_month = now.date().replace(day=1)
-    
-    if now.month == 12:
-        start_of_next_month = now.date().replace(year=now.year + 1, month=1, day=1)
+@login_required
+@require_POST
+def request_report(request):
+    if not request.user.is_staff:
+        return redirect('index')
+
+    tz = request.user.tzinfo
+    start, end = _export_range(request.POST, tz)
+    if request.POST.get('mode') == 'payroll':
+        job, _ = jobs.enqueue('payroll', {'from': start.isoformat(), 'to': end.isoformat()}, request.user)
     else:
-        start_of_next_month = now.date().replace(month=now.month + 1, day=1)
-
-    users = CustomUser.objects.all()
-    for user in users:
-        monthly_checkins = CheckInCheckOut.objects.filter(
-            user=user,
-            check_in_time__date__gte=start_of_month,
-            check_in_time__date__lt=start_of_next_month,
-            check_out_time__isnull=False
-        )
-        monthly_hours = sum(((ci.check_out_time - ci.check_in_time) for ci in monthly_checkins), timedelta())
-        writer.writerow([user.username, f"{monthly_hours.total_seconds() / 3600:.2f}"])
+        job, _ = jobs.enqueue('timesheet', {
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'mode': 'detail' if request.POST.get('mode') == 'detail' else 'summary',
+            'gzip': _parse_flag(request.POST.get('gzip')),
+            'time_zone': str(tz),
+        }, request.user)
+    return redirect('report_status', job.pk)
 
-    return response
+@login_required
+def report_status(request, job_id):
+    if not request.user.is_staff:
+        return redirect('index')
+
+    job = get_object_or_404(ReportJob, pk=job_id)
+    status = {
+        'id': job.pk,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+        'download_url': reverse('report_download', args=[job.pk]) if job.status == ReportJob.DONE else None,
+    }
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(status)
+    return render(request, 'tracker/report_status.html', {'job': job, **status})
+
+@login_required
+def report_download(request, job_id):
+    if not request.user.is_staff:
+        return redirect('index')
+
+    job = get_object_or_404(ReportJob, pk=job_id, status=ReportJob.DONE)
+    return FileResponse(job.artifact.open('rb'), as_attachment=True, filename=job.filename, content_type=job.content_type)
 
 @login_required
+@reads_from_replica
 def view_user_timesheet(request, user_id):
     if not request.user.is_manager:
         return redirect('index')
     
     managed_user = get_object_or_404(CustomUser, id=user_id)
-    if managed_user not in request.user.managed_users.all():
+    if not request.user.can_manage(managed_user.id):
         return redirect('team_timesheet')
 
-    checkin_list = CheckInCheckOut.objects.filter(user=managed_user).order_by('-check_in_time')
-    paginator = Paginator(checkin_list, 10)
-
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(CheckInCheckOut.objects.filter(user=managed_user), 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'), with_count=bool(request.GET.get('count')))
 
     context = {
         'managed_user': managed_user,
@@ -144,16 +299,16 @@ def edit_time_entry(request, entry_id):
     if not request.user.is_manager:
         return redirect('index')
 
-    entry = get_object_or_404(CheckInCheckOut, id=entry_id)
+    entry = get_object_or_404(CheckInCheckOut.objects.select_related('user'), id=entry_id)
     managed_user = entry.user
 
-    if managed_user not in request.user.managed_users.all():
+    if not request.user.can_manage(managed_user.id):
         return redirect('team_timesheet')
 
     if request.method == 'POST':
-        old_entry = get_object_or_404(CheckInCheckOut, id=entry_id)
-        old_check_in = old_entry.check_in_time
-        old_check_out = old_entry.check_out_time
+        # Binding the form updates the instance, so keep the stored values first.
+        old_check_in = entry.check_in_time
+        old_check_out = entry.check_out_time
 
         form = TimeEntryForm(request.POST, instance=entry)
         if form.is_valid():
@@ -178,6 +333,21 @@ def edit_time_entry(request, entry_id):
     }
     return render(request, 'tracker/edit_time_entry.html', context)
 
+@login_required
+@require_POST
+def bulk_edit_time_entries(request):
+    if not request.user.is_manager:
+        return JsonResponse({'error': 'Only managers can edit time entries.'}, status=403)
+
+    data = _request_data(request)
+    if data is None or request.content_type != 'application/json':
+        return JsonResponse({'error': 'Expected a JSON object with a "changes" list.'}, status=400)
+    try:
+        result = bulk_edit.bulk_edit_entries(request.user, data.get('changes'), settings.BULK_EDIT_MAX_CHANGES)
+    except bulk_edit.BulkEditError as error:
+        return JsonResponse({'error': str(error), 'errors': error.errors}, status=400)
+    return JsonResponse(result)
+
 @login_required
 def add_time_entry(request):
     if not request.user.is_staff:
@@ -191,4 +361,53 @@ def add_time_entry(request):
     else:
         form = NewTimeEntryForm()
 
-    return render(request, 'tracker/add_time_entry.html', {'form': form})
\ No newline at end of file
+    return render(request, 'tracker/add_time_entry.html', {'form': form})
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+def _kiosk_scan_response(outcome):
+    result, replayed = outcome
+    response = JsonResponse(result)
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+@csrf_exempt
+@require_POST
+def kiosk_scan(request):
+    if not kiosk.is_authenticated(request):
+        return JsonResponse({'error': 'Invalid kiosk key.'}, status=403)
+
+    try:
+        return _kiosk_scan_response(kiosk.scan(request, _request_data(request)))
+    except kiosk.ScanError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+
+
+@csrf_exempt
+@require_POST
+def kiosk_sync(request):
+    if not kiosk.is_authenticated(request):
+        return JsonResponse({'error': 'Invalid kiosk key.'}, status=403)
+
+    data = _request_data(request) if request.content_type == 'application/json' else None
+    events = data.get('events') if data is not None else None
+    if not isinstance(events, list):
+        return JsonResponse({'error': 'Expected a JSON object with an "events" list.'}, status=400)
+
+    result = kiosk.ingest_scan_events(events, chunk_size=settings.KIOSK_SYNC_CHUNK_SIZE)
+    return JsonResponse(result.as_dict())
+
+def prometheus_metrics(request):
+    token = settings.METRICS_TOKEN
+    scraper = bool(token) and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+    if not (scraper or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')